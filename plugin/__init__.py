@@ -1,20 +1,101 @@
 from __future__ import annotations
 
+import sublime
+
+from .commands import GoplsAnalyzeRpcTraceCommand
+from .commands import GoplsBuildPgoBinaryCommand
+from .commands import GoplsCancelInstallCommand
+from .commands import GoplsCancelPrewarmCommand
+from .commands import GoplsCancelTestsCommand
+from .commands import GoplsCaptureHeapSnapshotCommand
+from .commands import GoplsClearProfileAnnotationsCommand
+from .commands import GoplsCollectCpuProfileCommand
+from .commands import GoplsDiffHeapSnapshotsCommand
+from .commands import GoplsHibernateCommand
+from .commands import GoplsHibernateSessionCommand
+from .commands import GoplsManageCachesCommand
+from .commands import GoplsPinBenchmarkBaselineCommand
+from .commands import GoplsPrepareOfflineBundleCommand
+from .commands import GoplsProfilePackageCommand
+from .commands import GoplsReplaceContentCommand
+from .commands import GoplsRestartSharedDaemonCommand
+from .commands import GoplsRunModuleTestsCommand
+from .commands import GoplsSharedDaemonStatusCommand
+from .commands import GoplsShowMetricsCommand
 from .commands import GoplsStartDebuggingCommand
+from .commands import GoplsStartupTimingsCommand
+from .commands import GoplsTestDurationsCommand
+from .commands import GoplsTogglePgoBinaryCommand
+from .commands import GoplsToggleRpcTraceCommand
+from .commands import GoplsToggleTestWatchCommand
+from .commands import GoplsWorkspaceReportCommand
+from .daemon import stop_supervisor
+from .hibernation import GoplsHibernationListener
+from .hibernation import stop_monitor
+from .metrics import GoplsMetricsDashboardListener
+from .pgo import GoplsPgoProfileListener
 from .plugin import Gopls
+from .prewarm import cancel_prewarm
+from .profiling import GoplsProfileAnnotationListener
+from .startup import load_span
+from .toolchain import invalidate
+from .watch import GoplsTestWatchListener
+from .watchdog import stop_watchdog
 
 __all__ = (
     # ST: Core
     "plugin_loaded",
     "plugin_unloaded",
     # ST: commands
+    "GoplsAnalyzeRpcTraceCommand",
+    "GoplsBuildPgoBinaryCommand",
+    "GoplsCancelInstallCommand",
+    "GoplsCancelPrewarmCommand",
+    "GoplsCancelTestsCommand",
+    "GoplsCaptureHeapSnapshotCommand",
+    "GoplsClearProfileAnnotationsCommand",
+    "GoplsCollectCpuProfileCommand",
+    "GoplsDiffHeapSnapshotsCommand",
+    "GoplsHibernateCommand",
+    "GoplsHibernateSessionCommand",
+    "GoplsManageCachesCommand",
+    "GoplsPinBenchmarkBaselineCommand",
+    "GoplsPrepareOfflineBundleCommand",
+    "GoplsProfilePackageCommand",
+    "GoplsReplaceContentCommand",
+    "GoplsRestartSharedDaemonCommand",
+    "GoplsRunModuleTestsCommand",
+    "GoplsSharedDaemonStatusCommand",
+    "GoplsShowMetricsCommand",
     "GoplsStartDebuggingCommand",
+    "GoplsStartupTimingsCommand",
+    "GoplsTestDurationsCommand",
+    "GoplsTogglePgoBinaryCommand",
+    "GoplsToggleRpcTraceCommand",
+    "GoplsToggleTestWatchCommand",
+    "GoplsWorkspaceReportCommand",
+    # ST: listeners
+    "GoplsHibernationListener",
+    "GoplsMetricsDashboardListener",
+    "GoplsPgoProfileListener",
+    "GoplsProfileAnnotationListener",
+    "GoplsTestWatchListener",
 )
 
 
+SETTINGS_LISTENER_KEY = "LSP-gopls.toolchain"
+
+
 def plugin_loaded():
-    Gopls.register()
+    with load_span("register"):
+        Gopls.register()
+    sublime.load_settings("LSP-gopls.sublime-settings").add_on_change(SETTINGS_LISTENER_KEY, invalidate)
 
 
 def plugin_unloaded():
+    sublime.load_settings("LSP-gopls.sublime-settings").clear_on_change(SETTINGS_LISTENER_KEY)
+    stop_watchdog()
+    stop_supervisor()
+    stop_monitor()
+    cancel_prewarm()
     Gopls.unregister()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from pathlib import Path
+import contextlib
+import hashlib
+import json
+import os
+import time
+
+from .types import GoplsArtifactRecord
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def artifact_key(gopls_version: str, toolchain: str, goos: str, goarch: str) -> str:
+    """
+    Returns the cache key of a gopls binary. `toolchain` is the GOVERSION of
+    the Go toolchain it was built with, so a toolchain upgrade yields a
+    different key.
+    """
+    identity = "\0".join((gopls_version, toolchain.strip(), goos, goarch))
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+def _copy_and_hash(src: Path, dest: Path) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with src.open("rb") as fin, dest.open("wb") as fout:
+        while chunk := fin.read(CHUNK_SIZE):
+            digest.update(chunk)
+            fout.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class ArtifactCache:
+    """
+    A content-addressed cache of built gopls binaries:
+
+        objects/<sha256>   the binaries, named after their content hash
+        index/<key>.json   maps an `artifact_key` to the hash of its binary
+
+    Every restore verifies the hash of the copied binary, so a truncated or
+    tampered object is dropped instead of being installed. Lookups fall back to
+    the read-only `seeds` directories, which use the same layout and let a team
+    share a pre-populated cache.
+    """
+
+    def __init__(self, root: str | Path, seeds: list[str] | None = None) -> None:
+        self.root = Path(root)
+        self.seeds = [Path(seed) for seed in seeds or [] if seed]
+
+    def _object_path(self, root: Path, sha256: str) -> Path:
+        return root / "objects" / sha256
+
+    def _index_path(self, root: Path, key: str) -> Path:
+        return root / "index" / f"{key}.json"
+
+    def _read_record(self, root: Path, key: str) -> GoplsArtifactRecord | None:
+        try:
+            return json.loads(self._index_path(root, key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def restore(self, key: str, dest: Path) -> bool:
+        """
+        Copies the binary cached under `key` to `dest` and returns whether it
+        was found and passed the integrity check.
+        """
+        for root in (self.root, *self.seeds):
+            record = self._read_record(root, key)
+            if record is None:
+                continue
+            try:
+                obj = self._object_path(root, record["sha256"])
+                expected = (record["sha256"], record["size"])
+                origin = (record["gopls"], record["toolchain"], record["goos"], record["goarch"])
+            except (KeyError, TypeError):
+                print(f"LSP-gopls: dropping malformed cache record {self._index_path(root, key)}")
+                if root == self.root:
+                    with contextlib.suppress(OSError):
+                        self._index_path(root, key).unlink()
+                continue
+            tmp = dest.with_name(f".{dest.name}.{os.getpid()}")
+            try:
+                sha256, size = _copy_and_hash(obj, tmp)
+            except OSError:
+                continue
+            if (sha256, size) != expected:
+                print(f"LSP-gopls: dropping corrupt cached gopls binary {obj}")
+                with contextlib.suppress(OSError):
+                    tmp.unlink()
+                if root == self.root:
+                    with contextlib.suppress(OSError):
+                        obj.unlink()
+                continue
+            os.chmod(tmp, 0o755)
+            os.replace(tmp, dest)
+            if root != self.root:
+                self.add(key, dest, *origin)
+            return True
+        return False
+
+    def add(self, key: str, binary: Path, gopls_version: str, toolchain: str, goos: str, goarch: str) -> None:
+        """
+        Stores `binary` under `key`. Both the object and its index entry are
+        written atomically, so concurrent readers never see partial entries.
+        """
+        objects = self.root / "objects"
+        objects.mkdir(parents=True, exist_ok=True)
+        tmp = objects / f".tmp-{os.getpid()}"
+        sha256, size = _copy_and_hash(binary, tmp)
+        os.replace(tmp, self._object_path(self.root, sha256))
+
+        index = self._index_path(self.root, key)
+        index.parent.mkdir(parents=True, exist_ok=True)
+        record = GoplsArtifactRecord(
+            gopls=gopls_version,
+            toolchain=toolchain.strip(),
+            goos=goos,
+            goarch=goarch,
+            sha256=sha256,
+            size=size,
+            created=time.time(),
+        )
+        tmp_index = index.with_name(f".{index.name}.{os.getpid()}")
+        tmp_index.write_text(json.dumps(record, indent=2))
+        os.replace(tmp_index, index)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+import hashlib
+import json
+import math
+import re
+import statistics
+import time
+
+from .types import GoBenchmarkRun
+
+RE_BENCHMARK = re.compile(
+    r"^(?P<name>Benchmark\S*?)(?:-\d+)?\s+\d+\s+(?P<ns>[\d.]+) ns/op"
+    r"(?:.*?\s(?P<bytes>[\d.]+) B/op)?(?:.*?\s(?P<allocs>[\d.]+) allocs/op)?"
+)
+METRICS = ("ns/op", "B/op", "allocs/op")
+HISTORY_LIMIT = 20
+DEFAULT_ALPHA = 0.05
+
+
+def parse_benchmark_output(output: str) -> dict[str, dict[str, list[float]]]:
+    """
+    Collects the samples of every benchmark in the output of `go test -bench`,
+    keyed by benchmark name without its GOMAXPROCS suffix and then by metric.
+    """
+    results: dict[str, dict[str, list[float]]] = {}
+    for line in output.splitlines():
+        matches = RE_BENCHMARK.match(line.strip())
+        if matches is None:
+            continue
+        samples = results.setdefault(matches.group("name"), {metric: [] for metric in METRICS})
+        for metric, group in zip(METRICS, ("ns", "bytes", "allocs")):
+            if (value := matches.group(group)) is not None:
+                samples[metric].append(float(value))
+    return results
+
+
+@lru_cache(maxsize=None)
+def _u_distribution(n: int, m: int) -> tuple[int, ...]:
+    """
+    Returns how many orderings of `n` + `m` distinct samples yield each value
+    of the Mann-Whitney U statistic.
+    """
+    if n == 0 or m == 0:
+        return (1,)
+    with_n = _u_distribution(n - 1, m)
+    with_m = _u_distribution(n, m - 1)
+    counts = [0] * (n * m + 1)
+    for u, count in enumerate(with_n):
+        counts[u + m] += count
+    for u, count in enumerate(with_m):
+        counts[u] += count
+    return tuple(counts)
+
+
+def mann_whitney_u_test(xs: list[float], ys: list[float]) -> float:
+    """
+    Returns the two-sided p-value of the Mann-Whitney U test, the test that
+    benchstat uses. The exact distribution is used for small samples without
+    ties and the normal approximation with tie correction otherwise.
+    """
+    n, m = len(xs), len(ys)
+    if n == 0 or m == 0:
+        return 1.0
+    combined = sorted([(x, 0) for x in xs] + [(y, 1) for y in ys])
+    ranks = [0.0] * len(combined)
+    ties = []
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        if j > i:
+            ties.append(j - i + 1)
+        i = j + 1
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum - n * (n + 1) / 2
+    u = min(u, n * m - u)
+
+    if not ties and n * m <= 400:
+        counts = _u_distribution(n, m)
+        tail = sum(counts[: int(u) + 1])
+        return min(1.0, 2 * tail / math.comb(n + m, n))
+
+    total = n + m
+    tie_term = sum(t ** 3 - t for t in ties) / (total * (total - 1))
+    sigma = math.sqrt(n * m / 12 * ((total + 1) - tie_term))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u - n * m / 2) - 0.5) / sigma
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def _summary(samples: list[float]) -> str:
+    center = statistics.median(samples)
+    spread = (max(samples) - min(samples)) / 2 / center * 100 if center else 0.0
+    return f"{center:,.4g} ±{spread:.0f}%"
+
+
+class BenchmarkHistory:
+    """
+    The benchmark runs of one package, stored as JSON in plugin storage. The
+    latest run is compared against the pinned baseline, if there is one, and
+    against the run before it otherwise.
+    """
+
+    def __init__(self, storage_path: str | Path, package: str) -> None:
+        name = hashlib.sha256(package.encode("utf-8")).hexdigest()[:16]
+        self.path = Path(storage_path, "benchmarks", f"{name}.json")
+        self.package = package
+        self.runs: list[GoBenchmarkRun] = []
+        self.baseline: GoBenchmarkRun | None = None
+        try:
+            data = json.loads(self.path.read_text())
+            self.runs = data.get("runs", [])
+            self.baseline = data.get("baseline")
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def all(cls, storage_path: str | Path) -> list[BenchmarkHistory]:
+        histories = []
+        for path in sorted(Path(storage_path, "benchmarks").glob("*.json")):
+            try:
+                package = json.loads(path.read_text())["package"]
+            except (OSError, ValueError, KeyError):
+                continue
+            histories.append(cls(storage_path, package))
+        return histories
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"package": self.package, "runs": self.runs[-HISTORY_LIMIT:], "baseline": self.baseline}
+        self.path.write_text(json.dumps(data))
+
+    def add_run(self, results: dict[str, dict[str, list[float]]]) -> GoBenchmarkRun:
+        run = GoBenchmarkRun(time=time.time(), results=results)
+        self.runs.append(run)
+        self.save()
+        return run
+
+    def pin(self) -> bool:
+        if not self.runs:
+            return False
+        self.baseline = self.runs[-1]
+        self.save()
+        return True
+
+    def unpin(self) -> None:
+        self.baseline = None
+        self.save()
+
+    def reference_for(self, run: GoBenchmarkRun) -> GoBenchmarkRun | None:
+        if self.baseline is not None:
+            return self.baseline
+        previous = [r for r in self.runs if r["time"] < run["time"]]
+        return previous[-1] if previous else None
+
+
+def compare_runs(
+    old: GoBenchmarkRun | None,
+    new: GoBenchmarkRun,
+    alpha: float = DEFAULT_ALPHA,
+) -> tuple[str, list[str]]:
+    """
+    Renders a benchstat-like table of `new` against `old` and returns it along
+    with the names of the benchmarks that got significantly worse.
+    """
+    lines = []
+    regressions = []
+    width = max((len(name) for name in new["results"]), default=4) + 2
+    for metric in METRICS:
+        rows = []
+        for name, metrics in sorted(new["results"].items()):
+            samples = metrics.get(metric) or []
+            if not samples:
+                continue
+            old_samples = (old["results"].get(name, {}).get(metric) or []) if old else []
+            if not old_samples:
+                rows.append(f"{name:<{width}}{'':<22}{_summary(samples):<22}")
+                continue
+            old_center = statistics.median(old_samples)
+            new_center = statistics.median(samples)
+            p = mann_whitney_u_test(old_samples, samples)
+            stats = f"(p={p:.3f} n={len(old_samples)}+{len(samples)})"
+            if p >= alpha or old_center == new_center:
+                delta = f"~ {stats}"
+            else:
+                change = (new_center - old_center) / old_center * 100 if old_center else math.inf
+                delta = f"{change:+.2f}% {stats}"
+                if change > 0:
+                    delta += "  REGRESSION"
+                    if name not in regressions:
+                        regressions.append(name)
+            rows.append(f"{name:<{width}}{_summary(old_samples):<22}{_summary(samples):<22}{delta}")
+        if rows:
+            lines.append(f"{'name':<{width}}{'old ' + metric:<22}{'new ' + metric:<22}delta")
+            lines.extend(rows)
+            lines.append("")
+    return "\n".join(lines), regressions
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator
+import contextlib
+import os
+import shutil
+import stat
+import threading
+import time
+
+from .types import GoCacheUsage
+
+MEGABYTE = 1024 * 1024
+# A measured size younger than this lets `trim` skip walking the caches while they are within budget.
+MEASUREMENT_TTL_SECONDS = 6 * 60 * 60
+
+# The last measured total size of the caches of a (GOCACHE, GOMODCACHE) pair and when it was taken.
+_measurements: dict[tuple[str, str], tuple[float, int]] = {}
+_measurements_lock = threading.Lock()
+
+
+class CacheEntry:
+    __slots__ = ("path", "size", "mtime", "is_dir", "files")
+
+    def __init__(self, path: str, size: int, mtime: float, is_dir: bool, files: list[str] | None = None) -> None:
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.is_dir = is_dir
+        # The files a download cache entry consists of, which are removed together.
+        self.files = files
+
+
+def _walk_files(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except OSError:
+            continue
+
+
+def _tree_size(root: str) -> tuple[int, float]:
+    size, mtime = 0, 0.0
+    for entry in _walk_files(root):
+        with contextlib.suppress(OSError):
+            st = entry.stat(follow_symlinks=False)
+            size += st.st_size
+            mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+
+def _make_writable(func, path, _) -> None:
+    # The module cache is read-only by design, so unlock entries before removing them.
+    with contextlib.suppress(OSError):
+        os.chmod(os.path.dirname(path), stat.S_IRWXU)
+        os.chmod(path, stat.S_IRWXU)
+        func(path)
+
+
+class CacheManager:
+    """
+    Keeps the Go build and module caches in plugin storage within a size
+    budget. Entries are evicted least recently used first: build cache files
+    by their modification time, which Go refreshes on use, then extracted
+    module directories by their age, and finally the downloaded files of a
+    module version whose extracted directory is gone. Downloads are evicted
+    last, since modules can be extracted again from them without network.
+    """
+
+    def __init__(self, gocache: str | Path, gomodcache: str | Path) -> None:
+        self.gocache = str(gocache)
+        self.gomodcache = str(gomodcache)
+
+    def _build_entries(self) -> list[CacheEntry]:
+        entries = []
+        for entry in _walk_files(self.gocache):
+            if os.path.dirname(entry.path) == self.gocache:
+                # README and trim bookkeeping of `go` itself, not cache entries.
+                continue
+            with contextlib.suppress(OSError):
+                st = entry.stat(follow_symlinks=False)
+                entries.append(CacheEntry(entry.path, st.st_size, st.st_mtime, False))
+        return entries
+
+    def _module_entries(self) -> list[CacheEntry]:
+        """
+        Returns the extracted module directories, named `<module>@<version>`.
+        """
+        modules = []
+        stack = [self.gomodcache]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if not entry.is_dir(follow_symlinks=False) or entry.path == self._download_root:
+                            continue
+                        if "@" in entry.name:
+                            size, mtime = _tree_size(entry.path)
+                            modules.append(CacheEntry(entry.path, size, mtime, True))
+                        else:
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return modules
+
+    def _download_entries(self) -> list[CacheEntry]:
+        """
+        Returns the downloaded module versions, which consist of the files
+        `<module>/@v/<version>.{info,mod,zip,ziphash,...}` in the download
+        cache. The checksum database and VCS checkouts next to them are not
+        accounted for.
+        """
+        versions: dict[str, CacheEntry] = {}
+        for entry in _walk_files(os.path.join(self._download_root, "download")):
+            directory = os.path.dirname(entry.path)
+            if os.path.basename(directory) != "@v" or entry.name == "list" or entry.name.startswith("list."):
+                continue
+            key = os.path.join(directory, os.path.splitext(entry.name)[0])
+            with contextlib.suppress(OSError):
+                st = entry.stat(follow_symlinks=False)
+                version = versions.setdefault(key, CacheEntry(key, 0, 0.0, False, []))
+                version.size += st.st_size
+                version.mtime = max(version.mtime, st.st_mtime)
+                version.files.append(entry.path)  # type: ignore
+        return list(versions.values())
+
+    def _extracted_path(self, download: CacheEntry) -> str:
+        directory, version = os.path.split(download.path)
+        module = os.path.relpath(os.path.dirname(directory), os.path.join(self._download_root, "download"))
+        return os.path.join(self.gomodcache, f"{module}@{version}")
+
+    @property
+    def _download_root(self) -> str:
+        return os.path.join(self.gomodcache, "cache")
+
+    @property
+    def _measurement_key(self) -> tuple[str, str]:
+        return (self.gocache, self.gomodcache)
+
+    def _remember(self, total: int) -> None:
+        with _measurements_lock:
+            _measurements[self._measurement_key] = (time.time(), total)
+
+    def _recent_total(self) -> int | None:
+        with _measurements_lock:
+            measured = _measurements.get(self._measurement_key)
+        if measured is None or time.time() - measured[0] > MEASUREMENT_TTL_SECONDS:
+            return None
+        return measured[1]
+
+    def usage(self) -> GoCacheUsage:
+        build = sum(entry.size for entry in self._build_entries())
+        modules = sum(entry.size for entry in self._module_entries() + self._download_entries())
+        self._remember(build + modules)
+        return GoCacheUsage(
+            gocache=self.gocache,
+            gomodcache=self.gomodcache,
+            build_bytes=build,
+            module_bytes=modules,
+        )
+
+    def _evict(self, entry: CacheEntry) -> bool:
+        if entry.files is not None:
+            if os.path.exists(self._extracted_path(entry)):
+                # Still backs its extracted module, which could not be removed.
+                return False
+            for path in entry.files:
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+            return not any(os.path.exists(path) for path in entry.files)
+        if entry.is_dir:
+            shutil.rmtree(entry.path, onerror=_make_writable)
+        else:
+            with contextlib.suppress(OSError):
+                os.unlink(entry.path)
+        return not os.path.exists(entry.path)
+
+    def trim(self, limit_bytes: int) -> int:
+        """
+        Evicts cache entries until the caches fit into `limit_bytes` and
+        returns the number of bytes freed. The caches are not walked again
+        while a recent measurement says they fit.
+        """
+        if (recent := self._recent_total()) is not None and recent <= limit_bytes:
+            return 0
+        build = self._build_entries()
+        modules = self._module_entries()
+        downloads = self._download_entries()
+        total = sum(entry.size for entry in build + modules + downloads)
+        if total <= limit_bytes:
+            self._remember(total)
+            return 0
+
+        # Build outputs are the cheapest to recreate, so they go before extracted modules and downloads.
+        candidates = [
+            *sorted(build, key=lambda entry: entry.mtime),
+            *sorted(modules, key=lambda entry: entry.mtime),
+            *sorted(downloads, key=lambda entry: entry.mtime),
+        ]
+        freed = 0
+        for entry in candidates:
+            if total - freed <= limit_bytes:
+                break
+            if self._evict(entry):
+                freed += entry.size
+        self._remember(total - freed)
+        return freed
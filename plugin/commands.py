@@ -1,10 +1,72 @@
 from __future__ import annotations
 
+import json
+import os
+import threading
+import time
+
 from LSP.plugin import LspTextCommand
 from LSP.plugin import Request
 import sublime
+import sublime_plugin
 
+from .benchmarks import BenchmarkHistory
+from .caches import CacheManager
+from .caches import MEGABYTE
+from .constants import GOPLS_BASE_URL
+from .constants import SESSION_NAME
+from .daemon import daemon_pids
+from .daemon import daemon_status
+from .daemon import restart_sessions
+from .daemon import stop_daemons
+from .daemon import supervised_binary
+from .debugserver import request_debug_url
+from .durations import TestDurations
+from .durations import find_module
+from .durations import import_path_of
+from .heap import HEAP_DIFF_PANEL_NAME
+from .heap import HeapSnapshots
+from .heap import diff_snapshots
+from .hibernation import hibernate
+from .installer import InstallError
+from .installer import InstallProgress
+from .installer import active_install
+from .installer import cancel_active_install
+from .metrics import open_dashboard
+from .offline import ModuleBundle
+from .panel import OutputPanel
+from .pgo import CpuProfiles
+from .pgo import collected
+from .pgo import is_pgo_enabled
+from .pgo import toggle_pgo
+from .plugin import Gopls
+from .prewarm import cancel_prewarm
+from .prewarm import prewarmer
+from .profiling import clear_hotspots
+from .profiling import profile_package
+from .rpctrace import analyze_trace
+from .rpctrace import list_traces
+from .rpctrace import render_trace_report
+from .rpctrace import toggle_trace
+from .startup import read_records
+from .startup import render_startup_summary
+from .testing import active_test_runs
+from .testing import discover_modules
+from .testing import run_module_tests
+from .toolchain import environment
 from .types import GoplsStartDebuggingResponse
+from .utils import get_plugin_settings
+from .version import VERSION
+from .watch import is_watching
+from .watch import toggle_watch
+from .workspace import WorkspaceScans
+from .workspace import tune_folder
+
+RPC_TRACE_PANEL_NAME = "gopls_rpc_trace"
+SHARED_DAEMON_PANEL_NAME = "gopls_shared_daemon"
+STARTUP_TIMINGS_PANEL_NAME = "gopls_startup_timings"
+TEST_DURATIONS_PANEL_NAME = "gopls_test_durations"
+WORKSPACE_REPORT_PANEL_NAME = "gopls_workspace_report"
 
 
 class GoplsStartDebuggingCommand(LspTextCommand):
@@ -43,3 +105,582 @@ class GoplsStartDebuggingCommand(LspTextCommand):
                 port="\t{url}\n".join(response["URLs"])
             )
         )
+
+
+class GoplsCancelInstallCommand(sublime_plugin.WindowCommand):
+    """
+    Cancels the managed gopls installation that is currently running, if any.
+    The session that was waiting on the installation fails to start and can be
+    restarted once the problem has been resolved.
+    """
+
+    def is_enabled(self) -> bool:
+        return active_install() is not None
+
+    def run(self) -> None:
+        if cancel_active_install():
+            self.window.status_message("LSP-gopls: gopls installation cancelled")
+
+
+class GoplsPrepareOfflineBundleCommand(sublime_plugin.WindowCommand):
+    """
+    Downloads gopls and all of its module dependencies into a directory that
+    can be used with the `installProxy` setting on machines without network
+    access. The bundle records a checksum manifest that is verified before
+    every offline install.
+    """
+
+    def run(self, directory: str | None = None) -> None:
+        if directory is None:
+            self.window.show_input_panel("Offline bundle directory:", "", lambda d: self.run(d), None, None)
+            return
+        if not directory:
+            return
+        threading.Thread(target=self.prepare, args=(directory,), daemon=True).start()
+
+    def prepare(self, directory: str) -> None:
+        bundle = ModuleBundle(directory)
+        progress = InstallProgress(self.window, f"LSP-gopls: preparing offline bundle for gopls v{VERSION}")
+        url = GOPLS_BASE_URL.format(tag=VERSION)
+        timeout = get_plugin_settings().get("installTimeout") or None
+        try:
+            count = bundle.prepare(url, Gopls._go_runtime_env_vars(), progress, timeout=timeout)
+        except (InstallError, OSError) as ex:
+            progress.finish(str(ex).splitlines()[0], show_panel=True)
+            return
+        progress.finish(f"bundled {count} module files in {bundle.root}")
+
+
+class GoplsManageCachesCommand(sublime_plugin.WindowCommand):
+    """
+    Reports the disk usage of the Go build and module caches used by the
+    managed gopls installation, and offers to trim them down to the
+    `cacheSizeLimit` budget.
+    """
+
+    def run(self) -> None:
+        threading.Thread(target=self.report, daemon=True).start()
+
+    def report(self) -> None:
+        settings = get_plugin_settings()
+        env_vars = Gopls._go_runtime_env_vars(settings)
+        usage = CacheManager(env_vars["GOCACHE"], env_vars["GOMODCACHE"]).usage()
+        limit = settings.get("cacheSizeLimit", 0)
+        shared = settings.get("shareGoCaches", False)
+        message = "\n".join((
+            f"Build cache: {usage['build_bytes'] // MEGABYTE} MB in {usage['gocache']}",
+            f"Module cache: {usage['module_bytes'] // MEGABYTE} MB in {usage['gomodcache']}",
+            f"Budget: {f'{limit} MB' if limit else 'unlimited'}{' (shared caches are not trimmed)' if shared else ''}",
+        ))
+        if not limit or shared:
+            sublime.message_dialog(message)
+            return
+        if sublime.ok_cancel_dialog(message, "Trim Now"):
+            freed = Gopls.trim_caches(settings)
+            self.window.status_message(f"LSP-gopls: freed {freed // MEGABYTE} MB")
+
+
+class GoplsPinBenchmarkBaselineCommand(sublime_plugin.WindowCommand):
+    """
+    Pins the latest benchmark run of a package as the baseline that later runs
+    are compared against, or unpins it again so runs are compared against
+    their predecessor.
+    """
+
+    def run(self) -> None:
+        histories = [h for h in BenchmarkHistory.all(Gopls.plugin_storage_path) if h.runs]
+        if not histories:
+            sublime.message_dialog("No benchmark runs recorded yet")
+            return
+
+        items = [
+            sublime.QuickPanelItem(
+                history.package,
+                annotation="pinned" if history.baseline is not None else "",
+                details=f"{len(history.runs)} run(s)",
+            )
+            for history in histories
+        ]
+
+        def on_select(index: int) -> None:
+            if index < 0:
+                return
+            history = histories[index]
+            if history.baseline is not None:
+                history.unpin()
+                self.window.status_message(f"LSP-gopls: unpinned benchmark baseline of {history.package}")
+            elif history.pin():
+                self.window.status_message(f"LSP-gopls: pinned latest benchmark run of {history.package}")
+
+        self.window.show_quick_panel(items, on_select, placeholder="Pin or unpin the benchmark baseline of")
+
+
+class GoplsCancelTestsCommand(sublime_plugin.WindowCommand):
+    """
+    Cancels all tests that are currently run by the built-in test runner.
+    """
+
+    def is_enabled(self) -> bool:
+        return bool(active_test_runs())
+
+    def run(self) -> None:
+        for run in active_test_runs():
+            run.cancel()
+
+
+class GoplsTestDurationsCommand(sublime_plugin.WindowCommand):
+    """
+    Shows the slowest tests and the tests that got slower, as recorded by the
+    built-in test runner, for the package of the active view or, if
+    `recursive` is set, for its whole module.
+    """
+
+    def is_enabled(self, recursive: bool = False) -> bool:
+        view = self.window.active_view()
+        return bool(view and view.file_name())
+
+    def run(self, recursive: bool = False) -> None:
+        view = self.window.active_view()
+        if not view or not (file_name := view.file_name()):
+            return
+        directory = os.path.dirname(file_name)
+        if recursive:
+            module = find_module(directory)
+            scope = module[1] if module else None
+        else:
+            scope = import_path_of(directory)
+        if scope is None:
+            sublime.message_dialog("The active file is not part of a Go module")
+            return
+        panel = OutputPanel(self.window, TEST_DURATIONS_PANEL_NAME)
+        panel.append(TestDurations(Gopls.plugin_storage_path).report(scope, recursive))
+        panel.show()
+
+
+class GoplsToggleTestWatchCommand(sublime_plugin.WindowCommand):
+    """
+    Toggles watch mode for the window. While it is on, saving a Go file runs
+    the tests of every package that depends on it.
+    """
+
+    def is_checked(self) -> bool:
+        return is_watching(self.window)
+
+    def run(self) -> None:
+        watching = toggle_watch(self.window, str(Gopls.plugin_storage_path))
+        self.window.status_message(f"LSP-gopls: test watch mode {'on' if watching else 'off'}")
+
+
+class GoplsRunModuleTestsCommand(sublime_plugin.WindowCommand):
+    """
+    Runs all tests of the module of the active view or, if `workspace` is set,
+    of every module in the folders of the window, and shows the aggregated
+    results as a tree.
+    """
+
+    def run(self, workspace: bool = False) -> None:
+        if workspace:
+            roots = discover_modules(self.window.folders())
+        else:
+            view = self.window.active_view()
+            file_name = view.file_name() if view else None
+            module = find_module(os.path.dirname(file_name)) if file_name else None
+            roots = [module[0]] if module else []
+        if not roots:
+            sublime.message_dialog("No Go module found")
+            return
+        run_module_tests(self.window, get_plugin_settings(), roots, str(Gopls.plugin_storage_path))
+
+
+class GoplsReplaceContentCommand(sublime_plugin.TextCommand):
+    """
+    Replaces the content of a read-only view, like the generated reports in
+    output panels. Internal, used by `OutputPanel` and the metrics dashboard.
+    """
+
+    def run(self, edit: sublime.Edit, characters: str) -> None:
+        self.view.set_read_only(False)
+        self.view.replace(edit, sublime.Region(0, self.view.size()), characters)
+        self.view.set_read_only(True)
+
+
+class GoplsProfilePackageCommand(sublime_plugin.WindowCommand):
+    """
+    Captures CPU and memory profiles of the benchmarks or, if `benchmarks` is
+    not set, the tests of the package of the active view and annotates the
+    hottest lines.
+    """
+
+    def is_enabled(self, benchmarks: bool = True) -> bool:
+        view = self.window.active_view()
+        return bool(view and view.file_name())
+
+    def run(self, benchmarks: bool = True) -> None:
+        view = self.window.active_view()
+        if not view or not (file_name := view.file_name()):
+            return
+        directory = os.path.dirname(file_name)
+        run, bench = ("^$", ".") if benchmarks else (".", None)
+        profile_package(self.window, get_plugin_settings(), directory, run, bench, str(Gopls.plugin_storage_path))
+
+
+class GoplsClearProfileAnnotationsCommand(sublime_plugin.WindowCommand):
+    """
+    Removes the CPU and memory hotspot annotations of the last package profile
+    from all views.
+    """
+
+    def run(self) -> None:
+        clear_hotspots()
+
+
+class GoplsShowMetricsCommand(LspTextCommand):
+    """
+    Starts the debug server of gopls and opens a dashboard with the trends of
+    its memory usage and goroutine count, sampled in the background for as
+    long as the dashboard is open.
+    """
+
+    def run(self, _: sublime.Edit) -> None:
+        session = self.session_by_name(self.session_name)
+        window = self.view.window()
+        if session is None or window is None:
+            return
+        interval = session.config.settings.get("metricsInterval") or 2
+        capacity = session.config.settings.get("metricsHistory") or 600
+
+        def on_url(url: str | None) -> None:
+            if url is None:
+                sublime.message_dialog("No debug session started")
+                return
+            open_dashboard(window, url, interval, capacity)
+
+        request_debug_url(session, lambda url: sublime.set_timeout(lambda: on_url(url)))
+
+
+class GoplsCaptureHeapSnapshotCommand(LspTextCommand):
+    """
+    Saves the current heap profile of gopls from its debug server into plugin
+    storage, to be compared with other snapshots or attached to bug reports.
+    """
+
+    def run(self, _: sublime.Edit) -> None:
+        session = self.session_by_name(self.session_name)
+        window = self.view.window()
+        if session is None or window is None:
+            return
+        snapshots = HeapSnapshots(Gopls.plugin_storage_path)
+
+        def capture(url: str | None) -> None:
+            if url is None:
+                sublime.message_dialog("No debug session started")
+                return
+            try:
+                snapshot = snapshots.capture(url)
+            except OSError as ex:
+                sublime.message_dialog(f"Could not capture a heap snapshot: {ex}")
+                return
+            window.status_message(
+                f"LSP-gopls: heap snapshot with {snapshot['heap_inuse'] / MEGABYTE:,.1f} MB in use "
+                f"saved to {snapshot['path']}"
+            )
+
+        request_debug_url(session, lambda url: threading.Thread(target=capture, args=(url,), daemon=True).start())
+
+
+class GoplsDiffHeapSnapshotsCommand(sublime_plugin.WindowCommand):
+    """
+    Compares two heap snapshots of gopls and lists the allocation sites whose
+    in-use memory grew the most from the first to the second.
+    """
+
+    def run(self) -> None:
+        snapshots = HeapSnapshots(Gopls.plugin_storage_path).list()
+        if len(snapshots) < 2:
+            sublime.message_dialog("Capture at least two heap snapshots to compare them")
+            return
+        items = [
+            sublime.QuickPanelItem(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["time"])),
+                annotation=f"{snapshot['heap_inuse'] / MEGABYTE:,.1f} MB in use",
+                details=snapshot["path"],
+            )
+            for snapshot in snapshots
+        ]
+
+        def on_base(base: int) -> None:
+            if base < 0:
+                return
+            sublime.set_timeout(
+                lambda: self.window.show_quick_panel(
+                    items,
+                    lambda current: on_current(base, current),
+                    selected_index=len(items) - 1,
+                    placeholder="Snapshot to compare against the base",
+                )
+            )
+
+        def on_current(base: int, current: int) -> None:
+            if current < 0 or current == base:
+                return
+            panel = OutputPanel(self.window, HEAP_DIFF_PANEL_NAME)
+            panel.show()
+            threading.Thread(
+                target=diff_snapshots,
+                args=(snapshots[base], snapshots[current]),
+                kwargs={"on_line": panel.append},
+                daemon=True,
+            ).start()
+
+        self.window.show_quick_panel(items, on_base, placeholder="Base snapshot")
+
+
+class GoplsSharedDaemonStatusCommand(sublime_plugin.WindowCommand):
+    """
+    Shows whether the shared gopls daemon answers and which sessions are
+    connected to it.
+    """
+
+    def is_enabled(self) -> bool:
+        return supervised_binary() is not None
+
+    def run(self) -> None:
+        if (binary := supervised_binary()) is None:
+            return
+        panel = OutputPanel(self.window, SHARED_DAEMON_PANEL_NAME)
+        panel.show()
+
+        def run() -> None:
+            pids = daemon_pids(binary)
+            if pids is not None and not pids:
+                # Asking for the status would start a daemon, which the next session does anyway.
+                panel.append(f"No shared gopls daemon of {binary} found\n")
+                return
+            processes = ", ".join(str(pid) for pid in pids) if pids is not None else "unknown"
+            status = daemon_status(binary, environment())
+            if status is None:
+                panel.append(f"The shared gopls daemon does not answer (daemon processes: {processes})\n")
+            else:
+                panel.append(f"Shared gopls daemon processes: {processes}\n\nSessions:\n{status}\n")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class GoplsRestartSharedDaemonCommand(sublime_plugin.WindowCommand):
+    """
+    Stops the shared gopls daemon and restarts all sessions that were
+    connected to it, which starts a new daemon.
+    """
+
+    def is_enabled(self) -> bool:
+        return supervised_binary() is not None
+
+    def run(self) -> None:
+        if (binary := supervised_binary()) is None:
+            return
+        stopped = stop_daemons(binary)
+        restart_sessions()
+        self.window.status_message(f"LSP-gopls: stopped {len(stopped)} shared gopls daemon(s)")
+
+
+class GoplsHibernateCommand(sublime_plugin.WindowCommand):
+    """
+    Shuts down the gopls session of the window to release its memory. The
+    session starts again on the next activity in a Go view.
+    """
+
+    def run(self) -> None:
+        if not hibernate(self.window, Gopls.plugin_storage_path):
+            self.window.status_message("LSP-gopls: no Go view in this window")
+
+
+class GoplsHibernateSessionCommand(LspTextCommand):
+    """
+    Ends the gopls session of the view. Internal, run by `hibernate` on a Go
+    view of the window to hibernate, as sessions are looked up through views.
+    """
+
+    def run(self, _: sublime.Edit) -> None:
+        if session := self.session_by_name(self.session_name):
+            session.end_async()
+
+
+class GoplsWorkspaceReportCommand(sublime_plugin.WindowCommand):
+    """
+    Shows the module and package counts of the folders of the window and the
+    directory filters and scope settings that the `workspaceTuning` setting
+    derives from them, with the expected savings.
+    """
+
+    def run(self, refresh: bool = False) -> None:
+        folders = self.window.folders()
+        if not folders:
+            sublime.message_dialog("The window has no folders")
+            return
+        panel = OutputPanel(self.window, WORKSPACE_REPORT_PANEL_NAME)
+        panel.show()
+        settings = get_plugin_settings()
+        scans = WorkspaceScans(Gopls.plugin_storage_path)
+
+        def run() -> None:
+            for folder in folders:
+                if refresh:
+                    scans.get(folder, refresh=True)
+                derived, report = tune_folder(folder, settings, scans)
+                panel.append(f"{report}\n")
+                if derived:
+                    panel.append(f"  derived settings: {json.dumps(derived)}\n")
+                panel.append("\n")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class GoplsToggleRpcTraceCommand(sublime_plugin.WindowCommand):
+    """
+    Turns tracing of all LSP messages into a log file in plugin storage on or
+    off and restarts gopls to apply it.
+    """
+
+    def run(self) -> None:
+        enabled = toggle_trace(get_plugin_settings())
+        self.window.run_command("lsp_restart_server", {"config_name": SESSION_NAME})
+        self.window.status_message(f"LSP-gopls: RPC trace {'on' if enabled else 'off'}")
+
+
+class GoplsAnalyzeRpcTraceCommand(sublime_plugin.WindowCommand):
+    """
+    Reports the count and latency percentiles of every LSP method in an RPC
+    trace, together with the slowest requests and their documents.
+    """
+
+    def run(self) -> None:
+        traces = list_traces(Gopls.plugin_storage_path)
+        if not traces:
+            sublime.message_dialog("No RPC traces yet, turn them on with `LSP-gopls: Toggle RPC Trace`")
+            return
+        items = [
+            sublime.QuickPanelItem(trace.name, annotation=f"{trace.stat().st_size / MEGABYTE:,.1f} MB")
+            for trace in traces
+        ]
+
+        def on_select(index: int) -> None:
+            if index < 0:
+                return
+            panel = OutputPanel(self.window, RPC_TRACE_PANEL_NAME)
+            panel.show()
+            panel.append(f"Analyzing {traces[index]}...\n")
+
+            def run() -> None:
+                try:
+                    stats, slowest = analyze_trace(traces[index])
+                except OSError as ex:
+                    panel.append(f"{ex}\n")
+                    return
+                panel.replace(render_trace_report(traces[index], stats, slowest))
+
+            threading.Thread(target=run, daemon=True).start()
+
+        self.window.show_quick_panel(items, on_select)
+
+
+class GoplsStartupTimingsCommand(sublime_plugin.WindowCommand):
+    """
+    Summarises how long the recent starts of gopls spent in every phase, from
+    loading the plugin to gopls having loaded the workspace.
+    """
+
+    def run(self) -> None:
+        panel = OutputPanel(self.window, STARTUP_TIMINGS_PANEL_NAME)
+        panel.show()
+        panel.append(render_startup_summary(read_records(Gopls.plugin_storage_path)))
+
+
+class GoplsCancelPrewarmCommand(sublime_plugin.WindowCommand):
+    """
+    Stops pre-warming the Go caches and drops the folders still queued.
+    """
+
+    def is_enabled(self) -> bool:
+        return prewarmer().is_running
+
+    def run(self) -> None:
+        if cancel_prewarm():
+            self.window.status_message("LSP-gopls: pre-warming cancelled")
+
+
+class GoplsCollectCpuProfileCommand(LspTextCommand):
+    """
+    Records a CPU profile of gopls through its debug server for profile-guided
+    builds. Runs on its own while Go files are edited if `pgoProfiling` is on.
+    """
+
+    def run(self, _: sublime.Edit) -> None:
+        session = self.session_by_name(self.session_name)
+        window = self.view.window()
+        if session is None or window is None:
+            collected()
+            return
+        profiles = CpuProfiles(Gopls.plugin_storage_path)
+
+        def collect(url: str) -> None:
+            try:
+                path = profiles.collect(url)
+            except OSError as ex:
+                print(f"LSP-gopls: could not collect a CPU profile: {ex}")
+                return
+            finally:
+                collected()
+            count = len(profiles.list())
+            sublime.set_timeout(
+                lambda: window.status_message(f"LSP-gopls: CPU profile saved to {path} ({count} collected)")
+            )
+
+        def on_url(url: str | None) -> None:
+            if url is None:
+                collected()
+                return
+            threading.Thread(target=collect, args=(url,), daemon=True).start()
+
+        request_debug_url(session, on_url)
+
+
+class GoplsBuildPgoBinaryCommand(sublime_plugin.WindowCommand):
+    """
+    Merges the collected CPU profiles of gopls and builds a profile-guided
+    gopls from them, next to the plain build.
+    """
+
+    def is_enabled(self) -> bool:
+        return active_install() is None
+
+    def run(self) -> None:
+        settings = get_plugin_settings()
+
+        def run() -> None:
+            try:
+                build = Gopls.build_pgo_gopls(settings)
+            except (InstallError, ValueError, OSError) as ex:
+                message = f"Could not build a profile-guided gopls: {ex}"
+                sublime.set_timeout(lambda: sublime.message_dialog(message))
+                return
+            hint = "restart gopls to use it" if is_pgo_enabled(settings) else "switch to it with the toggle command"
+            sublime.set_timeout(
+                lambda: self.window.status_message(f"LSP-gopls: profile-guided gopls v{build} built, {hint}")
+            )
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class GoplsTogglePgoBinaryCommand(sublime_plugin.WindowCommand):
+    """
+    Switches between the plain and the profile-guided build of gopls and
+    restarts gopls, to compare them or roll back.
+    """
+
+    def is_checked(self) -> bool:
+        return is_pgo_enabled(get_plugin_settings())
+
+    def run(self) -> None:
+        enabled = toggle_pgo(get_plugin_settings())
+        self.window.run_command("lsp_restart_server", {"config_name": SESSION_NAME})
+        self.window.status_message(f"LSP-gopls: using the {'profile-guided' if enabled else 'plain'} gopls build")
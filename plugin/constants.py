@@ -3,5 +3,6 @@ from __future__ import annotations
 import re
 
 TAG = "0.11.0"
+SESSION_NAME = "LSP-gopls"
 GOPLS_BASE_URL = "golang.org/x/tools/gopls@v{tag}"
 RE_VER = re.compile(r"go(\d+)\.(\d+)(?:\.(\d+))?")
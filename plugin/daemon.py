@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from pathlib import Path
+import contextlib
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+
+from .constants import SESSION_NAME
+from .utils import get_startupinfo
+from .watchdog import sample_gopls_processes
+from .watchdog import window_of
+
+HEALTH_CHECK_INTERVAL_SECONDS = 30
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+FAILED_CHECKS_BEFORE_RESTART = 2
+# Makes gopls derive a daemon address of LSP-gopls' own, so daemons started by other editors are never touched.
+DAEMON_ID = "lsp-gopls"
+REMOTE_FLAG = f"-remote=auto;{DAEMON_ID}"
+
+_supervisor: DaemonSupervisor | None = None
+_supervisor_lock = threading.Lock()
+
+
+def use_shared_daemon(settings: DottedDict, command: list[str]) -> bool:
+    """
+    Returns whether a session started with `command` should forward to the
+    shared daemon. A `-remote` of the user's own is left alone, as is the
+    daemon it connects to. Not supported on Windows, where the daemon could
+    not be found to stop it again, see `daemon_pids`.
+    """
+    if not settings.get("sharedDaemon") or any(arg.startswith("-remote") for arg in command[1:]):
+        return False
+    if sublime.platform() == "windows":
+        print("LSP-gopls: sharedDaemon is not supported on Windows, sessions are started without a daemon")
+        return False
+    return True
+
+
+def remote_flags(settings: DottedDict) -> list[str]:
+    """
+    Returns the flags that make gopls a lightweight forwarder to the shared
+    daemon, which gopls starts on demand and which exits by itself once no
+    forwarder has been connected for `sharedDaemonIdleTimeout` seconds.
+    """
+    timeout = settings.get("sharedDaemonIdleTimeout") or 60
+    return [REMOTE_FLAG, f"-remote.listen.timeout={timeout}s"]
+
+
+def daemon_status(binary: str, env_vars: dict | None = None) -> str | None:
+    """
+    Returns the sessions of the shared daemon as reported by
+    `gopls remote sessions`, or `None` if the daemon does not answer within
+    `HEALTH_CHECK_TIMEOUT_SECONDS`.
+    """
+    try:
+        output = subprocess.run(
+            [binary, REMOTE_FLAG, "remote", "sessions"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env_vars,
+            timeout=HEALTH_CHECK_TIMEOUT_SECONDS,
+            text=True,
+            startupinfo=get_startupinfo(),
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if output.returncode != 0:
+        return None
+    try:
+        return json.dumps(json.loads(output.stdout), indent=2)
+    except ValueError:
+        return output.stdout
+
+
+def _listen_address(argv: list[str]) -> str | None:
+    for index, arg in enumerate(argv):
+        if arg.startswith(("-listen=", "--listen=")):
+            return arg.partition("=")[2]
+        if arg in ("-listen", "--listen") and index + 1 < len(argv):
+            return argv[index + 1]
+    return None
+
+
+def is_daemon_address(address: str, binary: str) -> bool:
+    """
+    Returns whether `address` is the one that `REMOTE_FLAG` makes `binary`
+    listen on, `<network>;<tmp>/<binary name>-<hash>-daemon.<user>-lsp-gopls`.
+    The hash of the binary is computed by gopls and not reproduced here.
+    """
+    name = os.path.basename(address.rpartition(";")[2])
+    return name.startswith(f"{os.path.basename(binary)}-") and "-daemon." in name and name.endswith(f"-{DAEMON_ID}")
+
+
+def daemon_pids(binary: str) -> list[int] | None:
+    """
+    Returns the ids of the shared daemons of `binary` started for LSP-gopls:
+    the processes of the same executable that listen on the address derived
+    from `REMOTE_FLAG`. Returns `None` where processes cannot be listed.
+    """
+    if sublime.platform() == "windows":
+        return None
+    try:
+        output = subprocess.check_output(["ps", "-x", "-o", "pid=,args="], universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    executable = os.path.realpath(binary)
+    pids = []
+    for line in output.splitlines():
+        pid, _, args = line.strip().partition(" ")
+        if not (argv := args.split()) or os.path.realpath(argv[0]) != executable:
+            continue
+        if (address := _listen_address(argv[1:])) is not None and is_daemon_address(address, binary):
+            pids.append(int(pid))
+    return pids
+
+
+def stop_daemons(binary: str) -> list[int]:
+    pids = daemon_pids(binary) or []
+    for pid in pids:
+        with contextlib.suppress(OSError):
+            os.kill(pid, signal.SIGTERM)
+    return pids
+
+
+def restart_sessions() -> None:
+    """
+    Restarts the sessions of all windows that have a gopls forwarder running.
+    The first forwarder to start again brings up a new daemon.
+    """
+    windows = {window.id(): window for sample in sample_gopls_processes() if (window := window_of(sample))}
+
+    def run() -> None:
+        for window in windows.values():
+            window.run_command("lsp_restart_server", {"config_name": SESSION_NAME})
+
+    sublime.set_timeout(run)
+
+
+class DaemonSupervisor:
+    """
+    Checks every `HEALTH_CHECK_INTERVAL_SECONDS` that the shared daemon still
+    answers while sessions are connected to it. A daemon that fails
+    `FAILED_CHECKS_BEFORE_RESTART` checks in a row is stopped and the sessions
+    are restarted, which starts a fresh daemon. Checks pause while no session
+    uses the daemon. Interventions are logged to `daemon.log` in plugin
+    storage.
+    """
+
+    def __init__(self, binary: str, env_vars: dict, storage_path: str | Path) -> None:
+        self.binary = binary
+        self.env_vars = env_vars
+        self.log_path = Path(storage_path, "daemon.log")
+        self.failed_checks = 0
+        # Whether the latest session of every window was started as a forwarder to the daemon.
+        self.forwarding: dict[int, bool] = {}
+        self._stopped = threading.Event()
+
+    def start(self) -> DaemonSupervisor:
+        threading.Thread(target=self._run, name="gopls-daemon-supervisor", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(HEALTH_CHECK_INTERVAL_SECONDS):
+            if not any(self.forwarding.values()):
+                continue
+            self.check()
+
+    def check(self) -> bool:
+        forwarders = [
+            sample
+            for sample in sample_gopls_processes()
+            if (window := window_of(sample)) and self.forwarding.get(window.id())
+        ]
+        if not forwarders:
+            # Without forwarders the daemon times out by itself.
+            self.failed_checks = 0
+            return True
+        if daemon_status(self.binary, self.env_vars) is not None:
+            self.failed_checks = 0
+            return True
+        self.failed_checks += 1
+        self._log("unhealthy", [])
+        if self.failed_checks >= FAILED_CHECKS_BEFORE_RESTART:
+            self.failed_checks = 0
+            self._log("restart", stop_daemons(self.binary))
+            restart_sessions()
+        return False
+
+    def _log(self, action: str, pids: list[int]) -> None:
+        print(f"LSP-gopls: shared gopls daemon {action}{f', stopped {pids}' if pids else ''}")
+        record = {"time": time.time(), "action": action, "failed_checks": self.failed_checks, "stopped": pids}
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a") as log:
+                log.write(json.dumps(record) + "\n")
+        except OSError as ex:
+            print(f"LSP-gopls: could not write {self.log_path}: {ex}")
+
+
+def start_supervisor(binary: str, env_vars: dict, storage_path: str | Path, window_id: int, shared: bool) -> None:
+    """
+    Tells the supervisor whether the session starting in a window forwards to
+    the shared daemon. The supervisor is started by the first one that does.
+    """
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            if not shared:
+                return
+            _supervisor = DaemonSupervisor(binary, env_vars, storage_path).start()
+        elif shared:
+            _supervisor.binary = binary
+            _supervisor.env_vars = env_vars
+        _supervisor.forwarding[window_id] = shared
+
+
+def supervised_binary() -> str | None:
+    """
+    Returns the gopls binary whose shared daemon is being supervised, if any.
+    """
+    with _supervisor_lock:
+        return _supervisor.binary if _supervisor is not None else None
+
+
+def stop_supervisor() -> None:
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is not None:
+            _supervisor.stop()
+            _supervisor = None
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from typing import Callable
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.request import urlopen
+import json
+import re
+
+from LSP.plugin import Request
+from LSP.plugin import Session
+
+from .types import GoplsStartDebuggingResponse
+
+FETCH_TIMEOUT_SECONDS = 5
+RE_MEMSTAT = re.compile(r"^# (\w+) = (\d+)$", re.MULTILINE)
+RE_GOROUTINES = re.compile(r"^goroutine profile: total (\d+)", re.MULTILINE)
+
+# Debug servers that do not publish expvars, their memory statistics are read from the heap profile.
+_without_expvars: set[str] = set()
+
+
+def request_debug_url(session: Session, on_url: Callable[[str | None], None]) -> None:
+    """
+    Starts the debug server of gopls, or looks up the one that is already
+    running, and calls `on_url` with its base URL or `None` if there is none.
+    """
+
+    def on_result(response: GoplsStartDebuggingResponse | None) -> None:
+        urls = response["URLs"] if response else []
+        on_url(urls[0].rstrip("/") if urls else None)
+
+    session.send_request(
+        Request("workspace/executeCommand", {"command": "gopls.start_debugging", "arguments": [{}]}),
+        on_result,
+    )
+
+
+def fetch(base_url: str, path: str, timeout: float = FETCH_TIMEOUT_SECONDS) -> bytes:
+    """
+    Returns the body of `path` on the debug server of gopls. Raises `OSError`
+    if the server cannot be reached.
+    """
+    try:
+        with urlopen(f"{base_url}{path}", timeout=timeout) as response:
+            return response.read()
+    except URLError as ex:
+        raise OSError(f"gopls debug server not reachable at {base_url}: {ex.reason}") from ex
+
+
+def fetch_memstats(base_url: str) -> dict[str, int]:
+    """
+    Returns the `runtime.MemStats` of gopls from the `memstats` expvar at
+    `/debug/vars`, which only costs gopls a `runtime.ReadMemStats`. Servers
+    without expvars fall back to the statistics listed at the end of the text
+    form of the heap profile, which is much more expensive to render.
+    """
+    if base_url not in _without_expvars:
+        try:
+            memstats = json.loads(fetch(base_url, "/debug/vars")).get("memstats")
+        except OSError as ex:
+            if not isinstance(ex.__cause__, HTTPError):
+                raise
+            memstats = None
+        except (ValueError, AttributeError):
+            memstats = None
+        if isinstance(memstats, dict):
+            return {name: value for name, value in memstats.items() if isinstance(value, int)}
+        _without_expvars.add(base_url)
+    text = fetch(base_url, "/debug/pprof/heap?debug=1").decode("utf-8", errors="replace")
+    return {name: int(value) for name, value in RE_MEMSTAT.findall(text)}
+
+
+def fetch_goroutine_count(base_url: str) -> int:
+    text = fetch(base_url, "/debug/pprof/goroutine?debug=1").decode("utf-8", errors="replace")
+    matches = RE_GOROUTINES.search(text)
+    return int(matches.group(1)) if matches else 0
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import re
+import statistics
+import threading
+
+from .types import GoTestEvent
+
+SAMPLES_PER_TEST = 10
+SLOWEST_LIMIT = 20
+SLOWER_RATIO = 1.5
+SLOWER_MIN_DELTA = 0.01
+PACKAGE_KEY = ""
+RE_MODULE = re.compile(r"^module\s+\"?([^\s\"]+)\"?", re.MULTILINE)
+
+_lock = threading.Lock()
+
+
+def find_module(directory: str) -> tuple[str, str] | None:
+    """
+    Returns the root directory and the module path of the Go module that
+    contains `directory`.
+    """
+    path = Path(directory)
+    for candidate in (path, *path.parents):
+        try:
+            matches = RE_MODULE.search((candidate / "go.mod").read_text())
+        except OSError:
+            continue
+        return (str(candidate), matches.group(1)) if matches else None
+    return None
+
+
+def import_path_of(directory: str) -> str | None:
+    if (module := find_module(directory)) is None:
+        return None
+    root, module_path = module
+    relative = Path(directory).relative_to(root).as_posix()
+    return module_path if relative == "." else f"{module_path}/{relative}"
+
+
+class TestDurations:
+    """
+    The elapsed times of the last `SAMPLES_PER_TEST` runs of every test and
+    package, keyed by import path and then by test name, with the whole package
+    under the empty name. The history is a single JSON file in plugin storage
+    that is merged on every save, so concurrent runs do not lose samples.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.path = Path(storage_path, "test-durations.json")
+        self._pending: dict[str, dict[str, list[float]]] = {}
+
+    def load(self) -> dict[str, dict[str, list[float]]]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, event: GoTestEvent) -> None:
+        """
+        Collects the elapsed time of a finished test or package. Skipped tests
+        and events without a timing are ignored.
+        """
+        if event.get("Action") not in ("pass", "fail") or "Elapsed" not in event:
+            return
+        package = self._pending.setdefault(event.get("Package", ""), {})
+        package.setdefault(event.get("Test", PACKAGE_KEY), []).append(event["Elapsed"])
+
+    def save(self) -> None:
+        if not self._pending:
+            return
+        with _lock:
+            history = self.load()
+            for package, tests in self._pending.items():
+                recorded = history.setdefault(package, {})
+                for test, samples in tests.items():
+                    recorded[test] = (recorded.get(test, []) + samples)[-SAMPLES_PER_TEST:]
+            self._pending = {}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+            tmp.write_text(json.dumps(history, separators=(",", ":")))
+            os.replace(tmp, self.path)
+
+    def report(self, scope: str, recursive: bool) -> str:
+        """
+        Renders the slowest tests and the tests that got slower in the package
+        with import path `scope`, or in all packages below it if `recursive`.
+        """
+        history = {
+            package: tests
+            for package, tests in self.load().items()
+            if package == scope or (recursive and package.startswith(f"{scope}/"))
+        }
+        latest = [
+            (samples[-1], package, test)
+            for package, tests in history.items()
+            for test, samples in tests.items()
+            if test != PACKAGE_KEY and samples
+        ]
+        slower = []
+        for package, tests in history.items():
+            for test, samples in tests.items():
+                if test == PACKAGE_KEY or len(samples) < 2:
+                    continue
+                before = statistics.median(samples[:-1])
+                if samples[-1] - before >= SLOWER_MIN_DELTA and samples[-1] >= before * SLOWER_RATIO:
+                    slower.append((samples[-1] - before, package, test, before, samples[-1]))
+
+        lines = [f"Test durations in {scope}{'/...' if recursive else ''}", ""]
+        packages = sorted(
+            ((tests[PACKAGE_KEY][-1], package) for package, tests in history.items() if tests.get(PACKAGE_KEY)),
+            reverse=True,
+        )
+        if packages:
+            lines.append("Packages:")
+            lines.extend(f"  {elapsed:8.2f}s  {package}" for elapsed, package in packages)
+            lines.append("")
+        lines.append(f"Slowest tests (last run, top {SLOWEST_LIMIT}):")
+        slowest = sorted(latest, reverse=True)[:SLOWEST_LIMIT]
+        lines.extend(f"  {elapsed:8.2f}s  {package}.{test}" for elapsed, package, test in slowest)
+        if not latest:
+            lines.append("  no test runs recorded")
+        lines.extend(("", "Tests that got slower (last run against the median of earlier runs):"))
+        lines.extend(
+            f"  {before:8.2f}s -> {after:.2f}s  {package}.{test}"
+            for _, package, test, before, after in sorted(slower, reverse=True)
+        )
+        if not slower:
+            lines.append("  none")
+        return "\n".join(lines) + "\n"
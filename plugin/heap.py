@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable
+import json
+import os
+import time
+
+from .debugserver import fetch
+from .debugserver import fetch_memstats
+from .process import GoProcess
+from .toolchain import environment
+from .types import GoplsHeapSnapshot
+
+HEAP_DIFF_PANEL_NAME = "gopls_heap_diff"
+SNAPSHOT_SUFFIX = ".pb.gz"
+
+
+class HeapSnapshots:
+    """
+    Heap profiles of gopls taken from its debug server, stored in plugin
+    storage as `heap-<timestamp>.pb.gz` with the memory statistics at the time
+    of capture next to them. The profiles are self-contained, so they can be
+    attached to bug reports as they are.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.root = Path(storage_path, "heap-snapshots")
+
+    def capture(self, base_url: str) -> GoplsHeapSnapshot:
+        """
+        Saves the current heap profile of the gopls debug server at `base_url`.
+        Raises `OSError` if the server cannot be reached.
+        """
+        profile = fetch(base_url, "/debug/pprof/heap")
+        memstats = fetch_memstats(base_url)
+        now = time.time()
+        # Milliseconds and a counter keep captures within the same second apart.
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+        self.root.mkdir(parents=True, exist_ok=True)
+        name, counter = f"heap-{stamp}", 1
+        while (path := self.root / f"{name}{SNAPSHOT_SUFFIX}").exists():
+            name, counter = f"heap-{stamp}-{counter}", counter + 1
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_bytes(profile)
+        os.replace(tmp, path)
+        snapshot = GoplsHeapSnapshot(
+            path=str(path),
+            time=now,
+            heap_alloc=memstats.get("HeapAlloc", 0),
+            heap_inuse=memstats.get("HeapInuse", 0),
+            heap_objects=memstats.get("HeapObjects", 0),
+        )
+        path.with_name(f"{name}.json").write_text(json.dumps(snapshot))
+        return snapshot
+
+    def list(self) -> list[GoplsHeapSnapshot]:
+        """
+        Returns the stored snapshots, oldest first.
+        """
+        snapshots: list[GoplsHeapSnapshot] = []
+        for path in sorted(self.root.glob(f"heap-*{SNAPSHOT_SUFFIX}"), key=_capture_order):
+            try:
+                snapshot = json.loads(path.with_name(path.name[: -len(SNAPSHOT_SUFFIX)] + ".json").read_text())
+                snapshot["path"] = str(path)
+            except (OSError, ValueError):
+                snapshot = GoplsHeapSnapshot(path=str(path), time=path.stat().st_mtime, heap_alloc=0, heap_inuse=0,
+                                             heap_objects=0)
+            snapshots.append(snapshot)
+        return snapshots
+
+
+def _capture_order(path: Path) -> tuple[str, int]:
+    # `heap-<date>-<time>-<ms>[-<counter>]`, where a name with a counter was captured after the one without.
+    date, _, rest = path.name[len("heap-") : -len(SNAPSHOT_SUFFIX)].partition("-")
+    clock, _, rest = rest.partition("-")
+    millis, _, counter = rest.partition("-")
+    return f"{date}-{clock}-{millis}", int(counter) if counter.isdigit() else 0
+
+
+def diff_snapshots(
+    base: GoplsHeapSnapshot,
+    current: GoplsHeapSnapshot,
+    sample_index: str = "inuse_space",
+    node_count: int = 30,
+    on_line: Callable[[str], None] | None = None,
+) -> int:
+    """
+    Runs `go tool pprof -top -diff_base` on two snapshots, which lists the
+    allocation sites whose `sample_index` grew the most from `base` to
+    `current`, and streams its output to `on_line`. Returns the exit code.
+    """
+    args = [
+        "tool", "pprof", "-top", f"-nodecount={node_count}", f"-sample_index={sample_index}",
+        f"-diff_base={base['path']}", current["path"],
+    ]
+    return GoProcess(args, environment(), on_line=on_line).start().wait()
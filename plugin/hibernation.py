@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+import sublime_plugin
+
+from .caches import MEGABYTE
+from .constants import SESSION_NAME
+from .types import GoplsProcessSample
+from .watchdog import sample_gopls_processes
+from .watchdog import window_of
+
+CHECK_INTERVAL_SECONDS = 60
+POLL_INTERVAL_SECONDS = 0.5
+RELEASE_TIMEOUT_SECONDS = 30
+WARMUP_TIMEOUT_SECONDS = 600
+# gopls is considered warm once it uses less than this share of a core for two polls in a row.
+IDLE_CPU_SHARE = 0.05
+# Activity right after hibernating, like the view being activated again when the command palette closes, is ignored.
+WAKE_GRACE_SECONDS = 2
+
+_last_activity: dict[int, float] = {}
+# When every hibernated window was hibernated and the storage path to report to.
+_hibernated: dict[int, tuple[float, str]] = {}
+_lock = threading.Lock()
+_monitor: IdleMonitor | None = None
+
+
+def _is_go_view(view: sublime.View) -> bool:
+    return view.match_selector(0, "source.go")
+
+
+def _processes_of(window: sublime.Window) -> list[GoplsProcessSample]:
+    return [sample for sample in sample_gopls_processes() if (w := window_of(sample)) and w.id() == window.id()]
+
+
+def _log(storage_path: str | Path, record: dict) -> None:
+    path = Path(storage_path, "hibernation.log")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a") as log:
+            log.write(json.dumps(record) + "\n")
+    except OSError as ex:
+        print(f"LSP-gopls: could not write {path}: {ex}")
+
+
+def _report(window: sublime.Window, storage_path: str | Path, message: str, record: dict) -> None:
+    print(f"LSP-gopls: {message}")
+    _log(storage_path, record)
+    sublime.set_timeout(lambda: window.status_message(f"LSP-gopls: {message}"))
+
+
+def hibernate(window: sublime.Window, storage_path: str | Path) -> bool:
+    """
+    Shuts down the gopls session of `window` and reports how much memory was
+    released and how long the shutdown took. Returns whether a session was
+    asked to shut down.
+    """
+    views = [view for view in window.views() if _is_go_view(view)]
+    if not views:
+        return False
+    processes = _processes_of(window)
+    started = time.monotonic()
+    with _lock:
+        _hibernated[window.id()] = (time.monotonic(), str(storage_path))
+    sublime.set_timeout(lambda: views[0].run_command("gopls_hibernate_session"))
+
+    def wait_for_exit() -> None:
+        pids = {sample["pid"] for sample in processes}
+        deadline = started + RELEASE_TIMEOUT_SECONDS
+        while pids and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            pids &= {sample["pid"] for sample in sample_gopls_processes()}
+        released = sum(sample["rss"] for sample in processes) // MEGABYTE
+        elapsed = time.monotonic() - started
+        state = "still running" if pids else f"released {released} MB in {elapsed:.1f}s"
+        _report(
+            window,
+            storage_path,
+            f"idle gopls session hibernated, {state}",
+            {"time": time.time(), "action": "hibernate", "released_mb": released, "seconds": round(elapsed, 2),
+             "exited": not pids, "folders": window.folders()},
+        )
+
+    threading.Thread(target=wait_for_exit, name="gopls-hibernate", daemon=True).start()
+    return True
+
+
+def wake(window: sublime.Window) -> None:
+    """
+    Starts the session of a hibernated window again and reports how long gopls
+    took to warm up, which is until its CPU use settles after loading the
+    workspace.
+    """
+    with _lock:
+        if (hibernated := _hibernated.get(window.id())) is None:
+            return
+        if time.monotonic() - hibernated[0] < WAKE_GRACE_SECONDS:
+            return
+        del _hibernated[window.id()]
+    storage_path = hibernated[1]
+    started = time.monotonic()
+    sublime.set_timeout(lambda: window.run_command("lsp_restart_server", {"config_name": SESSION_NAME}))
+
+    def wait_for_warmup() -> None:
+        previous: dict[int, tuple[float, float]] = {}
+        idle_polls = 0
+        while time.monotonic() - started < WARMUP_TIMEOUT_SECONDS and idle_polls < 2:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            now = time.monotonic()
+            busy = False
+            samples = _processes_of(window)
+            for sample in samples:
+                last = previous.get(sample["pid"])
+                previous[sample["pid"]] = (now, sample["cpu_seconds"])
+                if last is None or (sample["cpu_seconds"] - last[1]) / (now - last[0]) >= IDLE_CPU_SHARE:
+                    busy = True
+            idle_polls = idle_polls + 1 if samples and not busy else 0
+        elapsed = time.monotonic() - started
+        _report(
+            window,
+            storage_path,
+            f"gopls session resumed and warmed up in {elapsed:.1f}s",
+            {"time": time.time(), "action": "wake", "seconds": round(elapsed, 2), "folders": window.folders()},
+        )
+
+    threading.Thread(target=wait_for_warmup, name="gopls-wake", daemon=True).start()
+
+
+class IdleMonitor:
+    """
+    Hibernates the gopls session of every window in which no Go view has been
+    activated or edited for the `hibernateAfter` minutes of that session. The
+    session comes back on the next activity in a Go view of the window.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.storage_path = storage_path
+        # The settings of the latest session of every window.
+        self.settings: dict[int, DottedDict] = {}
+        self._stopped = threading.Event()
+
+    def start(self) -> IdleMonitor:
+        threading.Thread(target=self._run, name="gopls-idle-monitor", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(CHECK_INTERVAL_SECONDS):
+            self.check()
+
+    def check(self) -> None:
+        now = time.monotonic()
+        for window in sublime.windows():
+            if not (settings := self.settings.get(window.id())) or not (minutes := settings.get("hibernateAfter")):
+                continue
+            with _lock:
+                if window.id() in _hibernated:
+                    continue
+                last = _last_activity.setdefault(window.id(), now)
+            if now - last >= minutes * 60 and _processes_of(window):
+                hibernate(window, self.storage_path)
+
+
+def record_activity(window: sublime.Window) -> None:
+    with _lock:
+        _last_activity[window.id()] = time.monotonic()
+        hibernated = window.id() in _hibernated
+    if hibernated:
+        wake(window)
+
+
+def start_monitor(storage_path: str | Path, window_id: int, settings: DottedDict) -> None:
+    """
+    Hands the settings of a starting session to the idle monitor, which is
+    started by the first session with `hibernateAfter` set.
+    """
+    global _monitor
+    with _lock:
+        if _monitor is None:
+            if not settings.get("hibernateAfter"):
+                return
+            if not os.path.isdir("/proc/self"):
+                print("LSP-gopls: hibernateAfter is only supported on Linux, it finds gopls processes through /proc")
+                return
+            _monitor = IdleMonitor(storage_path).start()
+        _monitor.settings[window_id] = settings
+
+
+def stop_monitor() -> None:
+    global _monitor
+    with _lock:
+        if _monitor is not None:
+            _monitor.stop()
+            _monitor = None
+
+
+class GoplsHibernationListener(sublime_plugin.EventListener):
+    def on_activated_async(self, view: sublime.View) -> None:
+        if (window := view.window()) and _is_go_view(view):
+            record_activity(window)
+
+    def on_modified_async(self, view: sublime.View) -> None:
+        if (window := view.window()) and _is_go_view(view):
+            record_activity(window)
+
+    def on_pre_close_window(self, window: sublime.Window) -> None:
+        with _lock:
+            _last_activity.pop(window.id(), None)
+            _hibernated.pop(window.id(), None)
@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable
+import contextlib
+import os
+import shutil
+import threading
+import time
+
+import sublime
+
+from .panel import OutputPanel
+from .process import GoProcess
+from .utils import is_binary_available
+
+INSTALL_PANEL_NAME = "gopls_install"
+STATUS_THROTTLE_SECONDS = 0.25
+LOCK_POLL_SECONDS = 0.5
+LOCK_STALE_SECONDS = 3600.0
+
+_active_install: GoInstallProcess | None = None
+_active_install_lock = threading.Lock()
+_version_locks: dict[str, threading.Lock] = {}
+
+
+class InstallError(Exception):
+    pass
+
+
+class InstallCancelledError(InstallError):
+    pass
+
+
+class InstallTimeoutError(InstallError):
+    pass
+
+
+def gopls_binary_name() -> str:
+    return "gopls.exe" if sublime.platform() == "windows" else "gopls"
+
+
+class GoplsStore:
+    """
+    The layout of the managed gopls binaries in plugin storage:
+
+        bin/<version>/gopls   one directory per installed version
+        VERSION               the version new sessions are started with
+
+    Versions are built into a staging directory and renamed into place once
+    complete, and `VERSION` is only ever replaced atomically. A running session
+    keeps using its binary while a newer version is built next to it.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.root = Path(storage_path)
+        self.bin_dir = self.root / "bin"
+        self.pointer = self.root / "VERSION"
+
+    def version_dir(self, version: str) -> Path:
+        return self.bin_dir / version
+
+    def binary_path(self, version: str) -> Path:
+        return self.version_dir(version) / gopls_binary_name()
+
+    def is_installed(self, version: str | None) -> bool:
+        return bool(version) and is_binary_available(str(self.binary_path(version)))  # type: ignore
+
+    def current_version(self) -> str | None:
+        try:
+            return self.pointer.read_text().strip() or None
+        except OSError:
+            return None
+
+    def set_current(self, version: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.pointer.with_name(f".VERSION.{os.getpid()}")
+        tmp.write_text(version)
+        os.replace(tmp, self.pointer)
+
+    def installed_versions(self) -> list[str]:
+        try:
+            dirs = [d for d in self.bin_dir.iterdir() if d.is_dir() and not d.name.startswith(".")]
+        except OSError:
+            return []
+        dirs.sort(key=lambda d: d.stat().st_mtime, reverse=True)
+        return [d.name for d in dirs]
+
+    def staging_dir(self, version: str) -> Path:
+        return self.bin_dir / f".staging-{version}-{os.getpid()}"
+
+    def commit(self, version: str, staging: Path) -> None:
+        target = self.version_dir(version)
+        if self.is_installed(version):
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        if target.exists():
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+
+    def prune(self, keep: int) -> list[str]:
+        """
+        Removes all but the current version and the `keep` most recently
+        installed other versions, along with the binary of the old unversioned
+        layout. Versions still in use by a running server may fail to delete on
+        some platforms and are left for the next attempt.
+        """
+        current = self.current_version()
+        others = [v for v in self.installed_versions() if v != current]
+        removed = []
+        for version in others[max(keep, 0):]:
+            shutil.rmtree(self.version_dir(version), ignore_errors=True)
+            if not self.version_dir(version).exists():
+                removed.append(version)
+        legacy = self.bin_dir / gopls_binary_name()
+        if legacy.is_file():
+            with contextlib.suppress(OSError):
+                legacy.unlink()
+        return removed
+
+
+class InstallLock:
+    """
+    A lock file that makes sure only one process builds a given gopls version.
+    The file records the pid of its owner and is considered stale once that
+    process is gone, so a crashed install never blocks later sessions for good.
+    Where it cannot be told whether the owner is alive, the lock goes stale
+    once it is older than `stale_after` seconds instead.
+    """
+
+    def __init__(self, path: Path, stale_after: float = LOCK_STALE_SECONDS) -> None:
+        self.path = path
+        self.stale_after = stale_after
+        self._owned = False
+
+    def try_acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(str(self.path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{os.getpid()}\n")
+        self._owned = True
+        return True
+
+    def acquire(self, timeout: float | None = None, on_wait: Callable[[], None] | None = None) -> None:
+        """
+        Blocks until the lock is acquired, breaking it if it turns out to be
+        stale. Raises `InstallTimeoutError` if it is still held by another
+        process after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = False
+        while not self.try_acquire():
+            if (owner := self.stale_owner()) is not None:
+                self._break(owner)
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                raise InstallTimeoutError(f"timed out waiting for {self.path.name} after {timeout:.0f}s")
+            if not waiting and on_wait:
+                on_wait()
+            waiting = True
+            time.sleep(LOCK_POLL_SECONDS)
+
+    def release(self) -> None:
+        if self._owned:
+            self._owned = False
+            with contextlib.suppress(OSError):
+                self.path.unlink()
+
+    def is_stale(self) -> bool:
+        return self.stale_owner() is not None
+
+    def stale_owner(self) -> int | None:
+        """
+        Returns the pid recorded in a stale lock, 0 if it records none, or None
+        if the lock is not stale.
+        """
+        try:
+            age = time.time() - self.path.stat().st_mtime
+            pid = _read_pid(self.path)
+        except OSError:
+            # Released in the meantime.
+            return None
+        alive = _is_process_alive(pid) if pid > 0 else None
+        if alive is False or (alive is None and age > self.stale_after):
+            return pid
+        return None
+
+    def _break(self, owner: int) -> None:
+        # Moved aside first, so a lock that another process took after the stale
+        # one was removed is never deleted, it is put back instead.
+        moved = self.path.with_name(f"{self.path.name}.{os.getpid()}-{threading.get_ident()}")
+        try:
+            os.replace(self.path, moved)
+        except OSError:
+            return
+        try:
+            if _read_pid(moved) != owner:
+                with contextlib.suppress(OSError):
+                    os.link(moved, self.path)
+        except OSError:
+            pass
+        finally:
+            with contextlib.suppress(OSError):
+                moved.unlink()
+
+
+def _read_pid(path: Path) -> int:
+    try:
+        return int(path.read_text().strip() or 0)
+    except ValueError:
+        # Still being written.
+        return 0
+
+
+def _is_process_alive(pid: int) -> bool | None:
+    """
+    Returns whether the process `pid` is alive, or None where that cannot be
+    told.
+    """
+    if sublime.platform() == "windows":
+        # `os.kill` terminates the process on Windows.
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _version_lock(version: str) -> threading.Lock:
+    with _active_install_lock:
+        return _version_locks.setdefault(version, threading.Lock())
+
+
+class InstallProgress:
+    """
+    Reports the output of a running install to an output panel and the status
+    bar of a window. All UI updates happen on the main thread so the installer
+    thread is never blocked by the UI.
+    """
+
+    def __init__(self, window: sublime.Window | None, title: str) -> None:
+        self.title = title
+        self.steps = 0
+        self.started_at = time.monotonic()
+        self._last_status = 0.0
+        self._panel = OutputPanel(window, INSTALL_PANEL_NAME)
+
+    def on_line(self, line: str) -> None:
+        self.steps += 1
+        self._panel.append(line)
+        now = time.monotonic()
+        if now - self._last_status >= STATUS_THROTTLE_SECONDS:
+            self._last_status = now
+            self._panel.status(f"{self.title}: step {self.steps} ({now - self.started_at:.0f}s)")
+
+    def finish(self, message: str, show_panel: bool = False) -> None:
+        self._panel.append(f"\n{message}\n")
+        self._panel.status(f"{self.title}: {message}")
+        if show_panel:
+            self._panel.show()
+
+
+class GoInstallProcess(GoProcess):
+    """
+    A `GoProcess` that installs gopls. Only one install is tracked as active at
+    a time, so it can be cancelled from the command palette.
+    """
+
+    cancelled_error = InstallCancelledError
+    timeout_error = InstallTimeoutError
+
+    def start(self) -> GoInstallProcess:
+        global _active_install
+        with _active_install_lock:
+            _active_install = self
+        super().start()
+        return self
+
+    def _on_exit(self) -> None:
+        global _active_install
+        with _active_install_lock:
+            if _active_install is self:
+                _active_install = None
+
+
+def active_install() -> GoInstallProcess | None:
+    with _active_install_lock:
+        return _active_install
+
+
+def cancel_active_install() -> bool:
+    if install := active_install():
+        install.cancel()
+        return True
+    return False
+
+
+def build_gopls(
+    store: GoplsStore,
+    version: str,
+    go_sub_command: str,
+    url: str,
+    env_vars: dict,
+    progress: InstallProgress,
+    timeout: float | None = None,
+    restore: Callable[[Path], bool] | None = None,
+    on_built: Callable[[Path], None] | None = None,
+    build_flags: list[str] | None = None,
+) -> None:
+    """
+    Builds gopls `version` into a staging directory and moves it into the
+    versioned layout of `store` once `go` succeeds. Raises `InstallError` if the
+    build fails, times out or is cancelled.
+
+    `restore` is given the path of the binary to produce and may fill it from a
+    cache instead of building, while `on_built` is called with every freshly
+    built binary before it is moved into place. `build_flags` are passed on to
+    `go`, like `-pgo` for profile-guided builds.
+
+    Builds are single-flight: sessions in this process wait on a shared lock,
+    and other Sublime Text instances wait on a lock file in `store`, so only one
+    `go install` of a version ever runs at a time and the others reuse its
+    result.
+    """
+    with _version_lock(version):
+        if store.is_installed(version):
+            return
+        stale_after = max((timeout or 0) + 60, LOCK_STALE_SECONDS)
+        lock = InstallLock(store.bin_dir / f".install-{version}.lock", stale_after=stale_after)
+        try:
+            lock.acquire(timeout, on_wait=lambda: progress.on_line("waiting for another gopls installation\n"))
+        except InstallError as ex:
+            progress.finish(str(ex), show_panel=True)
+            raise
+        try:
+            if store.is_installed(version):
+                progress.finish(f"gopls v{version} installed by another process")
+                return
+            _build_gopls_locked(
+                store, version, go_sub_command, url, env_vars, progress, timeout, restore, on_built, build_flags or []
+            )
+        finally:
+            lock.release()
+
+
+def _build_gopls_locked(
+    store: GoplsStore,
+    version: str,
+    go_sub_command: str,
+    url: str,
+    env_vars: dict,
+    progress: InstallProgress,
+    timeout: float | None,
+    restore: Callable[[Path], bool] | None,
+    on_built: Callable[[Path], None] | None,
+    build_flags: list[str],
+) -> None:
+    staging = store.staging_dir(version)
+    staging.mkdir(parents=True, exist_ok=True)
+    binary = staging / gopls_binary_name()
+    if restore is not None and restore(binary):
+        store.commit(version, staging)
+        progress.finish(f"gopls v{version} restored from cache")
+        return
+
+    env_vars["GOBIN"] = str(staging)
+    install = GoInstallProcess(
+        args=[go_sub_command, "-x", *build_flags, url],
+        env_vars=env_vars,
+        on_line=progress.on_line,
+        timeout=timeout,
+    ).start()
+    try:
+        return_code = install.wait()
+        if return_code != 0:
+            raise InstallError(f"go installation error with return code {return_code}: {install.output_tail}")
+        if on_built is not None:
+            try:
+                on_built(binary)
+            except OSError as ex:
+                print(f"LSP-gopls: could not cache gopls v{version}: {ex}")
+        store.commit(version, staging)
+    except InstallError as ex:
+        progress.finish(str(ex).splitlines()[0], show_panel=True)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    progress.finish(f"gopls v{version} installed")
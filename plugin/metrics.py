@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable
+import threading
+import time
+
+import sublime
+import sublime_plugin
+
+from .caches import MEGABYTE
+from .debugserver import fetch_goroutine_count
+from .debugserver import fetch_memstats
+from .types import GoplsMetricsSample
+
+DASHBOARD_SETTING = "gopls_metrics_url"
+SPARKLINE_WIDTH = 60
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+# The sampled values, with a label and whether they are a size in bytes.
+METRICS = (
+    ("HeapAlloc", "heap of live objects", True),
+    ("HeapInuse", "heap in use", True),
+    ("HeapIdle", "heap idle", True),
+    ("Sys", "memory from the OS", True),
+    ("HeapObjects", "live objects", False),
+    ("NumGC", "GC cycles", False),
+    ("Goroutines", "goroutines", False),
+)
+
+_dashboards: dict[int, MetricsSampler] = {}
+
+
+class MetricsSampler:
+    """
+    Polls the memory statistics and goroutine count of gopls from its debug
+    server every `interval` seconds on a background thread and keeps the last
+    `capacity` samples.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        interval: float,
+        capacity: int,
+        on_sample: Callable[[MetricsSampler], None] | None = None,
+    ) -> None:
+        self.base_url = base_url
+        self.interval = interval
+        self.samples: deque[GoplsMetricsSample] = deque(maxlen=capacity)
+        self.error: str | None = None
+        self.on_sample = on_sample
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self) -> MetricsSampler:
+        threading.Thread(target=self._run, name="gopls-metrics", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                values = fetch_memstats(self.base_url)
+                values["Goroutines"] = fetch_goroutine_count(self.base_url)
+            except OSError as ex:
+                self.error = str(ex)
+            else:
+                self.error = None
+                sample = GoplsMetricsSample(time=time.time(), values={key: values.get(key, 0) for key, _, _ in METRICS})
+                with self._lock:
+                    self.samples.append(sample)
+            if self.on_sample:
+                self.on_sample(self)
+            self._stopped.wait(self.interval)
+
+    def snapshot(self) -> list[GoplsMetricsSample]:
+        with self._lock:
+            return list(self.samples)
+
+
+def _format(value: float, is_bytes: bool) -> str:
+    return f"{value / MEGABYTE:,.1f} MB" if is_bytes else f"{value:,.0f}"
+
+
+def sparkline(values: list[int]) -> str:
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKLINE_BLOCKS[0] * len(values)
+    scale = (len(SPARKLINE_BLOCKS) - 1) / (high - low)
+    return "".join(SPARKLINE_BLOCKS[round((value - low) * scale)] for value in values)
+
+
+def render_dashboard(sampler: MetricsSampler) -> str:
+    """
+    Renders the latest value, range and trend of every metric, with a
+    sparkline of the most recent samples.
+    """
+    samples = sampler.snapshot()
+    lines = [f"gopls metrics from {sampler.base_url}, sampled every {sampler.interval:g}s"]
+    if sampler.error:
+        lines.append(f"Last sample failed: {sampler.error}")
+    if not samples:
+        lines.append("Waiting for the first sample...")
+        return "\n".join(lines) + "\n"
+    span = samples[-1]["time"] - samples[0]["time"]
+    last = time.strftime("%H:%M:%S", time.localtime(samples[-1]["time"]))
+    lines.extend((f"{len(samples)} samples over {span:.0f}s, last at {last}", ""))
+    width = max(len(label) for _, label, _ in METRICS) + 2
+    for key, label, is_bytes in METRICS:
+        values = [sample["values"][key] for sample in samples]
+        trend = values[-1] - values[0]
+        trend_text = ("+" if trend >= 0 else "-") + _format(abs(trend), is_bytes)
+        lines.append(
+            f"{label:<{width}}{_format(values[-1], is_bytes):>14}  "
+            f"min {_format(min(values), is_bytes):>12}  max {_format(max(values), is_bytes):>12}  "
+            f"trend {trend_text:>13}  {sparkline(values[-SPARKLINE_WIDTH:])}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def open_dashboard(window: sublime.Window, base_url: str, interval: float, capacity: int) -> None:
+    """
+    Opens a view that shows the metrics of the gopls debug server at
+    `base_url` and is updated with every sample until it is closed.
+    """
+    for view in window.views():
+        if view.settings().get(DASHBOARD_SETTING) == base_url and view.id() in _dashboards:
+            window.focus_view(view)
+            return
+    view = window.new_file()
+    view.set_name("gopls metrics")
+    view.set_scratch(True)
+    view.set_read_only(True)
+    view.settings().set(DASHBOARD_SETTING, base_url)
+    view.settings().set("word_wrap", False)
+
+    def on_sample(sampler: MetricsSampler) -> None:
+        text = render_dashboard(sampler)
+
+        def update() -> None:
+            if view.is_valid():
+                view.run_command("gopls_replace_content", {"characters": text})
+            else:
+                sampler.stop()
+
+        sublime.set_timeout(update)
+
+    _dashboards[view.id()] = MetricsSampler(base_url, interval, capacity, on_sample).start()
+
+
+class GoplsMetricsDashboardListener(sublime_plugin.EventListener):
+    def on_close(self, view: sublime.View) -> None:
+        if sampler := _dashboards.pop(view.id(), None):
+            sampler.stop()
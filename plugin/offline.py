@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from pathlib import Path
+import hashlib
+import json
+import tempfile
+
+from LSP.plugin import parse_uri
+
+from .installer import GoInstallProcess
+from .installer import InstallError
+from .installer import InstallProgress
+
+MANIFEST_NAME = "manifest.json"
+PROXY_FILE_SUFFIXES = (".info", ".mod", ".zip")
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModuleBundle:
+    """
+    A directory holding everything `go install` needs to build gopls offline:
+
+        mod/cache/download/   a module cache, which doubles as a GOPROXY tree
+        manifest.json         the sha256 of every .info, .mod and .zip file
+
+    A bundle is prepared on a machine with network access and verified
+    against its manifest before it is used as the module proxy.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.modcache = self.root / "mod"
+        self.proxy_dir = self.modcache / "cache" / "download"
+        self.manifest = self.root / MANIFEST_NAME
+
+    @classmethod
+    def from_setting(cls, value: str) -> ModuleBundle | None:
+        path = Path(parse_uri(value)[1]) if value.startswith("file:") else Path(value)
+        return cls(path) if (path / MANIFEST_NAME).is_file() else None
+
+    def _proxy_files(self) -> list[Path]:
+        return sorted(
+            p for p in self.proxy_dir.rglob("*")
+            if p.suffix in PROXY_FILE_SUFFIXES and "sumdb" not in p.relative_to(self.proxy_dir).parts
+        )
+
+    def prepare(self, url: str, env_vars: dict, progress: InstallProgress, timeout: float | None = None) -> int:
+        """
+        Downloads `url` and all of its dependencies into the bundle by running
+        `go install` against it, then records the manifest. Returns the number
+        of module files in the bundle.
+        """
+        self.modcache.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory() as gobin:
+            env_vars["GOMODCACHE"] = str(self.modcache)
+            env_vars["GOBIN"] = gobin
+            env_vars["GOFLAGS"] = " ".join(filter(None, (env_vars.get("GOFLAGS", ""), "-modcacherw")))
+            install = GoInstallProcess(["install", "-x", url], env_vars, on_line=progress.on_line, timeout=timeout)
+            return_code = install.start().wait()
+            if return_code != 0:
+                raise InstallError(f"go installation error with return code {return_code}: {install.output_tail}")
+
+        files = {str(p.relative_to(self.proxy_dir).as_posix()): _file_digest(p) for p in self._proxy_files()}
+        self.manifest.write_text(json.dumps({"module": url, "files": files}, indent=2))
+        return len(files)
+
+    def verify(self) -> list[str]:
+        """
+        Returns a description of every file that is missing from the bundle or
+        does not match the checksum recorded in its manifest.
+        """
+        try:
+            files: dict[str, str] = json.loads(self.manifest.read_text())["files"]
+        except (OSError, ValueError, KeyError) as ex:
+            return [f"unreadable manifest {self.manifest}: {ex}"]
+        problems = []
+        for name, sha256 in files.items():
+            path = self.proxy_dir / name
+            if not path.is_file():
+                problems.append(f"missing {name}")
+            elif _file_digest(path) != sha256:
+                problems.append(f"checksum mismatch for {name}")
+        return problems
+
+
+def offline_env_vars(proxy: str) -> dict[str, str]:
+    """
+    Returns the environment that makes `go` resolve modules from the local
+    proxy `proxy` only. `proxy` is either a module bundle, a directory laid out
+    like a GOPROXY or a `file://` URL to one.
+    """
+    bundle = ModuleBundle.from_setting(proxy)
+    if bundle is not None:
+        directory = bundle.proxy_dir
+    else:
+        directory = Path(parse_uri(proxy)[1]) if proxy.startswith("file:") else Path(proxy)
+    return {
+        "GOPROXY": directory.resolve().as_uri(),
+        "GOSUMDB": "off",
+        "GOTOOLCHAIN": "local",
+    }
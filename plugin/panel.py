@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import sublime
+
+
+class OutputPanel:
+    """
+    An output panel that can be written to from any thread. All view access is
+    deferred to the main thread, in the order the calls were made.
+    """
+
+    def __init__(
+        self,
+        window: sublime.Window | None,
+        name: str,
+        syntax: str | None = None,
+        settings: dict | None = None,
+    ) -> None:
+        self.window = window
+        self.name = name
+        self.syntax = syntax
+        self.settings = settings or {}
+        self._view: sublime.View | None = None
+        sublime.set_timeout(self._create)
+
+    def _create(self) -> None:
+        if not self.window:
+            return
+        # Creating a panel that already exists clears it for the new output.
+        view = self.window.create_output_panel(self.name)
+        view.settings().set("word_wrap", False)
+        view.settings().set("scroll_past_end", False)
+        for key, value in self.settings.items():
+            view.settings().set(key, value)
+        if self.syntax:
+            view.assign_syntax(self.syntax)
+        self._view = view
+
+    @property
+    def view(self) -> sublime.View | None:
+        return self._view
+
+    def append(self, text: str) -> None:
+        def run() -> None:
+            if self._view is not None:
+                self._view.run_command("append", {"characters": text, "force": True, "scroll_to_end": True})
+
+        sublime.set_timeout(run)
+
+    def show(self) -> None:
+        def run() -> None:
+            if self.window:
+                self.window.run_command("show_panel", {"panel": f"output.{self.name}"})
+
+        sublime.set_timeout(run)
+
+    def status(self, message: str) -> None:
+        def run() -> None:
+            if self.window:
+                self.window.status_message(message)
+
+        sublime.set_timeout(run)
+
+    def replace(self, text: str) -> None:
+        """
+        Replaces the whole content of the panel with `text`.
+        """
+
+        def run() -> None:
+            if self._view is not None:
+                self._view.run_command("gopls_replace_content", {"characters": text})
+
+        sublime.set_timeout(run)
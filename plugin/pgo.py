@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from pathlib import Path
+import contextlib
+import hashlib
+import os
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+import sublime_plugin
+
+from .debugserver import fetch
+from .installer import GoplsStore
+from .installer import InstallError
+from .process import GoProcess
+
+PROFILE_SECONDS = 30
+# A profile is collected at most this often, and only while Go files are being edited.
+COLLECT_INTERVAL_SECONDS = 10 * 60
+PROFILE_RETENTION = 50
+MERGE_TIMEOUT_SECONDS = 300
+
+_last_collected = 0.0
+_collecting = False
+_collect_lock = threading.Lock()
+# Overrides the `pgoBinary` setting after `LSP-gopls: Toggle Profile-Guided gopls` until Sublime Text restarts.
+_enabled: bool | None = None
+# The `pgoProfiling` setting of the latest session of every window.
+_profiling: dict[int, bool] = {}
+
+
+def pgo_store(storage_path: str | Path) -> GoplsStore:
+    """
+    Returns the store of the profile-guided gopls builds, which is kept apart
+    from the plain builds so both can be switched between. Builds are named
+    `<version>+<profile digest>`.
+    """
+    return GoplsStore(Path(storage_path, "pgo"))
+
+
+def pgo_binary(storage_path: str | Path, version: str) -> Path | None:
+    """
+    Returns the current profile-guided build of gopls `version`, if there is
+    one.
+    """
+    store = pgo_store(storage_path)
+    build = store.current_version()
+    if build and build.partition("+")[0] == version and store.is_installed(build):
+        return store.binary_path(build)
+    return None
+
+
+def is_pgo_enabled(settings: DottedDict) -> bool:
+    return bool(settings.get("pgoBinary")) if _enabled is None else _enabled
+
+
+def toggle_pgo(settings: DottedDict) -> bool:
+    global _enabled
+    _enabled = not is_pgo_enabled(settings)
+    return _enabled
+
+
+class CpuProfiles:
+    """
+    CPU profiles of gopls taken from its debug server while Go files are being
+    edited, stored in plugin storage as `cpu-<timestamp>.pprof` and merged into
+    `default.pgo` for profile-guided builds.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.root = Path(storage_path, "pgo", "profiles")
+        self.merged = Path(storage_path, "pgo", "default.pgo")
+
+    def list(self) -> list[Path]:
+        """
+        Returns the stored profiles, oldest first.
+        """
+        return sorted(self.root.glob("cpu-*.pprof"))
+
+    def collect(self, base_url: str, seconds: int = PROFILE_SECONDS) -> Path:
+        """
+        Records a CPU profile of the gopls debug server at `base_url` for
+        `seconds` and removes all but the newest `PROFILE_RETENTION` profiles.
+        Raises `OSError` if the server cannot be reached.
+        """
+        profile = fetch(base_url, f"/debug/pprof/profile?seconds={seconds}", timeout=seconds + 10)
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"cpu-{time.strftime('%Y%m%d-%H%M%S')}.pprof"
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_bytes(profile)
+        os.replace(tmp, path)
+        for old in self.list()[:-PROFILE_RETENTION]:
+            with contextlib.suppress(OSError):
+                old.unlink()
+        return path
+
+    def merge(self, env_vars: dict) -> str:
+        """
+        Merges the stored profiles into `default.pgo` with `go tool pprof` and
+        returns a digest of the merged profile. Raises `InstallError` if there
+        is nothing to merge or the merge fails.
+        """
+        profiles = self.list()
+        if not profiles:
+            raise InstallError("no CPU profiles collected yet, enable `pgoProfiling` and edit some Go code")
+        args = ["tool", "pprof", "-proto", f"-output={self.merged}", *map(str, profiles)]
+        process = GoProcess(args, env_vars, timeout=MERGE_TIMEOUT_SECONDS).start()
+        try:
+            returncode = process.wait()
+        except (process.cancelled_error, process.timeout_error) as ex:
+            raise InstallError(str(ex)) from ex
+        if returncode != 0 or not self.merged.is_file():
+            raise InstallError(f"merging {len(profiles)} CPU profiles failed: {process.output_tail}")
+        return hashlib.sha256(self.merged.read_bytes()).hexdigest()[:12]
+
+
+def configure_profiling(window_id: int, settings: DottedDict) -> None:
+    _profiling[window_id] = bool(settings.get("pgoProfiling"))
+
+
+def _is_due() -> bool:
+    return not _collecting and time.monotonic() - _last_collected >= COLLECT_INTERVAL_SECONDS
+
+
+def should_collect(enabled: bool) -> bool:
+    """
+    Returns whether a profile is due, and if so reserves it for the caller, who
+    must call `collected` once done. While profiling is disabled the next check
+    is postponed by the collection interval as well.
+    """
+    global _collecting, _last_collected
+    with _collect_lock:
+        if not _is_due():
+            return False
+        _last_collected = time.monotonic()
+        _collecting = enabled
+        return enabled
+
+
+def collected() -> None:
+    global _collecting
+    with _collect_lock:
+        _collecting = False
+
+
+class GoplsPgoProfileListener(sublime_plugin.EventListener):
+    def on_modified_async(self, view: sublime.View) -> None:
+        # Checked first, as this runs on every keystroke.
+        if not _is_due() or not view.match_selector(0, "source.go"):
+            return
+        if should_collect(bool((window := view.window()) and _profiling.get(window.id()))):
+            sublime.set_timeout(lambda: view.run_command("gopls_collect_cpu_profile"))
@@ -2,142 +2,327 @@ from __future__ import annotations
 
 from pathlib import Path
 import os
+import threading
 
+from LSP.plugin import DottedDict
 from LSP.plugin import LspPlugin
 from LSP.plugin import OnPreStartContext
 from LSP.plugin import PluginStartError
 from LSP.plugin import Promise
-from LSP.plugin import Session
 from LSP.plugin import command_handler
-from LSP.plugin import parse_uri
+from LSP.plugin import notification_handler
 import sublime
 
+from .artifacts import ArtifactCache
+from .artifacts import artifact_key
+from .caches import CacheManager
+from .caches import MEGABYTE
 from .constants import GOPLS_BASE_URL
-from .constants import RE_VER
+from .daemon import remote_flags
+from .daemon import start_supervisor
+from .daemon import use_shared_daemon
+from .hibernation import start_monitor
+from .installer import GoplsStore
+from .installer import InstallError
+from .installer import InstallProgress
+from .installer import active_install
+from .installer import build_gopls
+from .offline import ModuleBundle
+from .offline import offline_env_vars
+from .pgo import CpuProfiles
+from .pgo import configure_profiling
+from .pgo import is_pgo_enabled
+from .pgo import pgo_binary
+from .pgo import pgo_store
+from .prewarm import prewarm_folders
+from .profiling import profile_package
+from .rpctrace import is_trace_enabled
+from .rpctrace import trace_flags
+from .startup import StartupRecord
+from .startup import begin_start
+from .startup import launched
+from .startup import report_progress
+from .testing import Terminus
+from .testing import open_tests_in_terminus
+from .testing import run_benchmarks
+from .testing import run_pattern
+from .testing import run_tests_in_panel
+from .toolchain import environment
+from .toolchain import parse_go_version
+from .toolchain import probe_go_toolchain
 from .types import GoplsRunTestsArgument
-from .utils import get_setting
 from .utils import is_binary_available
-from .utils import run_go_command
-from .utils import to_int
 from .version import VERSION
-
-try:
-    import Terminus  # type: ignore
-except ImportError:
-    Terminus = None
-
-
-def open_tests_in_terminus(
-    session: Session,
-    window: sublime.Window | None,
-    arguments: list[GoplsRunTestsArgument],
-) -> None:
-    if not window:
-        return
-
-    if (arguments[0]["Tests"] is None) or (not arguments[0]["Tests"]):
-        return
-
-    if not window.active_view():
-        return
-
-    uri = arguments[0]["URI"]
-    filepath = parse_uri(uri)
-    go_test_directory = str(Path(filepath[1]).parent)
-    args = [go_test_directory]
-    for test_command in arguments[0]["Tests"]:
-        command_to_run = ["go", "test"] + args + ["-v", "-count=1", "-run", f"^{test_command}\\$"]
-        terminus_args = {
-            "title": "Go Test",
-            "cmd": command_to_run,
-            "cwd": go_test_directory,
-            "auto_close": get_setting(session, "closeTestResultsWhenFinished", False),
-        }
-        if get_setting(session, "runTestsInPanel", True):
-            terminus_args["panel_name"] = "Go Test"
-        window.run_command("terminus_open", terminus_args)
+from .watch import configure_watch
+from .watchdog import start_watchdog
+from .workspace import WorkspaceScans
+from .workspace import tune_folder
 
 
 class Gopls(LspPlugin):
+    _background_build: threading.Thread | None = None
+    _cache_trim: threading.Thread | None = None
+    _cache_trim_lock = threading.Lock()
+
     @classmethod
     def server_version(cls) -> str:
         return VERSION
 
     @classmethod
     def current_server_version(cls) -> str | None:
-        try:
-            return Path(cls.plugin_storage_path, "VERSION").read_text()
-        except OSError:
-            return None
+        return GoplsStore(cls.plugin_storage_path).current_version()
 
     @classmethod
     def _is_gopls_installed(cls) -> bool:
-        binary = "gopls.exe" if sublime.platform() == "windows" else "gopls"
-        command = str(Path(cls.plugin_storage_path, "bin", binary))
-        gopls_binary = str(sublime.expand_variables(command, {"storage_path": str(cls.plugin_storage_path)}))
-
-        if sublime.platform() == "windows" and not gopls_binary.endswith(".exe"):
-            gopls_binary = gopls_binary + ".exe"
-
-        return is_binary_available(gopls_binary)
+        store = GoplsStore(cls.plugin_storage_path)
+        return store.is_installed(store.current_version())
 
     @classmethod
     def _get_go_version(cls) -> tuple[int, int, int]:
-        stdout, stderr, return_code = run_go_command(sub_command="version", env_vars=cls._go_runtime_env_vars())
-        if return_code != 0:
-            raise ValueError("go version error", stderr, "returncode", return_code)
-
-        if stdout == "":
-            return (0, 0, 0)
-
-        matches = RE_VER.search(stdout)
-        if matches is None:
-            return (0, 0, 0)
-        return (
-            to_int(matches.group(1)),
-            to_int(matches.group(2)),
-            to_int(matches.group(3)),
-        )
+        # GOVERSION is only reported since Go 1.16, older toolchains yield (0, 0, 0).
+        return parse_go_version(probe_go_toolchain()["goversion"])
 
     @classmethod
-    def _go_runtime_env_vars(cls) -> dict:
-        env_vars = dict(os.environ)
+    def _go_runtime_env_vars(cls, settings: DottedDict | None = None) -> dict:
+        env_vars = environment()
         env_vars["GO111MODULE"] = "on"
         env_vars["GOPATH"] = str(cls.plugin_storage_path)
         env_vars["GOBIN"] = str(Path(cls.plugin_storage_path, "bin"))
-        env_vars["GOCACHE"] = str(Path(cls.plugin_storage_path, "go-build"))
+        if settings is not None and settings.get("shareGoCaches", False):
+            toolchain = probe_go_toolchain()
+            env_vars["GOCACHE"] = toolchain["gocache"]
+            env_vars["GOMODCACHE"] = toolchain["gomodcache"]
+        else:
+            env_vars["GOCACHE"] = str(Path(cls.plugin_storage_path, "go-build"))
+            env_vars["GOMODCACHE"] = str(Path(cls.plugin_storage_path, "pkg", "mod"))
+        if settings is not None and (proxy := settings.get("installProxy")):
+            env_vars.update(offline_env_vars(proxy))
         return env_vars
 
+    @classmethod
+    def _build_gopls(cls, store: GoplsStore, version: str, settings: DottedDict, background: bool) -> None:
+        toolchain = probe_go_toolchain()
+        go_version = parse_go_version(toolchain["goversion"])
+        go_sub_command = "get" if go_version < (1, 16, 0) else "install"
+        goversion, goos, goarch = toolchain["goversion"], toolchain["goos"], toolchain["goarch"]
+        cache = ArtifactCache(Path(cls.plugin_storage_path, "artifacts"), settings.get("artifactCacheSeeds"))
+        key = artifact_key(version, goversion, goos, goarch)
+        bundle = ModuleBundle.from_setting(proxy) if (proxy := settings.get("installProxy")) else None
+        if bundle is not None and (problems := bundle.verify()):
+            raise InstallError(f"offline module bundle {bundle.root} failed verification: {', '.join(problems)}")
+        title = f"LSP-gopls: {'building' if background else 'installing'} gopls v{version}"
+        build_gopls(
+            store,
+            version,
+            go_sub_command=go_sub_command,
+            url=GOPLS_BASE_URL.format(tag=version),
+            env_vars=cls._go_runtime_env_vars(settings),
+            progress=InstallProgress(sublime.active_window(), title),
+            timeout=settings.get("installTimeout") or None,
+            restore=lambda binary: cache.restore(key, binary),
+            on_built=lambda binary: cache.add(key, binary, version, goversion, goos, goarch),
+        )
+
+    @classmethod
+    def _build_gopls_in_background(cls, store: GoplsStore, version: str, settings: DottedDict) -> None:
+        if cls._background_build is not None and cls._background_build.is_alive():
+            return
+
+        def run() -> None:
+            try:
+                cls._build_gopls(store, version, settings, background=True)
+            except (InstallError, ValueError, OSError) as ex:
+                print(f"LSP-gopls: background build of gopls v{version} failed: {ex}")
+
+        cls._background_build = threading.Thread(target=run, name="gopls-background-build", daemon=True)
+        cls._background_build.start()
+
+    @classmethod
+    def build_pgo_gopls(cls, settings: DottedDict) -> str:
+        """
+        Merges the collected CPU profiles of gopls and builds the current gopls
+        version with the merged profile into the store of profile-guided
+        builds, where it becomes the current build. Earlier builds are pruned
+        like plain versions. Returns the name of the build and raises
+        `InstallError` or `ValueError` if it cannot be built.
+        """
+        toolchain = probe_go_toolchain()
+        if parse_go_version(toolchain["goversion"]) < (1, 21, 0):
+            raise InstallError(f"profile-guided builds need Go 1.21 or newer, found {toolchain['goversion']}")
+        env_vars = cls._go_runtime_env_vars(settings)
+        profiles = CpuProfiles(cls.plugin_storage_path)
+        digest = profiles.merge(dict(env_vars))
+        version = cls.server_version()
+        build = f"{version}+{digest}"
+        store = pgo_store(cls.plugin_storage_path)
+        build_gopls(
+            store,
+            build,
+            go_sub_command="install",
+            url=GOPLS_BASE_URL.format(tag=version),
+            env_vars=env_vars,
+            progress=InstallProgress(sublime.active_window(), f"LSP-gopls: building profile-guided gopls v{version}"),
+            timeout=settings.get("installTimeout") or None,
+            build_flags=[f"-pgo={profiles.merged}"],
+        )
+        store.set_current(build)
+        store.prune(keep=settings.get("installRetention", 1))
+        return build
+
+    @classmethod
+    def cache_manager(cls) -> CacheManager:
+        return CacheManager(Path(cls.plugin_storage_path, "go-build"), Path(cls.plugin_storage_path, "pkg", "mod"))
+
+    @classmethod
+    def trim_caches(cls, settings: DottedDict) -> int:
+        """
+        Evicts entries from the plugin's own Go caches until they fit into the
+        `cacheSizeLimit` budget. Caches shared with the user are never trimmed,
+        and neither are caches that a running `go install` may be using.
+        """
+        limit = settings.get("cacheSizeLimit", 0)
+        if not limit or settings.get("shareGoCaches", False):
+            return 0
+        if active_install() is not None or (cls._background_build and cls._background_build.is_alive()):
+            return 0
+        with cls._cache_trim_lock:
+            freed = cls.cache_manager().trim(limit * MEGABYTE)
+        if freed:
+            print(f"LSP-gopls: trimmed {freed // MEGABYTE} MB from the Go caches")
+        return freed
+
+    @classmethod
+    def _trim_caches_in_background(cls, settings: DottedDict) -> None:
+        # Walking the caches can take long, so it neither blocks the async thread nor runs twice at once.
+        if cls._cache_trim is not None and cls._cache_trim.is_alive():
+            return
+        cls._cache_trim = threading.Thread(target=cls.trim_caches, args=(settings,), name="gopls-trim", daemon=True)
+        cls._cache_trim.start()
+
     @classmethod
     def on_pre_start_async(cls, context: OnPreStartContext) -> None:
-        is_managed = context.configuration.settings.get("manageGoplsBinary", True)
-        if is_managed and (not cls._is_gopls_installed() or (cls.server_version() != cls.current_server_version())):
-            if not is_binary_available("go"):
-                raise PluginStartError("go binary not found in $PATH")
+        window_id = context.window.id()
+        record = begin_start(window_id, cls.plugin_storage_path, [folder.path for folder in context.workspace_folders])
+        try:
+            cls._prepare_start(context, record)
+        except Exception as ex:
+            record.finish(f"failed: {ex}")
+            raise
+        launched(window_id, record)
+
+    @classmethod
+    def _prepare_start(cls, context: OnPreStartContext, record: StartupRecord) -> None:
+        settings = context.configuration.settings
+        if limit := settings.get("memoryLimit"):
+            # A soft limit makes the garbage collector work harder before the watchdog has to restart gopls.
+            context.configuration.env["GOMEMLIMIT"] = f"{limit}MiB"
+        start_watchdog(cls.plugin_storage_path, context.window.id(), settings)
+        if (tuning := settings.get("workspaceTuning") or "off") != "off":
+            with record.span("workspace scan"):
+                cls._tune_workspace(context, apply=tuning == "apply")
+        start_monitor(cls.plugin_storage_path, context.window.id(), settings)
+        configure_profiling(context.window.id(), settings)
+        configure_watch(context.window.id(), settings)
+        if settings.get("manageGoplsBinary", True):
+            cls._use_managed_binary(context, record)
+        command = context.configuration.command
+        if is_trace_enabled(settings):
+            command[1:1] = trace_flags(cls.plugin_storage_path, context.window.id())
+        if shared := use_shared_daemon(settings, command):
+            command[1:1] = remote_flags(settings)
+        start_supervisor(command[0], environment(), cls.plugin_storage_path, context.window.id(), shared)
+        if settings.get("prewarmWorkspace"):
+            folders = [folder.path for folder in context.workspace_folders]
+            prewarm_folders(context.window, folders, {**environment(), **context.configuration.env}, settings)
+
+    @classmethod
+    def _tune_workspace(cls, context: OnPreStartContext, apply: bool) -> None:
+        settings = context.configuration.settings
+        scans = WorkspaceScans(cls.plugin_storage_path)
+        for folder in context.workspace_folders:
+            try:
+                derived, report = tune_folder(folder.path, settings, scans, wait=False)
+            except OSError as ex:
+                print(f"LSP-gopls: could not scan {folder.path}: {ex}")
+                continue
+            print(f"LSP-gopls: workspace scan of {report}")
+            if apply:
+                for key, value in derived.items():
+                    settings.set(key, value)
+
+    @classmethod
+    def _use_managed_binary(cls, context: OnPreStartContext, record: StartupRecord) -> None:
+        settings = context.configuration.settings
+        store = GoplsStore(cls.plugin_storage_path)
+        version = cls.server_version()
+        with record.span("install check"):
+            current = store.current_version()
+            installed = store.is_installed(version)
+        if not installed:
+            with record.span("binary check"):
+                if not is_binary_available("go"):
+                    raise PluginStartError("go binary not found in $PATH")
 
             os.makedirs(cls.plugin_storage_path, exist_ok=True)
 
-            go_version = cls._get_go_version()
-            go_sub_command = "get" if go_version < (1, 16, 0) else "install"
-            _, stderr, return_code = run_go_command(
-                sub_command=go_sub_command,
-                url=GOPLS_BASE_URL.format(tag=VERSION),
-                env_vars=cls._go_runtime_env_vars(),
-            )
-            if return_code != 0:
-                raise PluginStartError(f"go installation error with return code {return_code}: {stderr}")
+            if store.is_installed(current):
+                # Keep serving the previous version, the new one is picked up on the next start.
+                cls._build_gopls_in_background(store, version, settings)
+            else:
+                try:
+                    with record.span("go version"):
+                        # Probing the toolchain here leaves the install with the cached result.
+                        cls._get_go_version()
+                    with record.span("install"):
+                        cls._build_gopls(store, version, settings, background=False)
+                except (InstallError, ValueError) as ex:
+                    raise PluginStartError(str(ex)) from ex
+                current = None
 
-            Path(cls.plugin_storage_path, "VERSION").write_text(cls.server_version())
+        if current != version and store.is_installed(version):
+            store.set_current(version)
+            store.prune(keep=settings.get("installRetention", 1))
+            current = version
+
+        assert current is not None
+        binary = store.binary_path(current)
+        if is_pgo_enabled(settings):
+            if pgo := pgo_binary(cls.plugin_storage_path, current):
+                binary = pgo
+            else:
+                print(f"LSP-gopls: no profile-guided build of gopls v{current}, using the plain build")
+        context.configuration.command[0] = str(binary)
+        cls._trim_caches_in_background(settings)
+
+    @notification_handler("$/progress")
+    def on_progress(self, params: dict) -> None:
+        if session := self.weaksession():
+            report_progress(session.window.id(), params)
 
     @command_handler("gopls.run_tests")
     def on_gopls_run_tests(self, arguments: list[GoplsRunTestsArgument] | None) -> Promise[None]:
-        if not Terminus or not arguments:
+        if not arguments:
             return Promise.resolve(None)
 
         if not (session := self.weaksession()):
             return Promise.resolve(None)
         try:
-            return Promise.resolve(open_tests_in_terminus(session, sublime.active_window(), arguments))
+            storage_path = str(self.plugin_storage_path)
+            on_regression = None
+            if session.config.settings.get("profileRegressions"):
+
+                def on_regression(directory: str, benchmarks: list[str]) -> None:
+                    profile_package(
+                        sublime.active_window(), session.config.settings, directory, "^$", run_pattern(benchmarks),
+                        storage_path,
+                    )
+
+            run_benchmarks(session, sublime.active_window(), arguments, storage_path, on_regression)
+            runner = session.config.settings.get("testRunner") or "auto"
+            if Terminus and runner in ("auto", "terminus"):
+                open_tests_in_terminus(session, sublime.active_window(), arguments)
+            else:
+                run_tests_in_panel(session, sublime.active_window(), arguments, storage_path)
         except Exception as ex:
             print(f"Exception handling command `gopls.run_tests`: {ex}")
 
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import NamedTuple
+import os
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+
+from .durations import find_module
+from .process import GoProcess
+from .process import ProcessCancelledError
+from .process import ProcessTimeoutError
+
+PREWARM_TIMEOUT_SECONDS = 900
+# Folders queued beyond this many are dropped, they are warmed on a later start.
+MAX_QUEUED_FOLDERS = 8
+STATUS_THROTTLE_SECONDS = 1
+
+_prewarmer: WorkspacePrewarmer | None = None
+_prewarmer_lock = threading.Lock()
+
+
+class PrewarmJob(NamedTuple):
+    window: sublime.Window | None
+    root: str
+    env_vars: dict
+    build_flags: list[str]
+
+
+def _signature(root: str) -> tuple[str, float, float]:
+    mtimes = []
+    for name in ("go.mod", "go.sum"):
+        try:
+            mtimes.append(os.stat(os.path.join(root, name)).st_mtime)
+        except OSError:
+            mtimes.append(0.0)
+    return (root, *mtimes)  # type: ignore
+
+
+def prewarm_commands(build_flags: list[str]) -> list[list[str]]:
+    """
+    Returns the `go` commands that download the modules of a module and build
+    the export data of every package it depends on. The build uses half of the
+    cores at most.
+    """
+    parallel = max(1, (os.cpu_count() or 2) // 2)
+    return [["mod", "download"], ["list", "-deps", "-export", "-e", f"-p={parallel}", *build_flags, "./..."]]
+
+
+class WorkspacePrewarmer:
+    """
+    Warms the module cache and the build cache for the modules of workspace
+    folders, so that gopls finds its dependencies downloaded and compiled when
+    the first interactive request arrives. A single background thread works
+    through the queued modules one low priority `go` command at a time. A
+    module is warmed once per change of its `go.mod` or `go.sum`.
+    """
+
+    def __init__(self) -> None:
+        self._queue: deque[PrewarmJob] = deque()
+        self._warmed: set[tuple[str, float, float]] = set()
+        self._current: GoProcess | None = None
+        # Set by `cancel` and checked before every step, so a job stops between its steps as well.
+        self._cancelled = False
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(self, job: PrewarmJob) -> bool:
+        signature = _signature(job.root)
+        with self._lock:
+            if signature in self._warmed or any(queued.root == job.root for queued in self._queue):
+                return False
+            if len(self._queue) >= MAX_QUEUED_FOLDERS:
+                return False
+            self._queue.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="gopls-prewarm", daemon=True)
+                self._thread.start()
+        return True
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._queue.clear()
+            self._cancelled = True
+            current = self._current
+        if current is not None:
+            current.cancel()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._thread = None
+                    return
+                job = self._queue.popleft()
+                # Jobs are only queued after the last `cancel`, which emptied the queue.
+                self._cancelled = False
+            self._warm(job)
+
+    def _status(self, job: PrewarmJob, message: str) -> None:
+        if job.window is not None:
+            sublime.set_timeout(lambda: job.window.status_message(f"LSP-gopls: {message}"))  # type: ignore
+
+    def _warm(self, job: PrewarmJob) -> None:
+        name = os.path.basename(job.root)
+        started = time.monotonic()
+        packages = 0
+        last_status = 0.0
+
+        def on_line(_: str) -> None:
+            nonlocal packages, last_status
+            packages += 1
+            if (now := time.monotonic()) - last_status >= STATUS_THROTTLE_SECONDS:
+                last_status = now
+                self._status(job, f"pre-warming {name}: {packages} packages ({now - started:.0f}s)")
+
+        signature = _signature(job.root)
+        for step, args in enumerate(prewarm_commands(job.build_flags), start=1):
+            self._status(job, f"pre-warming {name}: go {' '.join(args[:3])} (step {step} of 2)")
+            # Only `go list` prints a line per package, `go mod download` is silent unless it fails.
+            process = GoProcess(
+                args,
+                dict(job.env_vars),
+                on_line=on_line if args[0] == "list" else None,
+                timeout=PREWARM_TIMEOUT_SECONDS,
+                cwd=job.root,
+                low_priority=True,
+            )
+            with self._lock:
+                if self._cancelled:
+                    print(f"LSP-gopls: pre-warming {job.root} stopped: cancelled")
+                    self._status(job, f"pre-warming {name} stopped")
+                    return
+                self._current = process
+            try:
+                returncode = process.start().wait()
+            except (ProcessCancelledError, ProcessTimeoutError) as ex:
+                print(f"LSP-gopls: pre-warming {job.root} stopped: {ex}")
+                self._status(job, f"pre-warming {name} stopped")
+                return
+            finally:
+                with self._lock:
+                    self._current = None
+            if returncode != 0:
+                print(f"LSP-gopls: pre-warming {job.root} failed at `go {' '.join(args)}`:\n{process.output_tail}")
+                self._status(job, f"pre-warming {name} failed, see the console")
+                return
+        with self._lock:
+            self._warmed.add(signature)
+        elapsed = time.monotonic() - started
+        print(f"LSP-gopls: pre-warmed {job.root} in {elapsed:.1f}s, {packages} packages")
+        self._status(job, f"pre-warmed {name} in {elapsed:.0f}s")
+
+
+def prewarmer() -> WorkspacePrewarmer:
+    global _prewarmer
+    with _prewarmer_lock:
+        if _prewarmer is None:
+            _prewarmer = WorkspacePrewarmer()
+        return _prewarmer
+
+
+def prewarm_folders(window: sublime.Window | None, folders: list[str], env_vars: dict, settings: DottedDict) -> None:
+    """
+    Queues the modules of `folders` for pre-warming, with the environment and
+    build flags gopls loads them with.
+    """
+    env_vars = {**env_vars, **(settings.get("gopls.env") or {})}
+    build_flags = list(settings.get("gopls.buildFlags") or [])
+    for folder in folders:
+        if (module := find_module(folder)) is not None:
+            prewarmer().enqueue(PrewarmJob(window, module[0], env_vars, build_flags))
+
+
+def cancel_prewarm() -> bool:
+    with _prewarmer_lock:
+        current = _prewarmer
+    if current is None or not current.is_running:
+        return False
+    current.cancel()
+    return True
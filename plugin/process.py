@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+from .utils import get_startupinfo
+
+ERROR_TAIL_LINES = 20
+# The niceness of processes that should only use otherwise idle CPU time.
+LOW_PRIORITY_NICENESS = 10
+
+
+def _low_priority_prefix() -> list[str]:
+    # Starting `go` through `nice` lowers its priority before it runs, so the compilers it starts inherit it.
+    if sys.platform != "win32" and (nice := shutil.which("nice")):
+        return [nice, "-n", str(LOW_PRIORITY_NICENESS)]
+    return []
+
+
+class ProcessCancelledError(Exception):
+    pass
+
+
+class ProcessTimeoutError(Exception):
+    pass
+
+
+class GoProcess:
+    """
+    Runs a `go` command on a background thread, streaming its combined output
+    line by line to `on_line`. The process can be cancelled from any thread and
+    is killed once `timeout` seconds have elapsed. A `low_priority` process
+    yields the CPU to the editor and gopls.
+    """
+
+    cancelled_error: type[Exception] = ProcessCancelledError
+    timeout_error: type[Exception] = ProcessTimeoutError
+
+    def __init__(
+        self,
+        args: list[str],
+        env_vars: dict,
+        on_line: Callable[[str], None] | None = None,
+        timeout: float | None = None,
+        cwd: str | None = None,
+        low_priority: bool = False,
+    ) -> None:
+        self.args = args
+        self.env_vars = env_vars
+        self.on_line = on_line
+        self.timeout = timeout
+        self.cwd = cwd
+        self.low_priority = low_priority
+        self.returncode: int | None = None
+        self.tail: deque[str] = deque(maxlen=ERROR_TAIL_LINES)
+        self._process: subprocess.Popen | None = None
+        self._thread: threading.Thread | None = None
+        self._done = threading.Event()
+        self._cancelled = False
+        self._timed_out = False
+
+    def start(self) -> GoProcess:
+        self._thread = threading.Thread(target=self._run, name=f"go-{self.args[0]}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _on_exit(self) -> None:
+        pass
+
+    def _run(self) -> None:
+        try:
+            with tempfile.TemporaryDirectory() as tempdir:
+                self.env_vars["GOTMPDIR"] = tempdir
+                prefix = _low_priority_prefix() if self.low_priority else []
+                self._process = subprocess.Popen(
+                    [*prefix, "go", *self.args],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    env=self.env_vars,
+                    cwd=self.cwd,
+                    universal_newlines=True,
+                    startupinfo=get_startupinfo(),
+                    creationflags=subprocess.BELOW_NORMAL_PRIORITY_CLASS  # type: ignore
+                    if self.low_priority and sys.platform == "win32"
+                    else 0,
+                )
+                if self.low_priority and sys.platform != "win32" and not prefix:
+                    with contextlib.suppress(OSError):
+                        os.setpriority(os.PRIO_PROCESS, self._process.pid, LOW_PRIORITY_NICENESS)
+                if self._cancelled:
+                    self._process.kill()
+                assert self._process.stdout is not None
+                for line in self._process.stdout:
+                    self.tail.append(line.rstrip())
+                    if self.on_line:
+                        self.on_line(line)
+                self.returncode = self._process.wait()
+        except OSError as ex:
+            self.tail.append(str(ex))
+            self.returncode = -1
+        finally:
+            self._on_exit()
+            self._done.set()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and not self._done.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+
+    def wait(self) -> int:
+        """
+        Blocks until the process exits and returns its exit code. Raises
+        `cancelled_error` or `timeout_error` if the process was stopped before
+        it could finish.
+        """
+        if not self._done.wait(self.timeout):
+            self._timed_out = True
+            self.cancel()
+            self._done.wait()
+        if self._timed_out:
+            raise self.timeout_error(f"`go {' '.join(self.args)}` timed out after {self.timeout:.0f}s")
+        if self._cancelled:
+            raise self.cancelled_error(f"`go {' '.join(self.args)}` was cancelled")
+        return self.returncode if self.returncode is not None else -1
+
+    @property
+    def output_tail(self) -> str:
+        return "\n".join(self.tail)
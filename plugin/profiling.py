@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from pathlib import Path
+import hashlib
+import html
+import os
+import re
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+import sublime_plugin
+
+from .panel import OutputPanel
+from .process import GoProcess
+from .process import ProcessCancelledError
+from .testing import go_test_env_vars
+from .types import GoProfileHotspot
+
+PROFILE_PANEL_NAME = "gopls_profile"
+PROFILES = (("cpu", "cpu", "region.redish"), ("mem", "alloc_space", "region.orangish"))
+HOTSPOT_NODE_COUNT = 200
+RE_PPROF_ROW = re.compile(
+    r"^\s*(?P<flat>[\d.]+[^\s\d]*)\s+(?P<flat_percent>[\d.]+%)\s+[\d.]+%\s+"
+    r"(?P<cum>[\d.]+[^\s\d]*)\s+(?P<cum_percent>[\d.]+%)\s+(?P<function>\S+)"
+    r"(?:\s+(?P<file>.+?):(?P<line>\d+))?(?:\s+\(inline\))?\s*$"
+)
+
+# Hotspots of the last profiling run by kind and then by file, so that views
+# opened after the run are annotated too.
+_hotspots: dict[str, dict[str, list[GoProfileHotspot]]] = {}
+_hotspots_lock = threading.Lock()
+
+
+def parse_pprof_top(output: str) -> list[GoProfileHotspot]:
+    """
+    Parses the rows of `go tool pprof -top`. With `-lines`, every row carries
+    the source location it belongs to.
+    """
+    hotspots = []
+    for line in output.splitlines():
+        if (matches := RE_PPROF_ROW.match(line)) is None:
+            continue
+        hotspots.append(
+            GoProfileHotspot(
+                function=matches.group("function"),
+                file=matches.group("file") or "",
+                line=int(matches.group("line") or 0),
+                flat=matches.group("flat"),
+                flat_percent=matches.group("flat_percent"),
+                cum=matches.group("cum"),
+                cum_percent=matches.group("cum_percent"),
+            )
+        )
+    return hotspots
+
+
+def _file_key(file_name: str) -> str:
+    return os.path.normcase(os.path.realpath(file_name))
+
+
+def _annotate_view(view: sublime.View) -> None:
+    file_name = view.file_name()
+    if not file_name:
+        return
+    key = _file_key(file_name)
+    with _hotspots_lock:
+        hotspots = {kind: list(files.get(key, ())) for kind, files in _hotspots.items()}
+    for kind, _, scope in PROFILES:
+        lines: dict[int, GoProfileHotspot] = {}
+        for hotspot in hotspots.get(kind, ()):
+            # pprof sorts by flat cost, so the first row of a line is its hottest function.
+            lines.setdefault(hotspot["line"], hotspot)
+        regions = []
+        annotations = []
+        for line, hotspot in sorted(lines.items()):
+            point = view.text_point(line - 1, 0)
+            regions.append(view.line(point))
+            annotations.append(
+                f"{kind} flat {html.escape(hotspot['flat'])} ({hotspot['flat_percent']}), "
+                f"cum {html.escape(hotspot['cum'])} ({hotspot['cum_percent']})"
+            )
+        view.add_regions(
+            f"gopls_profile_{kind}",
+            regions,
+            scope,
+            flags=sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE,
+            annotations=annotations,
+            annotation_color=view.style_for_scope(scope).get("foreground", ""),
+        )
+
+
+def annotate_open_views() -> None:
+    for window in sublime.windows():
+        for view in window.views():
+            _annotate_view(view)
+
+
+def clear_hotspots() -> None:
+    with _hotspots_lock:
+        _hotspots.clear()
+    for window in sublime.windows():
+        for view in window.views():
+            for kind, _, _ in PROFILES:
+                view.erase_regions(f"gopls_profile_{kind}")
+
+
+def _pprof(args: list[str], env_vars: dict, directory: str) -> str:
+    output: list[str] = []
+    process = GoProcess(["tool", "pprof", *args], dict(env_vars), on_line=output.append, cwd=directory)
+    return_code = process.start().wait()
+    if return_code != 0:
+        raise ValueError("go tool pprof error", "".join(output), "returncode", return_code)
+    return "".join(output)
+
+
+def profile_package(
+    window: sublime.Window | None,
+    settings: DottedDict,
+    directory: str,
+    run: str,
+    bench: str | None,
+    storage_path: str,
+) -> None:
+    """
+    Runs the tests matching `run`, or the benchmarks matching `bench`, of the
+    package in `directory` with CPU and memory profiling on a background
+    thread. The profiles and the test binary are kept in plugin storage, the
+    top functions of both profiles are shown in an output panel and the
+    hottest lines are annotated in the views of their files.
+    """
+    top_count = settings.get("profileTopCount") or 20
+    env_vars = go_test_env_vars(settings)
+    name = hashlib.sha256(directory.encode("utf-8")).hexdigest()[:16]
+    output_dir = Path(storage_path, "profiles", name, time.strftime("%Y%m%d-%H%M%S"))
+    panel = OutputPanel(window, PROFILE_PANEL_NAME)
+    panel.show()
+
+    def task() -> None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        binary = str(output_dir / "package.test")
+        profiles = {kind: str(output_dir / f"{kind}.pprof") for kind, _, _ in PROFILES}
+        args = ["test", "-count=1", "-run", run, "-o", binary]
+        args += ["-cpuprofile", profiles["cpu"], "-memprofile", profiles["mem"]]
+        if bench:
+            args += ["-bench", bench, "-benchmem"]
+        panel.append(f"$ go {' '.join(args)}  # in {directory}\n")
+        try:
+            return_code = GoProcess(args, dict(env_vars), on_line=panel.append, cwd=directory).start().wait()
+        except ProcessCancelledError:
+            return
+        if return_code != 0 or not all(os.path.exists(path) for path in profiles.values()):
+            panel.append(f"\ngo test exited with {return_code}, no profiles to report\n")
+            return
+
+        hotspots: dict[str, dict[str, list[GoProfileHotspot]]] = {}
+        for kind, sample_index, _ in PROFILES:
+            common = [f"-sample_index={sample_index}", binary, profiles[kind]]
+            try:
+                panel.append(f"\n{_pprof(['-top', f'-nodecount={top_count}', *common], env_vars, directory)}")
+                rows = parse_pprof_top(_pprof(["-top", "-lines", f"-nodecount={HOTSPOT_NODE_COUNT}", *common],
+                                              env_vars, directory))
+            except (ValueError, ProcessCancelledError) as ex:
+                panel.append(f"\n{ex}\n")
+                continue
+            files = hotspots.setdefault(kind, {})
+            for row in rows:
+                if row["file"] and row["line"]:
+                    files.setdefault(_file_key(row["file"]), []).append(row)
+        with _hotspots_lock:
+            _hotspots.clear()
+            _hotspots.update(hotspots)
+        sublime.set_timeout(annotate_open_views)
+        panel.append(f"\nProfiles saved in {output_dir}\n")
+
+    threading.Thread(target=task, name="gopls-profile", daemon=True).start()
+
+
+class GoplsProfileAnnotationListener(sublime_plugin.EventListener):
+    def on_load(self, view: sublime.View) -> None:
+        if _hotspots:
+            _annotate_view(view)
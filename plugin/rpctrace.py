@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+import contextlib
+import heapq
+import itertools
+import os
+import re
+import time
+
+from LSP.plugin import DottedDict
+
+TRACE_RETENTION = 5
+# Traces written to this recently may belong to a running gopls and are never pruned.
+LIVE_TRACE_SECONDS = 60 * 60
+SLOWEST_LIMIT = 20
+PERCENTILES = (50, 95, 99)
+RE_TRACE = re.compile(
+    r"^\[Trace - [^\]]+\] (?P<direction>Received|Sending) (?P<kind>request|response|notification) "
+    r"'(?P<method>.+?)(?: - \((?P<id>[^)]*)\))?'(?: in (?P<elapsed>\d+)ms)?\."
+)
+RE_URI = re.compile(r'"uri":\s*"([^"]+)"')
+
+# Overrides the `rpcTrace` setting after `LSP-gopls: Toggle RPC Trace` until Sublime Text restarts.
+_enabled: bool | None = None
+# Numbers the traces of this plugin host, so sessions starting in the same second get their own files.
+_trace_counter = itertools.count(1)
+
+
+def is_trace_enabled(settings: DottedDict) -> bool:
+    return bool(settings.get("rpcTrace")) if _enabled is None else _enabled
+
+
+def toggle_trace(settings: DottedDict) -> bool:
+    global _enabled
+    _enabled = not is_trace_enabled(settings)
+    return _enabled
+
+
+def trace_dir(storage_path: str | Path) -> Path:
+    return Path(storage_path, "rpc-traces")
+
+
+def list_traces(storage_path: str | Path) -> list[Path]:
+    """
+    Returns the trace logs in plugin storage, newest first.
+    """
+    return sorted(trace_dir(storage_path).glob("gopls-*.log"), reverse=True)
+
+
+def trace_flags(storage_path: str | Path, window_id: int) -> list[str]:
+    """
+    Returns the gopls flags that log a trace of every LSP message to a new
+    file in plugin storage, and removes all but the newest traces. Traces that
+    are still being written to are kept regardless.
+    """
+    directory = trace_dir(storage_path)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    for old in list_traces(storage_path)[TRACE_RETENTION - 1 :]:
+        with contextlib.suppress(OSError):
+            if now - old.stat().st_mtime >= LIVE_TRACE_SECONDS:
+                old.unlink()
+    name = f"gopls-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{window_id}-{next(_trace_counter)}.log"
+    return ["-rpc.trace", f"-logfile={directory / name}"]
+
+
+class MethodStats:
+    __slots__ = ("count", "durations")
+
+    def __init__(self) -> None:
+        self.count = 0
+        # gopls reports whole milliseconds, so a counter keeps exact percentiles in little memory.
+        self.durations: Counter[int] = Counter()
+
+    def add(self, elapsed: int) -> None:
+        self.count += 1
+        self.durations[elapsed] += 1
+
+    def percentile(self, p: float) -> int:
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for elapsed in sorted(self.durations):
+            seen += self.durations[elapsed]
+            if seen >= rank:
+                return elapsed
+        return 0
+
+
+def analyze_trace(path: str | Path, slowest_limit: int = SLOWEST_LIMIT) -> tuple[dict[str, MethodStats], list]:
+    """
+    Reads a gopls `-rpc.trace` log line by line and returns the latency
+    statistics of every method along with the slowest requests, as
+    `(elapsed, method, id, uri)`. Requests that gopls sent to the editor are
+    counted under their method with a `(server)` suffix.
+    """
+    stats: dict[str, MethodStats] = {}
+    slowest: list[tuple[int, str, str, str]] = []
+    pending_uri: dict[str, str] = {}
+    request_id: str | None = None
+    with open(path, encoding="utf-8", errors="replace") as trace:
+        for line in trace:
+            if request_id is not None:
+                # The parameters of a request follow it on the next line.
+                if line.startswith("Params:"):
+                    matches = RE_URI.search(line, 0, 4096)
+                    if matches:
+                        pending_uri[request_id] = matches.group(1)
+                request_id = None
+                continue
+            if not line.startswith("[Trace"):
+                continue
+            matches = RE_TRACE.match(line)
+            if matches is None:
+                continue
+            kind, method, id_ = matches.group("kind", "method", "id")
+            if kind == "request":
+                request_id = f"{matches.group('direction')}:{id_}"
+                continue
+            if kind != "response" or matches.group("elapsed") is None:
+                continue
+            elapsed = int(matches.group("elapsed"))
+            # A response sent by gopls answers a request it received, and the other way round.
+            outgoing = matches.group("direction") == "Sending"
+            uri = pending_uri.pop(f"{'Received' if outgoing else 'Sending'}:{id_}", "")
+            name = method if outgoing else f"{method} (server)"
+            stats.setdefault(name, MethodStats()).add(elapsed)
+            entry = (elapsed, name, id_ or "", uri)
+            if len(slowest) < slowest_limit:
+                heapq.heappush(slowest, entry)
+            elif entry > slowest[0]:
+                heapq.heapreplace(slowest, entry)
+    return stats, sorted(slowest, reverse=True)
+
+
+def render_trace_report(path: str | Path, stats: dict[str, MethodStats], slowest: list) -> str:
+    width = max((len(method) for method in stats), default=6) + 2
+    header = "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    lines = [f"RPC latencies in {path}", "", f"{'method':<{width}}{'count':>8}{header}{'max':>9}"]
+    for method, method_stats in sorted(stats.items(), key=lambda item: -item[1].percentile(95)):
+        percentiles = "".join(f"{method_stats.percentile(p):>7}ms" for p in PERCENTILES)
+        lines.append(f"{method:<{width}}{method_stats.count:>8}{percentiles}{max(method_stats.durations):>7}ms")
+    if not stats:
+        lines.append("no responses found, is the trace from gopls -rpc.trace?")
+    lines.extend(("", f"Slowest requests (top {len(slowest)}):"))
+    lines.extend(f"{elapsed:>8}ms  {method} ({id_})  {uri}" for elapsed, method, id_, uri in slowest)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Generator
+import contextlib
+import json
+import os
+import statistics
+import threading
+import time
+
+from .types import GoplsStartupRecord
+from .types import GoplsStartupSpan
+
+STARTUP_LOG = "startup.log"
+# The log is cut back to this many starts whenever it grows to twice as many.
+STARTUP_HISTORY = 100
+SUMMARY_STARTS = 20
+
+# Spans of loading the plugin, reported with the first start after the load.
+_load_spans: list[GoplsStartupSpan] = []
+_load_origin = time.perf_counter()
+_load_reported = False
+# The start in progress of every window, until gopls reports the workspace as loaded.
+_pending: dict[int, StartupRecord] = {}
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def load_span(name: str) -> Generator[None, None, None]:
+    """
+    Measures a step of loading the plugin, like registering it with LSP.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _load_spans.append(GoplsStartupSpan(name=name, start=start - _load_origin, duration=end - start))
+
+
+class StartupRecord:
+    """
+    The spans of one start of gopls, from `on_pre_start_async` until gopls
+    reports the end of loading the workspace through `$/progress`. The span
+    from launching gopls to its first progress report covers the process
+    start and the `initialize` handshake, which LSP does not report to
+    plugins. Offsets and durations are in seconds.
+    """
+
+    def __init__(self, storage_path: str | Path, folders: list[str]) -> None:
+        self.log_path = Path(storage_path, STARTUP_LOG)
+        self.folders = folders
+        self.time = time.time()
+        self.origin = time.perf_counter()
+        self.spans: list[GoplsStartupSpan] = []
+        self.launched: float | None = None
+        self.first_progress: float | None = None
+        self.progress_token: str | int | None = None
+        self.progress_title = ""
+        self.load: list[GoplsStartupSpan] = []
+
+    def add(self, name: str, start: float, end: float) -> None:
+        self.spans.append(GoplsStartupSpan(name=name, start=start - self.origin, duration=end - start))
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def on_progress(self, token: str | int, kind: str, title: str) -> bool:
+        """
+        Adds the spans that a `$/progress` report completes and returns whether
+        the start is complete. The first progress that gopls begins is loading
+        the workspace, which it only starts once `initialize` is answered.
+        The time up to it includes starting the process and the handshake.
+        """
+        now = time.perf_counter()
+        if kind == "begin" and self.progress_token is None and self.launched is not None:
+            self.add("launch to first progress", self.launched, now)
+            self.first_progress = now
+            self.progress_token = token
+            self.progress_title = title
+            return False
+        if kind == "end" and token == self.progress_token and self.first_progress is not None:
+            self.add(f"workspace load ({self.progress_title})" if self.progress_title else "workspace load",
+                     self.first_progress, now)
+            return True
+        return False
+
+    def finish(self, outcome: str) -> GoplsStartupRecord:
+        if outcome == "incomplete":
+            # Only the phases that completed count, the record is finished by the next start.
+            total = max((span["start"] + span["duration"] for span in self.spans), default=0.0)
+        else:
+            total = time.perf_counter() - self.origin
+        record = GoplsStartupRecord(
+            time=self.time,
+            folders=self.folders,
+            outcome=outcome,
+            total=total,
+            load=self.load,
+            spans=self.spans,
+        )
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a") as log:
+                log.write(json.dumps(record) + "\n")
+            _trim_log(self.log_path)
+        except OSError as ex:
+            print(f"LSP-gopls: could not write {self.log_path}: {ex}")
+        return record
+
+
+def _trim_log(path: Path) -> None:
+    lines = path.read_text().splitlines(keepends=True)
+    if len(lines) >= 2 * STARTUP_HISTORY:
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text("".join(lines[-STARTUP_HISTORY:]))
+        os.replace(tmp, path)
+
+
+def begin_start(window_id: int, storage_path: str | Path, folders: list[str]) -> StartupRecord:
+    """
+    Starts the record of a gopls start in the window. A start of the window
+    that never got to load its workspace is written as incomplete.
+    """
+    global _load_reported
+    record = StartupRecord(storage_path, folders)
+    with _lock:
+        previous = _pending.pop(window_id, None)
+        if not _load_reported:
+            _load_reported = True
+            record.load = list(_load_spans)
+    if previous is not None:
+        previous.finish("incomplete")
+    return record
+
+
+def launched(window_id: int, record: StartupRecord) -> None:
+    """
+    Marks the end of the preparations in `on_pre_start_async`, after which LSP
+    launches gopls and sends `initialize`.
+    """
+    record.launched = time.perf_counter()
+    with _lock:
+        _pending[window_id] = record
+
+
+def report_progress(window_id: int, params: dict) -> None:
+    value = params.get("value") or {}
+    with _lock:
+        record = _pending.get(window_id)
+        if record is None or not record.on_progress(params.get("token"), value.get("kind"), value.get("title", "")):
+            return
+        del _pending[window_id]
+    record.finish("ready")
+
+
+def read_records(storage_path: str | Path, limit: int = SUMMARY_STARTS) -> list[GoplsStartupRecord]:
+    """
+    Returns the newest `limit` start records in plugin storage, oldest first.
+    """
+    try:
+        lines = Path(storage_path, STARTUP_LOG).read_text().splitlines()
+    except OSError:
+        return []
+    records = []
+    for line in lines[-limit:]:
+        with contextlib.suppress(ValueError):
+            records.append(json.loads(line))
+    return records
+
+
+def _phase(name: str) -> str:
+    # The title of the workspace load differs between gopls versions.
+    return "workspace load" if name.startswith("workspace load") else name
+
+
+def render_startup_summary(records: list[GoplsStartupRecord]) -> str:
+    if not records:
+        return "No gopls starts recorded yet.\n"
+    phases: dict[str, list[float]] = {}
+    for record in records:
+        for span in record["load"] + record["spans"]:
+            phases.setdefault(_phase(span["name"]), []).append(span["duration"])
+    ready = [record["total"] for record in records if record["outcome"] == "ready"]
+    lines = [f"Phases over the last {len(records)} gopls starts (ms):", ""]
+    width = max((len(name) for name in phases), default=14) + 2
+    lines.append(f"{'phase':<{width}}{'starts':>8}{'median':>10}{'max':>10}")
+    for name, durations in phases.items():
+        lines.append(
+            f"{name:<{width}}{len(durations):>8}{statistics.median(durations) * 1000:>10.0f}"
+            f"{max(durations) * 1000:>10.0f}"
+        )
+    if ready:
+        lines.append(f"{'total to ready':<{width}}{len(ready):>8}{statistics.median(ready) * 1000:>10.0f}"
+                     f"{max(ready) * 1000:>10.0f}")
+    lines.extend(("", "Recent starts, newest first:"))
+    for record in reversed(records):
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"]))
+        spans = ", ".join(f"{_phase(span['name'])} {span['duration'] * 1000:.0f}" for span in record["spans"])
+        spans = spans or "no phases completed"
+        folders = ", ".join(record["folders"]) or "no folders"
+        summary = f"{started}  {record['outcome']:<10} {record['total'] * 1000:>8.0f} ms  {folders}"
+        lines.extend((summary, f"    {spans}"))
+    return "\n".join(lines) + "\n"
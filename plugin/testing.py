@@ -0,0 +1,519 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import json
+import os
+import re
+import threading
+import time
+
+from LSP.plugin import DottedDict
+from LSP.plugin import Session
+from LSP.plugin import parse_uri
+import sublime
+
+from .benchmarks import BenchmarkHistory
+from .benchmarks import DEFAULT_ALPHA
+from .benchmarks import compare_runs
+from .benchmarks import parse_benchmark_output
+from .durations import TestDurations
+from .durations import find_module
+from .panel import OutputPanel
+from .process import GoProcess
+from .process import ProcessCancelledError
+from .toolchain import environment
+from .toolchain import parse_go_version
+from .toolchain import probe_go_toolchain
+from .types import GoTestEvent
+from .types import GoplsRunTestsArgument
+from .utils import get_setting
+
+try:
+    import Terminus  # type: ignore
+except ImportError:
+    Terminus = None
+
+BENCHMARK_PANEL_NAME = "gopls_benchmarks"
+TEST_PANEL_NAME = "gopls_tests"
+RESULTS_PANEL_NAME = "gopls_test_results"
+RENDER_INTERVAL_SECONDS = 0.5
+SKIPPED_DIRECTORIES = ("vendor", "testdata", "node_modules")
+RESULT_FILE_REGEX = r"^\s*((?:[A-Za-z]:)?[^:\n]+\.go):(\d+):(?:(\d+):)?\s*(.*)$"
+RE_RESULT_FILE = re.compile(RESULT_FILE_REGEX)
+ALWAYS_SHOWN_OUTPUT = ("--- FAIL", "FAIL", "ok ", "panic:", "PASS")
+
+_active_runs: list[GoTestRun] = []
+_active_runs_lock = threading.Lock()
+
+
+def group_tests_by_package(arguments: list[GoplsRunTestsArgument], field: str = "Tests") -> dict[str, list[str]]:
+    """
+    Maps the directory of every package in `arguments` to the names listed in
+    `field` for it, without duplicates and in the order they were given.
+    """
+    packages: dict[str, list[str]] = {}
+    for argument in arguments:
+        names = argument.get(field) or []  # type: ignore
+        if not names:
+            continue
+        directory = str(Path(parse_uri(argument["URI"])[1]).parent)
+        selected = packages.setdefault(directory, [])
+        selected.extend(name for name in names if name not in selected)
+    return packages
+
+
+def run_pattern(names: list[str]) -> str:
+    """
+    Returns a `-run`/`-bench` pattern that matches exactly the top-level
+    functions in `names`.
+    """
+    escaped = [re.escape(name) for name in names]
+    return f"^{escaped[0]}$" if len(escaped) == 1 else f"^({'|'.join(escaped)})$"
+
+
+def parallelism_flags(settings: DottedDict) -> list[str]:
+    flags = []
+    if packages := settings.get("testPackageParallelism"):
+        flags += ["-p", str(packages)]
+    if tests := settings.get("testParallelism"):
+        flags += ["-parallel", str(tests)]
+    return flags
+
+
+def go_test_env_vars(settings: DottedDict) -> dict:
+    """
+    Returns the environment for `go test`, which is the user's environment
+    plus the `gopls.env` setting, just like the `go list` calls of gopls.
+    """
+    env_vars = environment()
+    env_vars.update(settings.get("gopls.env") or {})
+    return env_vars
+
+
+def open_tests_in_terminus(
+    session: Session,
+    window: sublime.Window | None,
+    arguments: list[GoplsRunTestsArgument],
+) -> None:
+    if not window:
+        return
+
+    if not window.active_view():
+        return
+
+    packages = group_tests_by_package(arguments)
+    for go_test_directory, tests in packages.items():
+        # Terminus expands variables in `cmd`, so the anchor needs escaping.
+        pattern = run_pattern(tests).replace("$", "\\$")
+        command_to_run = ["go", "test", go_test_directory, "-v", "-count=1"]
+        command_to_run += [*parallelism_flags(session.config.settings), "-run", pattern]
+        terminus_args = {
+            "title": f"Go Test: {Path(go_test_directory).name}",
+            "cmd": command_to_run,
+            "cwd": go_test_directory,
+            "auto_close": get_setting(session, "closeTestResultsWhenFinished", False),
+        }
+        if get_setting(session, "runTestsInPanel", True):
+            terminus_args["panel_name"] = "Go Test" if len(packages) == 1 else terminus_args["title"]
+        window.run_command("terminus_open", terminus_args)
+
+
+def run_benchmarks(
+    session: Session,
+    window: sublime.Window | None,
+    arguments: list[GoplsRunTestsArgument],
+    storage_path: str,
+    on_regression: Callable[[str, list[str]], None] | None = None,
+) -> None:
+    """
+    Runs the benchmarks in `arguments` on a background thread, one `go test`
+    per package, and reports each run against the pinned baseline or the
+    previous run of the package in an output panel. `on_regression` is called
+    with the directory and the regressed benchmarks of every package that got
+    significantly worse.
+    """
+    packages = group_tests_by_package(arguments, "Benchmarks")
+    if not packages:
+        return
+
+    count = get_setting(session, "benchmarkCount", 6)
+    alpha = get_setting(session, "benchmarkAlpha", DEFAULT_ALPHA)
+    benchtime = get_setting(session, "benchmarkTime", "")
+    env_vars = go_test_env_vars(session.config.settings)
+    panel = OutputPanel(window, BENCHMARK_PANEL_NAME)
+    panel.show()
+
+    def run() -> None:
+        regressions = []
+        for directory, benchmarks in packages.items():
+            args = ["test", "-run", "^$", "-bench", run_pattern(benchmarks), "-benchmem", f"-count={count}"]
+            if benchtime:
+                args.append(f"-benchtime={benchtime}")
+            panel.append(f"$ go {' '.join(args)}  # in {directory}\n")
+            output: list[str] = []
+
+            def on_line(line: str) -> None:
+                output.append(line)
+                panel.append(line)
+
+            try:
+                return_code = GoProcess(args, dict(env_vars), on_line=on_line, cwd=directory).start().wait()
+            except ProcessCancelledError:
+                return
+            if return_code != 0:
+                panel.append(f"\ngo test exited with {return_code}, not recording this run\n\n")
+                continue
+
+            results = parse_benchmark_output("".join(output))
+            if not results:
+                panel.append("\nno benchmark results found, not recording this run\n\n")
+                continue
+            history = BenchmarkHistory(storage_path, directory)
+            latest = history.add_run(results)
+            reference = history.reference_for(latest)
+            report, regressed = compare_runs(reference, latest, alpha)
+            against = "pinned baseline" if history.baseline is not None else "previous run"
+            panel.append(f"\nCompared against the {against}:\n\n{report}\n" if reference else f"\n{report}\n")
+            regressions.extend(regressed)
+            if regressed and on_regression:
+                on_regression(directory, regressed)
+
+        if regressions:
+            panel.status(f"LSP-gopls: {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+
+    threading.Thread(target=run, name="gopls-benchmarks", daemon=True).start()
+
+
+def parse_test_event(line: str) -> GoTestEvent | None:
+    """
+    Parses a line of `go test -json` output. Returns `None` for lines that are
+    not test events, like the compiler errors of a package that fails to build.
+    """
+    if not line.startswith("{"):
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) and "Action" in event else None
+
+
+def test_json_flags() -> list[str]:
+    flags = ["-json"]
+    try:
+        if parse_go_version(probe_go_toolchain()["goversion"]) >= (1, 21, 0):
+            # Absolute paths keep failures clickable when several packages share the panel.
+            flags.append("-fullpath")
+    except ValueError:
+        pass
+    return flags
+
+
+class GoTestRun:
+    """
+    Runs `go test -json` for a list of packages on a background thread and
+    streams the output into an output panel as the events arrive. Failure
+    locations in the panel can be double-clicked to jump to the code.
+
+    With more than one worker, up to `workers` packages are tested at once and
+    the output of each package is added in one piece once it is done, so the
+    output of concurrent packages is never interleaved.
+
+    Only the first `output_limit` lines of test output are shown; after that,
+    only the lines that report results or failures are added, so a chatty test
+    cannot flood the panel.
+    """
+
+    def __init__(
+        self,
+        window: sublime.Window | None,
+        env_vars: dict,
+        jobs: list[tuple[str, list[str]]],
+        output_limit: int = 5000,
+        on_event: Callable[[GoTestEvent], None] | None = None,
+        on_done: Callable[[GoTestRun], None] | None = None,
+        panel_name: str = TEST_PANEL_NAME,
+        workers: int = 1,
+    ) -> None:
+        self.env_vars = env_vars
+        self.jobs = jobs
+        self.output_limit = output_limit
+        self.on_event = on_event
+        self.on_done = on_done
+        self.workers = max(workers, 1)
+        self.results: dict[tuple[str, str], GoTestEvent] = {}
+        self.passed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cancelled = False
+        self._lines = 0
+        self._truncated = False
+        self._lock = threading.Lock()
+        self._processes: list[GoProcess] = []
+        base_dir = jobs[0][0] if jobs else ""
+        self.panel = OutputPanel(
+            window,
+            panel_name,
+            settings={"result_file_regex": RESULT_FILE_REGEX, "result_base_dir": base_dir},
+        )
+
+    def start(self) -> GoTestRun:
+        with _active_runs_lock:
+            _active_runs.append(self)
+        self.panel.show()
+        threading.Thread(target=self._run, name="gopls-tests", daemon=True).start()
+        return self
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.cancel()
+
+    def _run(self) -> None:
+        started_at = time.monotonic()
+        try:
+            if self.workers == 1:
+                for directory, args in self.jobs:
+                    self._run_job(directory, args)
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gopls-tests") as executor:
+                    for directory, args in self.jobs:
+                        executor.submit(self._run_job, directory, args)
+        finally:
+            with _active_runs_lock:
+                if self in _active_runs:
+                    _active_runs.remove(self)
+        summary = f"{self.passed} passed, {self.failed} failed, {self.skipped} skipped"
+        if self.cancelled:
+            summary += ", cancelled"
+        self.panel.append(f"\n{summary} in {time.monotonic() - started_at:.1f}s\n")
+        self.panel.status(f"LSP-gopls: tests {summary}")
+        if self.on_done:
+            self.on_done(self)
+
+    def _run_job(self, directory: str, args: list[str]) -> None:
+        if self.cancelled:
+            return
+        command = ["test", *test_json_flags(), *args]
+        buffer: list[str] | None = [] if self.workers > 1 else None
+        self._write(f"$ go {' '.join(command)}  # in {directory}\n", always=True, buffer=buffer)
+        process = GoProcess(
+            command,
+            dict(self.env_vars),
+            on_line=lambda line: self._on_line(line, buffer),
+            cwd=directory,
+        )
+        with self._lock:
+            self._processes.append(process)
+        try:
+            process.start().wait()
+        except ProcessCancelledError:
+            pass
+        finally:
+            with self._lock:
+                self._processes.remove(process)
+        if buffer:
+            self.panel.append("".join(buffer))
+
+    def _on_line(self, line: str, buffer: list[str] | None = None) -> None:
+        event = parse_test_event(line)
+        if event is None:
+            self._write(line, always=True, buffer=buffer)
+            return
+        action = event.get("Action")
+        if action == "output":
+            output = event.get("Output", "")
+            always = output.lstrip().startswith(ALWAYS_SHOWN_OUTPUT) or bool(RE_RESULT_FILE.match(output))
+            self._write(output, always=always, buffer=buffer)
+        elif action in ("pass", "fail", "skip") and (test := event.get("Test")):
+            with self._lock:
+                self.results[(event.get("Package", ""), test)] = event
+                if action == "pass":
+                    self.passed += 1
+                elif action == "fail":
+                    self.failed += 1
+                else:
+                    self.skipped += 1
+        if self.on_event:
+            self.on_event(event)
+
+    def _write(self, text: str, always: bool = False, buffer: list[str] | None = None) -> None:
+        with self._lock:
+            if self._lines < self.output_limit:
+                self._lines += 1
+            elif not always:
+                if self._truncated:
+                    return
+                self._truncated = True
+                text = f"[output truncated after {self.output_limit} lines, showing results only]\n"
+        if buffer is not None:
+            buffer.append(text)
+        else:
+            self.panel.append(text)
+
+
+def active_test_runs() -> list[GoTestRun]:
+    with _active_runs_lock:
+        return list(_active_runs)
+
+
+def run_tests_in_panel(
+    session: Session,
+    window: sublime.Window | None,
+    arguments: list[GoplsRunTestsArgument],
+    storage_path: str,
+) -> GoTestRun | None:
+    """
+    Runs the tests in `arguments` with the built-in runner and records their
+    durations for the slow test report.
+    """
+    packages = group_tests_by_package(arguments)
+    if not packages:
+        return None
+    jobs = [
+        (directory, ["-count=1", *parallelism_flags(session.config.settings), "-run", run_pattern(tests), "."])
+        for directory, tests in packages.items()
+    ]
+    output_limit = get_setting(session, "testOutputLimit", 5000)
+    durations = TestDurations(storage_path)
+    return GoTestRun(
+        window,
+        go_test_env_vars(session.config.settings),
+        jobs,
+        output_limit=output_limit,
+        on_event=durations.record,
+        on_done=lambda _: durations.save(),
+    ).start()
+
+
+class TestResultTree:
+    """
+    Aggregates the events of a test run into a tree of packages and tests.
+    Failed packages come first, packages whose results came from the test
+    cache are listed separately, and the packages that actually ran are
+    sorted by the time they took.
+    """
+
+    def __init__(self) -> None:
+        self.packages: dict[str, GoTestEvent] = {}
+        self.tests: dict[str, dict[str, GoTestEvent]] = {}
+        self.cached: set[str] = set()
+        self.running: set[str] = set()
+        self._lock = threading.Lock()
+
+    def update(self, event: GoTestEvent) -> None:
+        package = event.get("Package", "")
+        action = event.get("Action")
+        test = event.get("Test")
+        with self._lock:
+            if action == "start":
+                self.running.add(package)
+            elif action == "output" and not test and "(cached)" in event.get("Output", ""):
+                self.cached.add(package)
+            elif action in ("pass", "fail", "skip"):
+                if test:
+                    self.tests.setdefault(package, {})[test] = event
+                else:
+                    self.packages[package] = event
+                    self.running.discard(package)
+
+    def render(self, title: str) -> str:
+        with self._lock:
+            symbols = {"pass": "✔", "fail": "✘", "skip": "-"}
+            failed = [p for p, e in self.packages.items() if e.get("Action") == "fail"]
+            ran = [p for p, e in self.packages.items() if e.get("Action") == "pass" and p not in self.cached]
+            cached = sorted(p for p in self.cached if p in self.packages)
+            no_tests = sorted(p for p, e in self.packages.items() if e.get("Action") == "skip")
+            elapsed = sum(e.get("Elapsed", 0.0) for p, e in self.packages.items() if p not in self.cached)
+
+            lines = [
+                title,
+                f"{len(failed)} failed, {len(ran)} passed, {len(cached)} cached, {len(no_tests)} without tests, "
+                f"{len(self.running)} running, {elapsed:.2f}s spent in packages that ran",
+                "",
+            ]
+            ordered = sorted(failed) + sorted(ran, key=lambda p: -self.packages[p].get("Elapsed", 0.0))
+            for package in ordered:
+                event = self.packages[package]
+                lines.append(f"{symbols[event['Action']]} {package}  {event.get('Elapsed', 0.0):.2f}s")
+                tests = self.tests.get(package, {})
+                for test in sorted(tests, key=lambda t: (tests[t]["Action"] != "fail", t)):
+                    if "/" in test and tests[test]["Action"] == "pass":
+                        continue
+                    depth = test.count("/") + 1
+                    lines.append(f"{'  ' * depth}{symbols[tests[test]['Action']]} {test}  "
+                                 f"{tests[test].get('Elapsed', 0.0):.2f}s")
+            if cached:
+                lines.extend(("", "Cached:"))
+                lines.extend(f"  {package}" for package in cached)
+            if self.running:
+                lines.extend(("", "Running:"))
+                lines.extend(f"  {package}" for package in sorted(self.running))
+            return "\n".join(lines) + "\n"
+
+
+def discover_modules(folders: list[str]) -> list[str]:
+    """
+    Returns the root directories of all Go modules in `folders`, including
+    the modules that contain the folders and modules nested inside them.
+    """
+    roots: list[str] = []
+    for folder in folders:
+        if (module := find_module(folder)) and module[0] not in roots:
+            roots.append(module[0])
+        for directory, subdirectories, files in os.walk(folder):
+            subdirectories[:] = [
+                d for d in subdirectories if not d.startswith((".", "_")) and d not in SKIPPED_DIRECTORIES
+            ]
+            if "go.mod" in files and directory not in roots:
+                roots.append(directory)
+    return roots
+
+
+def run_module_tests(
+    window: sublime.Window,
+    settings: DottedDict,
+    module_roots: list[str],
+    storage_path: str,
+) -> GoTestRun | None:
+    """
+    Runs all tests of the modules in `module_roots`, one `go test ./...` per
+    module, which lets `go test` schedule the packages of a module over all
+    cores itself. Results are aggregated into a tree in a separate panel while
+    the raw output streams into the regular test panel.
+    """
+    if not module_roots:
+        return None
+    jobs = [(root, [*parallelism_flags(settings), "./..."]) for root in module_roots]
+
+    tree = TestResultTree()
+    title = f"Tests of {', '.join(module_roots)}"
+    results = OutputPanel(window, RESULTS_PANEL_NAME)
+    durations = TestDurations(storage_path)
+    last_render = 0.0
+
+    def on_event(event: GoTestEvent) -> None:
+        nonlocal last_render
+        durations.record(event)
+        tree.update(event)
+        if event.get("Test") is None and time.monotonic() - last_render >= RENDER_INTERVAL_SECONDS:
+            last_render = time.monotonic()
+            results.replace(tree.render(title))
+
+    def on_done(_: GoTestRun) -> None:
+        durations.save()
+        results.replace(tree.render(title))
+        results.show()
+
+    return GoTestRun(
+        window,
+        go_test_env_vars(settings),
+        jobs,
+        output_limit=settings.get("testOutputLimit", 5000),
+        on_event=on_event,
+        on_done=on_done,
+    ).start()
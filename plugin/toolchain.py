@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from shutil import which
+import json
+import os
+import subprocess
+import threading
+
+from .constants import RE_VER
+from .types import GoToolchain
+from .utils import get_startupinfo
+from .utils import to_int
+
+PROBED_VARIABLES = ("GOROOT", "GOVERSION", "GOOS", "GOARCH", "GOTOOLCHAIN", "GOCACHE", "GOMODCACHE", "GOPATH")
+
+_cache: dict[tuple[str, float], GoToolchain] = {}
+_environ: dict[str, str] | None = None
+_lock = threading.Lock()
+
+
+def resolve_go_binary() -> tuple[str, float] | None:
+    """
+    Returns the real path and modification time of the `go` binary on $PATH,
+    which together identify the toolchain a probe belongs to.
+    """
+    go = which("go")
+    if go is None:
+        return None
+    path = os.path.realpath(go)
+    try:
+        return (path, os.stat(path).st_mtime)
+    except OSError:
+        return None
+
+
+def environment() -> dict[str, str]:
+    """
+    Returns a copy of the environment snapshot shared by all `go` invocations
+    of this plugin. The snapshot is refreshed together with the toolchain probe.
+    """
+    global _environ
+    with _lock:
+        if _environ is None:
+            _environ = dict(os.environ)
+        return dict(_environ)
+
+
+def probe_go_toolchain() -> GoToolchain:
+    """
+    Returns the result of `go env -json` for the `go` binary on $PATH. The
+    result is cached until that binary is replaced, so only the first call
+    after a toolchain change spawns a process. Raises `ValueError` if there is
+    no usable `go` binary.
+    """
+    global _environ
+    key = resolve_go_binary()
+    if key is None:
+        raise ValueError("go binary not found in $PATH")
+    with _lock:
+        if key in _cache:
+            return _cache[key]
+        _cache.clear()
+        _environ = None
+
+    process = subprocess.Popen(
+        [key[0], "env", "-json", *PROBED_VARIABLES],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=environment(),
+        universal_newlines=True,
+        startupinfo=get_startupinfo(),
+    )
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise ValueError("go env error", stderr, "returncode", process.returncode)
+    try:
+        values: dict[str, str] = json.loads(stdout)
+    except ValueError as ex:
+        raise ValueError("go env returned invalid JSON", stdout) from ex
+
+    toolchain = GoToolchain(
+        path=key[0],
+        mtime=key[1],
+        goroot=values.get("GOROOT", ""),
+        goversion=values.get("GOVERSION", ""),
+        goos=values.get("GOOS", ""),
+        goarch=values.get("GOARCH", ""),
+        gotoolchain=values.get("GOTOOLCHAIN", ""),
+        gocache=values.get("GOCACHE", ""),
+        gomodcache=values.get("GOMODCACHE", ""),
+        gopath=values.get("GOPATH", ""),
+    )
+    with _lock:
+        _cache[key] = toolchain
+    return toolchain
+
+
+def parse_go_version(goversion: str) -> tuple[int, int, int]:
+    matches = RE_VER.search(goversion)
+    if matches is None:
+        return (0, 0, 0)
+    return (
+        to_int(matches.group(1)),
+        to_int(matches.group(2)),
+        to_int(matches.group(3)),
+    )
+
+
+def invalidate() -> None:
+    """
+    Drops the toolchain probe and the environment snapshot, so the next `go`
+    invocation picks up a changed environment. Called whenever the settings of
+    LSP-gopls change, which restarts the sessions as well.
+    """
+    global _environ
+    with _lock:
+        _cache.clear()
+        _environ = None
@@ -11,3 +11,115 @@ class GoplsRunTestsArgument(TypedDict):
     URI: str
     Tests: list[str] | None
     Benchmarks: list[str] | None
+
+
+class GoplsArtifactRecord(TypedDict):
+    gopls: str
+    toolchain: str
+    goos: str
+    goarch: str
+    sha256: str
+    size: int
+    created: float
+
+
+class GoToolchain(TypedDict):
+    path: str
+    mtime: float
+    goroot: str
+    goversion: str
+    goos: str
+    goarch: str
+    gotoolchain: str
+    gocache: str
+    gomodcache: str
+    gopath: str
+
+
+class GoCacheUsage(TypedDict):
+    gocache: str
+    gomodcache: str
+    build_bytes: int
+    module_bytes: int
+
+
+class GoBenchmarkRun(TypedDict):
+    time: float
+    results: dict[str, dict[str, list[float]]]
+
+
+class GoTestEvent(TypedDict, total=False):
+    Time: str
+    Action: str
+    Package: str
+    Test: str
+    Elapsed: float
+    Output: str
+
+
+class GoListPackage(TypedDict, total=False):
+    ImportPath: str
+    Dir: str
+    Imports: list[str]
+    TestImports: list[str]
+    XTestImports: list[str]
+
+
+class GoProfileHotspot(TypedDict):
+    function: str
+    file: str
+    line: int
+    flat: str
+    flat_percent: str
+    cum: str
+    cum_percent: str
+
+
+class GoplsMetricsSample(TypedDict):
+    time: float
+    values: dict[str, int]
+
+
+class GoplsHeapSnapshot(TypedDict):
+    path: str
+    time: float
+    heap_alloc: int
+    heap_inuse: int
+    heap_objects: int
+
+
+class GoplsProcessSample(TypedDict):
+    pid: int
+    cwd: str
+    rss: int
+    cpu_seconds: float
+
+
+class GoWorkspaceTree(TypedDict):
+    path: str
+    files: int
+
+
+class GoWorkspaceScan(TypedDict):
+    folder: str
+    time: float
+    files: int
+    packages: int
+    modules: list[str]
+    heavy_trees: list[GoWorkspaceTree]
+    truncated: bool
+
+
+class GoplsStartupSpan(TypedDict):
+    name: str
+    start: float
+    duration: float
+
+
+class GoplsStartupRecord(TypedDict):
+    time: float
+    folders: list[str]
+    outcome: str
+    total: float
+    load: list[GoplsStartupSpan]
+    spans: list[GoplsStartupSpan]
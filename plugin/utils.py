@@ -3,8 +3,8 @@ from __future__ import annotations
 from shutil import which
 from typing import Any
 import subprocess
-import tempfile
 
+from LSP.plugin import DottedDict
 from LSP.plugin import Session
 import sublime
 
@@ -20,36 +20,19 @@ def get_setting(
     return value
 
 
-def run_go_command(
-    env_vars: dict,
-    sub_command: str = "install",
-    url: str | None = None,
-) -> tuple[str, str, int]:
-    startupinfo = None
-    if sublime.platform() == "windows":
-        startupinfo = subprocess.STARTUPINFO()  # type: ignore
-        startupinfo.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW  # type: ignore
-
-    cmd = ["go", sub_command]
-    if url is not None:
-        cmd.append(url)
-
-    with tempfile.TemporaryDirectory() as tempdir:
-        env_vars["GOTMPDIR"] = tempdir
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env_vars,
-            universal_newlines=True,
-            startupinfo=startupinfo,
-        )
-        stdout, stderr = process.communicate()
-    return (
-        stdout,
-        stderr,
-        process.returncode,
-    )
+def get_plugin_settings() -> DottedDict:
+    """
+    Returns the `settings` of LSP-gopls for code that runs outside of a session.
+    """
+    return DottedDict(sublime.load_settings("LSP-gopls.sublime-settings").get("settings", {}))
+
+
+def get_startupinfo() -> Any:
+    if sublime.platform() != "windows":
+        return None
+    startupinfo = subprocess.STARTUPINFO()  # type: ignore
+    startupinfo.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW  # type: ignore
+    return startupinfo
 
 
 def is_binary_available(path) -> bool:
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import re
+import subprocess
+import threading
+
+from LSP.plugin import DottedDict
+import sublime
+import sublime_plugin
+
+from .durations import TestDurations
+from .durations import find_module
+from .testing import GoTestRun
+from .testing import go_test_env_vars
+from .types import GoListPackage
+from .utils import get_plugin_settings
+from .utils import get_startupinfo
+
+WATCH_PANEL_NAME = "gopls_watch"
+# Saves within this many milliseconds of each other are resolved to affected packages together.
+WATCH_DEBOUNCE_MS = 500
+RE_IMPORT_BLOCK = re.compile(r"^import\s*\(([^)]*)\)", re.MULTILINE)
+RE_IMPORT_SPEC = re.compile(r"^\s*(?:[\w.]+\s+)?\"([^\"]+)\"", re.MULTILINE)
+RE_SINGLE_IMPORT = re.compile(r"^import\s+(?:[\w.]+\s+)?\"([^\"]+)\"", re.MULTILINE)
+
+_graphs: dict[str, ImportGraph] = {}
+_graphs_lock = threading.Lock()
+_watchers: dict[int, TestWatcher] = {}
+# The settings of the latest session of every window.
+_settings: dict[int, DottedDict] = {}
+
+
+def parse_file_imports(text: str) -> set[str]:
+    imports = set(RE_SINGLE_IMPORT.findall(text))
+    for block in RE_IMPORT_BLOCK.findall(text):
+        imports.update(RE_IMPORT_SPEC.findall(block))
+    return imports
+
+
+def go_list(root: str, patterns: list[str], env_vars: dict) -> list[GoListPackage]:
+    """
+    Returns the packages matching `patterns` as reported by `go list -e -json`,
+    run in `root`. Packages with errors are included, so a broken file does not
+    drop its package from the graph.
+    """
+    process = subprocess.Popen(
+        ["go", "list", "-e", "-json", *patterns],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env_vars,
+        cwd=root,
+        universal_newlines=True,
+        startupinfo=get_startupinfo(),
+    )
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise ValueError("go list error", stderr, "returncode", process.returncode)
+    decoder = json.JSONDecoder()
+    packages = []
+    index = 0
+    while (index := _skip_whitespace(stdout, index)) < len(stdout):
+        package, index = decoder.raw_decode(stdout, index)
+        packages.append(package)
+    return packages
+
+
+def _skip_whitespace(text: str, index: int) -> int:
+    while index < len(text) and text[index].isspace():
+        index += 1
+    return index
+
+
+class ImportGraph:
+    """
+    The reverse import graph of the packages of one module. It is built once
+    with `go list` and then kept up to date package by package: a saved file
+    only causes its own package to be listed again when it imports something
+    the graph does not know about yet, and the whole graph is rebuilt when
+    `go.mod` or `go.work` change.
+    """
+
+    def __init__(self, root: str, env_vars: dict) -> None:
+        self.root = root
+        self.env_vars = env_vars
+        self.packages: dict[str, GoListPackage] = {}
+        self.signature = self._signature()
+        self._lock = threading.Lock()
+        self._update(go_list(root, ["./..."], env_vars))
+
+    def _signature(self) -> tuple[float, ...]:
+        mtimes = []
+        for name in ("go.mod", "go.sum", "go.work"):
+            try:
+                mtimes.append(os.stat(os.path.join(self.root, name)).st_mtime)
+            except OSError:
+                mtimes.append(0.0)
+        return tuple(mtimes)
+
+    @property
+    def is_stale(self) -> bool:
+        return self._signature() != self.signature
+
+    def _update(self, packages: list[GoListPackage]) -> None:
+        with self._lock:
+            for package in packages:
+                self.packages[package["ImportPath"]] = package
+
+    def _package_in(self, directory: str) -> GoListPackage | None:
+        with self._lock:
+            for package in self.packages.values():
+                if os.path.normcase(package.get("Dir", "")) == os.path.normcase(directory):
+                    return package
+        return None
+
+    def refresh_file(self, file_name: str) -> GoListPackage | None:
+        """
+        Returns the package of `file_name`, listing its directory again if the
+        package is new or the file imports packages the graph has not seen.
+        """
+        directory = os.path.dirname(file_name)
+        package = self._package_in(directory)
+        if package is not None:
+            try:
+                imports = parse_file_imports(Path(file_name).read_text(encoding="utf-8", errors="replace"))
+            except OSError:
+                return package
+            known = set(package.get("Imports") or [])
+            known.update(package.get("TestImports") or [], package.get("XTestImports") or [])
+            if imports <= known:
+                return package
+        relative = os.path.relpath(directory, self.root)
+        self._update(go_list(self.root, ["./" + Path(relative).as_posix()], self.env_vars))
+        return self._package_in(directory)
+
+    def affected_by(self, file_name: str) -> list[str]:
+        """
+        Returns the directories of all packages whose tests depend on the
+        package of `file_name`: the package itself, everything that imports it
+        directly or transitively, and every package whose tests import one of
+        those. Test files are only compiled into the tests of their own
+        package, so a saved test file only affects that package.
+        """
+        package = self.refresh_file(file_name)
+        if package is None:
+            return []
+        if file_name.endswith("_test.go"):
+            return [package["Dir"]]
+        with self._lock:
+            importers: dict[str, set[str]] = {}
+            test_importers: dict[str, set[str]] = {}
+            for path, candidate in self.packages.items():
+                for imported in candidate.get("Imports") or []:
+                    importers.setdefault(imported, set()).add(path)
+                for imported in (candidate.get("TestImports") or []) + (candidate.get("XTestImports") or []):
+                    test_importers.setdefault(imported, set()).add(path)
+
+            changed = {package["ImportPath"]}
+            queue = [package["ImportPath"]]
+            while queue:
+                for importer in importers.get(queue.pop(), ()):
+                    if importer not in changed:
+                        changed.add(importer)
+                        queue.append(importer)
+            affected = set(changed)
+            for path in changed:
+                affected.update(test_importers.get(path, ()))
+            return sorted(self.packages[path]["Dir"] for path in affected if path in self.packages)
+
+
+def import_graph(root: str, env_vars: dict) -> ImportGraph:
+    with _graphs_lock:
+        graph = _graphs.get(root)
+    if graph is None or graph.is_stale:
+        graph = ImportGraph(root, env_vars)
+        with _graphs_lock:
+            _graphs[root] = graph
+    return graph
+
+
+def configure_watch(window_id: int, settings: DottedDict) -> None:
+    _settings[window_id] = settings
+
+
+class TestWatcher:
+    """
+    Re-runs the tests affected by every saved Go file of a window. Saves are
+    debounced and resolved to the affected packages with `go list` on a worker
+    thread, while the watcher state is only touched on the async thread.
+    Packages that become affected while a run is in progress are collected and
+    tested in the next run, and each run tests at most `workers` packages at
+    once.
+    """
+
+    def __init__(self, window: sublime.Window, storage_path: str) -> None:
+        self.window = window
+        self.storage_path = storage_path
+        self.saved: set[str] = set()
+        self.pending: set[str] = set()
+        self.run: GoTestRun | None = None
+        self._generation = 0
+        self._resolving = False
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self) -> DottedDict:
+        # Before the first session of the window has started there are only the plugin's own settings.
+        return _settings.get(self.window.id()) or get_plugin_settings()
+
+    def on_save(self, file_name: str) -> None:
+        self.saved.add(file_name)
+        self._generation += 1
+        generation = self._generation
+        sublime.set_timeout_async(lambda: self._flush(generation), WATCH_DEBOUNCE_MS)
+
+    def _flush(self, generation: int) -> None:
+        # A later save has its own timer, and saves during a resolve are picked up once it is done.
+        if generation != self._generation or self._resolving or self._stopped or not self.saved:
+            return
+        files, self.saved = self.saved, set()
+        self._resolving = True
+        threading.Thread(
+            target=self._resolve,
+            args=(files, self.settings),
+            name="gopls-watch",
+            daemon=True,
+        ).start()
+
+    def _resolve(self, files: set[str], settings: DottedDict) -> None:
+        affected: set[str] = set()
+        try:
+            env_vars = go_test_env_vars(settings)
+            for file_name in sorted(files):
+                if (module := find_module(os.path.dirname(file_name))) is None:
+                    continue
+                try:
+                    affected.update(import_graph(module[0], env_vars).affected_by(file_name))
+                except (ValueError, OSError) as ex:
+                    print(f"LSP-gopls: could not determine the packages affected by {file_name}: {ex}")
+        finally:
+            # Also after an unexpected error, as no later save would be resolved while `_resolving` is set.
+            sublime.set_timeout_async(lambda: self._resolved(affected, settings))
+
+    def _resolved(self, affected: set[str], settings: DottedDict) -> None:
+        self._resolving = False
+        if self._stopped:
+            return
+        with self._lock:
+            self.pending.update(affected)
+            if self.run is None:
+                self._start(settings)
+        self._flush(self._generation)
+
+    def _start(self, settings: DottedDict) -> None:
+        jobs = [(directory, ["."]) for directory in sorted(self.pending)]
+        self.pending.clear()
+        if not jobs:
+            return
+        workers = settings.get("watchWorkers") or max((os.cpu_count() or 2) // 2, 1)
+        durations = TestDurations(self.storage_path)
+
+        def on_done(_: GoTestRun) -> None:
+            durations.save()
+            with self._lock:
+                self.run = None
+                if self.pending:
+                    self._start(self.settings)
+
+        self.run = GoTestRun(
+            self.window,
+            go_test_env_vars(settings),
+            jobs,
+            output_limit=settings.get("testOutputLimit", 5000),
+            on_event=durations.record,
+            on_done=on_done,
+            panel_name=WATCH_PANEL_NAME,
+            workers=workers,
+        ).start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self.saved.clear()
+        with self._lock:
+            self.pending.clear()
+            if self.run is not None:
+                self.run.cancel()
+
+
+def is_watching(window: sublime.Window) -> bool:
+    return window.id() in _watchers
+
+
+def toggle_watch(window: sublime.Window, storage_path: str) -> bool:
+    if watcher := _watchers.pop(window.id(), None):
+        watcher.stop()
+        return False
+    _watchers[window.id()] = TestWatcher(window, storage_path)
+    return True
+
+
+class GoplsTestWatchListener(sublime_plugin.EventListener):
+    def on_post_save_async(self, view: sublime.View) -> None:
+        window = view.window()
+        if not window or not (watcher := _watchers.get(window.id())):
+            return
+        if (file_name := view.file_name()) and file_name.endswith(".go"):
+            watcher.on_save(file_name)
+
+    def on_pre_close_window(self, window: sublime.Window) -> None:
+        _settings.pop(window.id(), None)
+        if watcher := _watchers.pop(window.id(), None):
+            watcher.stop()
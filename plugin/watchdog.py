@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import subprocess
+import threading
+import time
+
+from LSP.plugin import DottedDict
+import sublime
+
+from .caches import MEGABYTE
+from .constants import SESSION_NAME
+from .types import GoplsProcessSample
+from .utils import get_startupinfo
+
+SAMPLE_INTERVAL_SECONDS = 10
+
+_watchdog: MemoryWatchdog | None = None
+_watchdog_lock = threading.Lock()
+
+
+def _proc_samples() -> list[GoplsProcessSample]:
+    """
+    Reads the gopls processes started by this plugin host from /proc. This is
+    a handful of small reads per process, so it is cheap enough to run often.
+    """
+    samples = []
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    ticks = os.sysconf("SC_CLK_TCK")
+    parent = os.getpid()
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = Path(entry.path, "stat").read_text()
+            # The command name is in parentheses and may contain spaces.
+            name = stat[stat.index("(") + 1 : stat.rindex(")")]
+            fields = stat[stat.rindex(")") + 2 :].split()
+            if int(fields[1]) != parent or not name.startswith("gopls"):
+                continue
+            rss_pages = int(Path(entry.path, "statm").read_text().split()[1])
+            cwd = os.readlink(os.path.join(entry.path, "cwd"))
+        except (OSError, ValueError, IndexError):
+            continue
+        samples.append(
+            GoplsProcessSample(
+                pid=int(entry.name),
+                cwd=cwd,
+                rss=rss_pages * page_size,
+                cpu_seconds=(int(fields[11]) + int(fields[12])) / ticks,
+            )
+        )
+    return samples
+
+
+def _lsof_cwds(pids: list[int]) -> dict[int, str]:
+    """
+    Returns the working directories of `pids` where there is no /proc to read
+    them from. `lsof -F` prints a `p<pid>` line for every process followed by
+    the fields of its files, of which `n<path>` is the name.
+    """
+    if not pids:
+        return {}
+    try:
+        # Exits non-zero if any of the processes is gone already, the others are still listed.
+        output = subprocess.run(
+            ["lsof", "-a", "-d", "cwd", "-p", ",".join(str(pid) for pid in pids), "-Fn"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            startupinfo=get_startupinfo(),
+        ).stdout
+    except OSError:
+        return {}
+    cwds = {}
+    pid = None
+    for line in output.splitlines():
+        if line.startswith("p") and line[1:].isdigit():
+            pid = int(line[1:])
+        elif line.startswith("n") and pid is not None:
+            cwds[pid] = line[1:]
+    return cwds
+
+
+def _ps_samples() -> list[GoplsProcessSample]:
+    try:
+        output = subprocess.check_output(
+            ["ps", "-A", "-o", "pid=,ppid=,rss=,time=,comm="],
+            universal_newlines=True,
+            startupinfo=get_startupinfo(),
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    samples = []
+    parent = os.getpid()
+    for line in output.splitlines():
+        fields = line.split(None, 4)
+        if len(fields) < 5 or int(fields[1]) != parent or not os.path.basename(fields[4]).startswith("gopls"):
+            continue
+        # `time` is [[dd-]hh:]mm:ss(.ss).
+        days, _, clock = fields[3].rpartition("-")
+        seconds = 0.0
+        for part in clock.split(":"):
+            seconds = seconds * 60 + float(part)
+        seconds += int(days or 0) * 86400
+        samples.append(GoplsProcessSample(pid=int(fields[0]), cwd="", rss=int(fields[2]) * 1024, cpu_seconds=seconds))
+    # Without the working directory the window of a process, and thereby its session, would be unknown.
+    cwds = _lsof_cwds([sample["pid"] for sample in samples])
+    for sample in samples:
+        sample["cwd"] = cwds.get(sample["pid"], "")
+    return samples
+
+
+def sample_gopls_processes() -> list[GoplsProcessSample]:
+    """
+    Returns the resident memory and consumed CPU time of every gopls process
+    that was started by this plugin host.
+    """
+    if sublime.platform() == "windows":
+        return []
+    if os.path.isdir("/proc/self"):
+        return _proc_samples()
+    return _ps_samples()
+
+
+def window_of(sample: GoplsProcessSample) -> sublime.Window | None:
+    """
+    Returns the window whose session runs the process of `sample`. Sessions
+    start gopls in their first workspace folder, so the working directory of
+    the process identifies the window.
+    """
+    for window in sublime.windows():
+        if sample["cwd"] and sample["cwd"] in window.folders():
+            return window
+    return None
+
+
+class MemoryWatchdog:
+    """
+    Samples the gopls processes every `SAMPLE_INTERVAL_SECONDS` and enforces
+    the `watchdogMemoryBudget` setting of the session of their window. A
+    process above the budget gets a warning first; if it is still above the
+    budget after `watchdogGracePeriod` seconds its session is restarted. Every
+    warning and restart is appended to `watchdog.log` in plugin storage.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.log_path = Path(storage_path, "watchdog.log")
+        self.over_budget_since: dict[int, float] = {}
+        self.cpu_seconds: dict[int, tuple[float, float]] = {}
+        # The settings of the latest session of every window, those of a process without a known window
+        # are the ones of the latest session overall.
+        self.settings: dict[int, DottedDict] = {}
+        self.latest_settings: DottedDict | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> MemoryWatchdog:
+        threading.Thread(target=self._run, name="gopls-watchdog", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def configure(self, window_id: int, settings: DottedDict) -> None:
+        self.settings[window_id] = settings
+        self.latest_settings = settings
+
+    def _run(self) -> None:
+        while not self._stopped.wait(SAMPLE_INTERVAL_SECONDS):
+            self.check()
+
+    def _limits(self, window: sublime.Window | None) -> tuple[int, float]:
+        """
+        Returns the budget in bytes and the grace period that apply to the
+        processes of `window`. A budget of 0 means there is none.
+        """
+        settings = self.settings.get(window.id()) if window is not None else self.latest_settings
+        if settings is None:
+            return (0, 0.0)
+        return ((settings.get("watchdogMemoryBudget") or 0) * MEGABYTE, settings.get("watchdogGracePeriod", 60))
+
+    def _cpu_percent(self, sample: GoplsProcessSample, now: float) -> float:
+        previous = self.cpu_seconds.get(sample["pid"])
+        self.cpu_seconds[sample["pid"]] = (now, sample["cpu_seconds"])
+        if previous is None or now <= previous[0]:
+            return 0.0
+        return (sample["cpu_seconds"] - previous[1]) / (now - previous[0]) * 100
+
+    def check(self) -> None:
+        now = time.time()
+        samples = sample_gopls_processes()
+        alive = {sample["pid"] for sample in samples}
+        for pid in list(self.over_budget_since):
+            if pid not in alive:
+                del self.over_budget_since[pid]
+        for pid in list(self.cpu_seconds):
+            if pid not in alive:
+                del self.cpu_seconds[pid]
+
+        for sample in samples:
+            cpu = self._cpu_percent(sample, now)
+            pid = sample["pid"]
+            window = window_of(sample)
+            budget, grace_period = self._limits(window)
+            if not budget or sample["rss"] <= budget:
+                self.over_budget_since.pop(pid, None)
+                continue
+            since = self.over_budget_since.setdefault(pid, now)
+            if since == now:
+                self._intervene("warn", sample, window, cpu, budget)
+            elif now - since >= grace_period:
+                del self.over_budget_since[pid]
+                self._intervene("restart", sample, window, cpu, budget)
+
+    def _intervene(
+        self,
+        action: str,
+        sample: GoplsProcessSample,
+        window: sublime.Window | None,
+        cpu: float,
+        budget: int,
+    ) -> None:
+        record = {
+            "time": time.time(),
+            "action": action,
+            "pid": sample["pid"],
+            "cwd": sample["cwd"],
+            "rss_mb": sample["rss"] // MEGABYTE,
+            "cpu_percent": round(cpu, 1),
+            "budget_mb": budget // MEGABYTE,
+            "restarted": action == "restart" and window is not None,
+        }
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a") as log:
+                log.write(json.dumps(record) + "\n")
+        except OSError as ex:
+            print(f"LSP-gopls: could not write {self.log_path}: {ex}")
+
+        message = f"gopls (pid {sample['pid']}) uses {record['rss_mb']} MB, the budget is {record['budget_mb']} MB"
+        if action == "restart" and window is None:
+            action = "restart skipped, no window with the workspace folder of the process"
+        print(f"LSP-gopls: watchdog: {message}, action: {action}")
+        if action == "warn":
+            sublime.set_timeout(lambda: (window or sublime.active_window()).status_message(
+                f"LSP-gopls: {message}, restarting if it stays above"
+            ))
+        elif window is not None:
+            sublime.set_timeout(lambda: window.run_command("lsp_restart_server", {"config_name": SESSION_NAME}))
+
+
+def start_watchdog(storage_path: str | Path, window_id: int, settings: DottedDict) -> None:
+    """
+    Hands the settings of a starting session to the watchdog. The watchdog is
+    started by the first session with a `watchdogMemoryBudget`, and sessions
+    without one keep their processes out of it.
+    """
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            if not settings.get("watchdogMemoryBudget"):
+                return
+            _watchdog = MemoryWatchdog(storage_path).start()
+        _watchdog.configure(window_id, settings)
+
+
+def stop_watchdog() -> None:
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is not None:
+            _watchdog.stop()
+            _watchdog = None
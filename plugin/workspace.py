@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from LSP.plugin import DottedDict
+
+from .durations import find_module
+from .types import GoWorkspaceScan
+from .types import GoWorkspaceTree
+
+# A directory tree without Go files is worth excluding once it holds this many files.
+HEAVY_TREE_FILES = 1000
+# Scanning stops after this many directories, so huge folders cannot stall the start.
+SCAN_DIRECTORY_LIMIT = 200_000
+SCAN_MAX_AGE_SECONDS = 24 * 60 * 60
+# A folder in a module with this many times its own packages is started without the rest of the module.
+MODULE_EXPANSION_RATIO = 2
+
+# Folders being scanned in the background.
+_scanning: set[str] = set()
+_scanning_lock = threading.Lock()
+
+
+def _ignored_by_go(name: str) -> bool:
+    # `go list ./...` and gopls skip these directories anyway.
+    return name.startswith((".", "_")) or name == "testdata"
+
+
+def filter_regex(directory_filter: str) -> re.Pattern:
+    """
+    Compiles the path prefix of a gopls directory filter, where `**` matches
+    any number of directories.
+    """
+    parts = [".*" if part == "**" else re.escape(part) for part in directory_filter[1:].strip("/").split("/")]
+    pattern = "/".join(parts).replace(".*/", "(?:.*/)?")
+    return re.compile(f"^{pattern}(?:/.*)?$" if pattern else "^.*$")
+
+
+def is_excluded(relative_path: str, directory_filters: list[str]) -> bool:
+    """
+    Returns whether `relative_path` is excluded by `directory_filters`, where
+    the last filter that matches wins, as in gopls.
+    """
+    excluded = False
+    for directory_filter in directory_filters:
+        if directory_filter[:1] in ("+", "-") and filter_regex(directory_filter).match(relative_path):
+            excluded = directory_filter[0] == "-"
+    return excluded
+
+
+def scan_folder(folder: str) -> GoWorkspaceScan:
+    """
+    Walks `folder` once and counts its Go modules and packages, and collects
+    the directory trees that contain many files but no Go code.
+    """
+    modules: list[str] = []
+    heavy: list[GoWorkspaceTree] = []
+    directories = 0
+
+    def scan(path: str, relative: str) -> tuple[int, int]:
+        nonlocal directories
+        directories += 1
+        files = packages = 0
+        has_go = False
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return 0, 0
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if _ignored_by_go(entry.name) or directories >= SCAN_DIRECTORY_LIMIT:
+                    continue
+                child = f"{relative}/{entry.name}" if relative else entry.name
+                child_files, child_packages = scan(entry.path, child)
+                files += child_files
+                packages += child_packages
+                if child_packages == 0 and child_files >= HEAVY_TREE_FILES:
+                    heavy.append(GoWorkspaceTree(path=child, files=child_files))
+            elif entry.is_file(follow_symlinks=False):
+                files += 1
+                if entry.name.endswith(".go"):
+                    has_go = True
+                elif entry.name == "go.mod":
+                    modules.append(relative or ".")
+        return files, packages + has_go
+
+    files, packages = scan(folder, "")
+    return GoWorkspaceScan(
+        folder=folder,
+        time=time.time(),
+        files=files,
+        packages=packages,
+        modules=sorted(modules),
+        heavy_trees=sorted(heavy, key=lambda tree: -tree["files"]),
+        truncated=directories >= SCAN_DIRECTORY_LIMIT,
+    )
+
+
+class WorkspaceScans:
+    """
+    The scans of workspace folders, cached as JSON in plugin storage for a day
+    or until the `go.mod` or `go.work` at the top of the folder changes.
+    """
+
+    def __init__(self, storage_path: str | Path) -> None:
+        self.root = Path(storage_path, "workspace-scans")
+
+    def _path(self, folder: str) -> Path:
+        return self.root / f"{hashlib.sha256(folder.encode('utf-8')).hexdigest()[:16]}.json"
+
+    @staticmethod
+    def _signature(folder: str) -> list[float]:
+        mtimes = []
+        for name in ("go.mod", "go.work"):
+            try:
+                mtimes.append(os.stat(os.path.join(folder, name)).st_mtime)
+            except OSError:
+                mtimes.append(0.0)
+        return mtimes
+
+    def cached(self, folder: str) -> GoWorkspaceScan | None:
+        """
+        Returns the cached scan of `folder` if it is still valid.
+        """
+        try:
+            cached = json.loads(self._path(folder).read_text())
+            is_recent = time.time() - cached["scan"]["time"] < SCAN_MAX_AGE_SECONDS
+            if cached["signature"] == self._signature(folder) and is_recent:
+                return cached["scan"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def get(self, folder: str, refresh: bool = False) -> GoWorkspaceScan:
+        if not refresh and (scan := self.cached(folder)) is not None:
+            return scan
+        signature = self._signature(folder)
+        scan = scan_folder(folder)
+        path = self._path(folder)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}")
+        tmp.write_text(json.dumps({"signature": signature, "scan": scan}))
+        os.replace(tmp, path)
+        return scan
+
+    def scan_in_background(self, folder: str) -> None:
+        """
+        Scans `folder` on a background thread and caches the result, unless a
+        scan of it is already running.
+        """
+        with _scanning_lock:
+            if folder in _scanning:
+                return
+            _scanning.add(folder)
+
+        def run() -> None:
+            try:
+                self.get(folder, refresh=True)
+            except OSError as ex:
+                print(f"LSP-gopls: could not scan {folder}: {ex}")
+            finally:
+                with _scanning_lock:
+                    _scanning.discard(folder)
+
+        threading.Thread(target=run, name="gopls-workspace-scan", daemon=True).start()
+
+
+def _trees_to_exclude(trees: list[GoWorkspaceTree], directory_filters: list[str]) -> list[tuple[str, int]]:
+    """
+    Returns the topmost trees without Go code that still hold many files once
+    the trees already excluded by `directory_filters` are left out, with the
+    number of files each of them would exclude.
+    """
+    excluded = [tree for tree in trees if is_excluded(tree["path"], directory_filters)]
+    # Only the topmost excluded trees count, nested ones are part of their files already.
+    excluded = [tree for tree in excluded if not any(tree["path"].startswith(f"{o['path']}/") for o in excluded)]
+    candidates = []
+    for tree in trees:
+        if is_excluded(tree["path"], directory_filters):
+            continue
+        files = tree["files"] - sum(e["files"] for e in excluded if e["path"].startswith(f"{tree['path']}/"))
+        if files >= HEAVY_TREE_FILES:
+            candidates.append((tree["path"], files))
+    return [
+        (path, files)
+        for path, files in candidates
+        if not any(path.startswith(f"{other}/") for other, _ in candidates)
+    ]
+
+
+def tune_folder(folder: str, settings: DottedDict, scans: WorkspaceScans, wait: bool = True) -> tuple[dict, str]:
+    """
+    Derives gopls settings for `folder` from its scan and returns them with a
+    report of what they are expected to save. Trees without Go code get an
+    exclusion filter, and a folder inside a much larger module is not expanded
+    to the whole module.
+
+    Unless `wait` is set, only cached scans are used and missing ones are
+    started in the background, so their suggestions apply from the next start.
+    """
+
+    def scan_of(path: str) -> GoWorkspaceScan | None:
+        if wait:
+            return scans.get(path)
+        if (cached := scans.cached(path)) is None:
+            scans.scan_in_background(path)
+        return cached
+
+    if (scan := scan_of(folder)) is None:
+        return {}, f"{folder}: not scanned yet, scanning in the background for the next start"
+    filters: list[str] = list(settings.get("gopls.directoryFilters") or [])
+    lines = [
+        f"{folder}: {scan['packages']} packages in {len(scan['modules'])} module(s), {scan['files']} files"
+        + (" (scan truncated)" if scan["truncated"] else ""),
+    ]
+    derived: dict = {}
+
+    new_trees = _trees_to_exclude(scan["heavy_trees"], filters)
+    if new_trees:
+        new_filters = [f"-{path}" for path, _ in new_trees]
+        derived["gopls.directoryFilters"] = filters + new_filters
+        skipped = sum(files for _, files in new_trees)
+        lines.append(f"  exclude {', '.join(new_filters)}: {skipped} files without Go code no longer walked or watched")
+
+    module = find_module(folder)
+    if module and os.path.normcase(module[0]) != os.path.normcase(folder):
+        module_scan = scan_of(module[0])
+        if module_scan is None:
+            lines.append(f"  {module[1]} not scanned yet, scanning it in the background for the next start")
+        elif module_scan["packages"] >= MODULE_EXPANSION_RATIO * max(scan["packages"], 1):
+            if settings.get("gopls.expandWorkspaceToModule") is not False:
+                derived["gopls.expandWorkspaceToModule"] = False
+            saved = module_scan["packages"] - scan["packages"]
+            lines.append(
+                f"  folder is part of {module[1]} with {module_scan['packages']} packages: not expanding the "
+                f"workspace to the module loads about {saved} fewer packages"
+            )
+    if len(lines) == 1:
+        lines.append("  no changes suggested")
+    return derived, "\n".join(lines)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+
+MODULE = "example.com/bench"
+GO_VERSION = "1.18"
+# Written next to the generated code, it tells the benchmark where to send its requests.
+TARGETS_FILE = "benchmark-targets.json"
+
+
+class WorkspaceGenerator:
+    """
+    Generates a Go module with `packages` packages of `files` files that each
+    declare a type and `functions` functions. Every package calls into the
+    previous one, so the import graph is a chain as deep as the module, and
+    into one of `deps` local dependency modules that are wired in through
+    `replace` directives. Nothing has to be downloaded, so the workspace loads
+    offline.
+    """
+
+    def __init__(self, root: Path, packages: int, files: int, functions: int, deps: int) -> None:
+        self.root = root
+        self.packages = max(packages, 1)
+        self.files = max(files, 1)
+        self.functions = max(functions, 1)
+        self.deps = max(deps, 0)
+
+    def parameters(self) -> dict:
+        return {"packages": self.packages, "files": self.files, "functions": self.functions, "deps": self.deps}
+
+    def generate(self) -> dict:
+        """
+        Writes the workspace and returns the positions the benchmark requests
+        completion, hover and references at, which are also written to
+        `benchmark-targets.json`.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        for dep in range(self.deps):
+            self._write(f"deps/dep{dep}/go.mod", f"module example.com/dep{dep}\n\ngo {GO_VERSION}\n")
+            self._write(f"deps/dep{dep}/dep.go", self._dep_source(dep))
+        requires = "".join(f"\texample.com/dep{dep} v0.0.0\n" for dep in range(self.deps))
+        replaces = "".join(f"replace example.com/dep{dep} => ./deps/dep{dep}\n" for dep in range(self.deps))
+        go_mod = f"module {MODULE}\n\ngo {GO_VERSION}\n"
+        if self.deps:
+            go_mod += f"\nrequire (\n{requires})\n\n{replaces}"
+        self._write("go.mod", go_mod)
+
+        targets: dict = {}
+        for package in range(self.packages):
+            for file in range(self.files):
+                source, positions = self._package_source(package, file)
+                path = f"pkg/p{package}/f{file}.go"
+                self._write(path, source)
+                if package == 0 and file == 0:
+                    targets["references"] = {"file": path, "position": positions["declaration"]}
+                if package == self.packages - 1 and file == 0:
+                    targets["completion"] = {"file": path, "position": positions["completion"]}
+                    targets["hover"] = {"file": path, "position": positions["hover"]}
+        last = self.packages - 1
+        self._write(
+            "cmd/bench/main.go",
+            f'package main\n\nimport (\n\t"fmt"\n\n\t"{MODULE}/pkg/p{last}"\n)\n\n'
+            f"func main() {{\n\tfmt.Println(p{last}.F0M0(1))\n}}\n",
+        )
+        targets["edit"] = targets["completion"]["file"]
+        targets["parameters"] = self.parameters()
+        self._write(TARGETS_FILE, json.dumps(targets, indent=2) + "\n")
+        return targets
+
+    def _write(self, relative: str, content: str) -> None:
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def _dep_source(self, dep: int) -> str:
+        lines = [f"// Package dep{dep} is a generated dependency module.", f"package dep{dep}", ""]
+        for function in range(self.functions):
+            lines.extend((
+                f"// D{function} is a generated function.",
+                f"func D{function}(x int) int {{",
+                f"\treturn x*{function + 2} + {dep}",
+                "}",
+                "",
+            ))
+        return "\n".join(lines)
+
+    def _package_source(self, package: int, file: int) -> tuple[str, dict]:
+        imports = []
+        if package > 0:
+            imports.append(f'\t"{MODULE}/pkg/p{package - 1}"')
+        if self.deps:
+            imports.append(f'\tdep "example.com/dep{package % self.deps}"')
+        lines = [f"// Package p{package} is generated.", f"package p{package}", ""]
+        if imports:
+            lines.extend(("import (", *imports, ")", ""))
+        lines.extend((
+            f"// T{file} is a generated type.",
+            f"type T{file} struct {{",
+            "\tName  string",
+            "\tCount int",
+            f"\tNext  *T{file}",
+            "}",
+            "",
+            "// Len returns the length of the list starting at t.",
+            f"func (t *T{file}) Len() int {{",
+            "\tn := 0",
+            "\tfor ; t != nil; t = t.Next {",
+            "\t\tn += t.Count",
+            "\t}",
+            "\treturn n",
+            "}",
+            "",
+        ))
+        positions: dict = {}
+        for function in range(self.functions):
+            name = f"F{file}M{function}"
+            if package > 0:
+                call = f"p{package - 1}.{name}(x)"
+            elif self.deps:
+                call = f"dep.D{function}(x)"
+            else:
+                call = f"x * {function + 2}"
+            if self.deps and package > 0:
+                call += f" + dep.D{function}(x)"
+            lines.extend((f"// {name} is a generated function.", f"func {name}(x int) int {{"))
+            if function == 0:
+                positions["declaration"] = [len(lines) - 1, len("func ")]
+                if package > 0 or self.deps:
+                    # Completion after the package qualifier, hover on the function it calls.
+                    qualifier = f"p{package - 1}." if package > 0 else "dep."
+                    column = len("\treturn ") + len(qualifier)
+                    positions["completion"] = [len(lines), column]
+                    positions["hover"] = [len(lines), column + 1]
+                else:
+                    positions["completion"] = [len(lines), len("\treturn ")]
+                    positions["hover"] = [len(lines) - 1, len("func ")]
+            lines.extend((f"\treturn {call} + {file}", "}", ""))
+        return "\n".join(lines), positions
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--packages", type=int, default=50, help="number of packages (default: 50)")
+    parser.add_argument("--files", type=int, default=10, help="files per package (default: 10)")
+    parser.add_argument("--functions", type=int, default=20, help="functions per file (default: 20)")
+    parser.add_argument("--deps", type=int, default=5, help="local dependency modules (default: 5)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Go workspace to benchmark gopls with.")
+    parser.add_argument("directory", type=Path)
+    add_arguments(parser)
+    args = parser.parse_args()
+    generator = WorkspaceGenerator(args.directory, args.packages, args.files, args.functions, args.deps)
+    generator.generate()
+    print(f"Generated {args.packages * args.files} files in {args.packages} packages in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any
+from typing import Callable
+import json
+import os
+import subprocess
+import threading
+import time
+
+
+class LspError(Exception):
+    pass
+
+
+class LspClient:
+    """
+    A minimal LSP client that talks to a language server over stdio. It
+    answers the requests the server sends the way Sublime Text's LSP package
+    does for gopls: `workspace/configuration` with the settings of the
+    `gopls` section and everything else with `null`.
+    """
+
+    def __init__(self, argv: list[str], cwd: str | Path, env: dict[str, str], settings: dict) -> None:
+        self.settings = settings
+        self.process = subprocess.Popen(
+            argv,
+            cwd=str(cwd),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._next_id = 0
+        self._responses: dict[int, dict] = {}
+        self._notifications: list[dict] = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name="lsp-reader", daemon=True)
+        self._reader.start()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def _send(self, message: dict) -> None:
+        message["jsonrpc"] = "2.0"
+        body = json.dumps(message).encode("utf-8")
+        assert self.process.stdin is not None
+        with self._write_lock:
+            self.process.stdin.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+            self.process.stdin.flush()
+
+    def _read(self) -> None:
+        stdout = self.process.stdout
+        assert stdout is not None
+        while True:
+            length = 0
+            while line := stdout.readline():
+                if not line.strip():
+                    break
+                name, _, value = line.decode("ascii").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            if not line or not length:
+                break
+            message = json.loads(stdout.read(length))
+            if "method" in message and "id" in message:
+                self._answer(message)
+                continue
+            with self._condition:
+                if "method" in message:
+                    self._notifications.append(message)
+                else:
+                    self._responses[message["id"]] = message
+                self._condition.notify_all()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _answer(self, request: dict) -> None:
+        result: Any = None
+        if request["method"] == "workspace/configuration":
+            result = [
+                self.settings if item.get("section") == "gopls" else None
+                for item in request.get("params", {}).get("items", [])
+            ]
+        self._send({"id": request["id"], "result": result})
+
+    def notify(self, method: str, params: Any) -> None:
+        self._send({"method": method, "params": params})
+
+    def request(self, method: str, params: Any, timeout: float) -> tuple[Any, float]:
+        """
+        Sends a request and returns its result and how long the server took to
+        answer, in seconds.
+        """
+        with self._condition:
+            self._next_id += 1
+            request_id = self._next_id
+        started = time.perf_counter()
+        self._send({"id": request_id, "method": method, "params": params})
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: request_id in self._responses or self.process.poll() is not None, timeout
+            ):
+                raise LspError(f"{method} timed out after {timeout}s")
+            response = self._responses.pop(request_id, None)
+        elapsed = time.perf_counter() - started
+        if response is None:
+            raise LspError(f"the server exited while waiting for {method}")
+        if "error" in response:
+            raise LspError(f"{method} failed: {response['error'].get('message')}")
+        return response.get("result"), elapsed
+
+    def wait_for_notification(self, predicate: Callable[[dict], bool], timeout: float, start: int = 0) -> int:
+        """
+        Waits for a notification from the server that matches `predicate`,
+        looking at the notifications received from index `start` on, and
+        returns the index after it to continue waiting from.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                for index in range(start, len(self._notifications)):
+                    if predicate(self._notifications[index]):
+                        return index + 1
+                start = len(self._notifications)
+                if self.process.poll() is not None:
+                    raise LspError("the server exited while waiting for a notification")
+                if (remaining := deadline - time.monotonic()) <= 0:
+                    raise LspError(f"no matching notification within {timeout}s")
+                self._condition.wait(remaining)
+
+    def notification_count(self) -> int:
+        with self._condition:
+            return len(self._notifications)
+
+    def shutdown(self, timeout: float = 10) -> None:
+        try:
+            self.request("shutdown", None, timeout)
+            self.notify("exit", None)
+            self.process.wait(timeout)
+        except (LspError, OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+def peak_rss(pid: int) -> int | None:
+    """
+    Returns the peak resident memory of a running process in bytes, where the
+    operating system keeps track of it.
+    """
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss(pid: int) -> int | None:
+    if os.name == "nt":
+        return None
+    try:
+        output = subprocess.check_output(["ps", "-o", "rss=", "-p", str(pid)], universal_newlines=True)
+        return int(output.strip()) * 1024
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+class MemorySampler:
+    """
+    Follows the resident memory of a process and keeps its peak. Where the
+    kernel keeps a high-water mark it is read once at the end, elsewhere the
+    process is sampled every `interval` seconds.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.1) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stopped = threading.Event()
+        if peak_rss(pid) is None:
+            threading.Thread(target=self._run, name="rss-sampler", daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if (rss := current_rss(self.pid)) is not None:
+                self.peak = max(self.peak, rss)
+
+    def stop(self) -> int:
+        """
+        Stops sampling and returns the peak resident memory in bytes.
+        """
+        if (high_water_mark := peak_rss(self.pid)) is not None:
+            self.peak = max(self.peak, high_water_mark)
+        self._stopped.set()
+        return self.peak
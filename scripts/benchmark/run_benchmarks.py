@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import operator
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_workspace import TARGETS_FILE
+from generate_workspace import WorkspaceGenerator
+from generate_workspace import add_arguments
+from lsp_client import LspClient
+from lsp_client import LspError
+from lsp_client import MemorySampler
+
+PACKAGE_PATH = Path(__file__).resolve().parent.parent.parent
+# The line that makes the edited file fail to type check.
+BROKEN_LINE = '\nvar _ int = "benchmark"\n'
+MEGABYTE = 1024 * 1024
+
+
+def sublime_directories() -> tuple[Path, Path]:
+    """
+    Returns the default `Packages/User` directory and the LSP-gopls package
+    storage of Sublime Text on this platform.
+    """
+    home = Path.home()
+    if sys.platform == "darwin":
+        data = home / "Library" / "Application Support" / "Sublime Text"
+        cache = home / "Library" / "Caches" / "Sublime Text"
+    elif os.name == "nt":
+        data = Path(os.environ.get("APPDATA", home)) / "Sublime Text"
+        cache = Path(os.environ.get("LOCALAPPDATA", home)) / "Sublime Text"
+    else:
+        data = home / ".config" / "sublime-text"
+        cache = home / ".cache" / "sublime-text"
+    return data / "Packages" / "User", cache / "Package Storage" / "LSP-gopls"
+
+
+def load_sublime_settings(path: Path) -> dict:
+    """
+    Reads a `.sublime-settings` file, which is JSON with comments and
+    trailing commas.
+    """
+    text = path.read_text()
+    stripped = []
+    index = 0
+    in_string = False
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            stripped.append(char)
+            if char == "\\":
+                stripped.append(text[index + 1 : index + 2])
+                index += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            stripped.append(char)
+        elif text.startswith("//", index):
+            index = text.find("\n", index)
+            if index < 0:
+                break
+            continue
+        elif text.startswith("/*", index):
+            index = text.find("*/", index) + 2
+            if index < 2:
+                break
+            continue
+        else:
+            stripped.append(char)
+        index += 1
+    return json.loads(re.sub(r",(\s*[}\]])", r"\1", "".join(stripped)))
+
+
+def plugin_settings(user_settings: Path | None) -> dict:
+    """
+    Returns the `settings` of LSP-gopls: the defaults of the package with the
+    user's settings on top, the way Sublime Text merges them.
+    """
+    settings = load_sublime_settings(PACKAGE_PATH / "LSP-gopls.sublime-settings").get("settings", {})
+    if user_settings is not None and user_settings.is_file():
+        settings.update(load_sublime_settings(user_settings).get("settings", {}))
+    return settings
+
+
+def resolve_gopls(explicit: str | None, storage: Path) -> tuple[str, str]:
+    """
+    Returns the gopls binary to benchmark and where it was found: the one
+    given on the command line, the binary managed by LSP-gopls or the one on
+    $PATH.
+    """
+    if explicit:
+        return explicit, "command line"
+    binary = "gopls.exe" if os.name == "nt" else "gopls"
+    try:
+        version = (storage / "VERSION").read_text().strip()
+    except OSError:
+        version = ""
+    if version and (managed := storage / "bin" / version / binary).is_file():
+        return str(managed), "managed by LSP-gopls"
+    if path := shutil.which("gopls"):
+        return path, "$PATH"
+    raise SystemExit("No gopls binary found, install one or pass --gopls")
+
+
+def command_output(argv: list[str]) -> str:
+    try:
+        return subprocess.check_output(
+            argv, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT, universal_newlines=True, timeout=30
+        ).strip()
+    except (OSError, subprocess.SubprocessError) as ex:
+        return f"unknown ({ex})"
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "samples": samples,
+    }
+
+
+class BenchmarkSession:
+    """
+    One start of gopls on the workspace, timing `initialize`, the workspace
+    load and `runs` rounds of completion, hover, references and diagnostics
+    after an edit. Durations are in seconds.
+    """
+
+    def __init__(self, binary: str, workspace: Path, targets: dict, settings: dict, runs: int, timeout: float) -> None:
+        self.binary = binary
+        self.workspace = workspace
+        self.targets = targets
+        self.settings = settings
+        self.runs = runs
+        self.timeout = timeout
+        self.timings: dict[str, list[float]] = {}
+        self.counts: dict[str, int] = {}
+
+    def _record(self, name: str, elapsed: float) -> None:
+        self.timings.setdefault(name, []).append(elapsed)
+
+    def _uri(self, relative: str) -> str:
+        return (self.workspace / relative).as_uri()
+
+    def _environment(self) -> dict[str, str]:
+        env = dict(os.environ)
+        # Everything the generated workspace needs is local, nothing may be downloaded.
+        env["GOPROXY"] = "off"
+        env["GOFLAGS"] = "-mod=mod"
+        if limit := self.settings.get("memoryLimit"):
+            env["GOMEMLIMIT"] = f"{limit}MiB"
+        return env
+
+    def run(self) -> int:
+        """
+        Runs the session and returns the peak resident memory of gopls in
+        bytes.
+        """
+        # LSP answers `workspace/configuration` for the `gopls` section with the `gopls.*` settings.
+        gopls_settings = {key[6:]: value for key, value in self.settings.items() if key.startswith("gopls.")}
+        client = LspClient([self.binary], self.workspace, self._environment(), gopls_settings)
+        sampler = MemorySampler(client.pid)
+        try:
+            self._initialize(client)
+            self._open(client)
+            for _ in range(self.runs):
+                self._position_requests(client)
+                self._diagnostics_after_edit(client)
+            return sampler.stop()
+        finally:
+            sampler.stop()
+            client.shutdown()
+
+    def _initialize(self, client: LspClient) -> None:
+        root = self.workspace.as_uri()
+        capabilities = {
+            "workspace": {"configuration": True, "workspaceFolders": True},
+            "window": {"workDoneProgress": True},
+            "textDocument": {
+                "completion": {"completionItem": {"snippetSupport": True}},
+                "hover": {"contentFormat": ["markdown", "plaintext"]},
+                "publishDiagnostics": {"versionSupport": True},
+            },
+        }
+        params = {
+            "processId": os.getpid(),
+            "rootUri": root,
+            "workspaceFolders": [{"uri": root, "name": self.workspace.name}],
+            "capabilities": capabilities,
+        }
+        _, elapsed = client.request("initialize", params, self.timeout)
+        self._record("initialize", elapsed)
+        started = time.perf_counter()
+        start = client.notification_count()
+        client.notify("initialized", {})
+        # gopls reports loading the workspace as the first progress it begins.
+        tokens = []
+
+        def is_begin(message: dict) -> bool:
+            if message["method"] == "$/progress" and message["params"]["value"].get("kind") == "begin":
+                tokens.append(message["params"]["token"])
+                return True
+            return False
+
+        start = client.wait_for_notification(is_begin, self.timeout, start)
+        client.wait_for_notification(
+            lambda message: message["method"] == "$/progress"
+            and message["params"]["token"] == tokens[0]
+            and message["params"]["value"].get("kind") == "end",
+            self.timeout,
+            start,
+        )
+        self._record("workspace_load", time.perf_counter() - started)
+
+    def _open(self, client: LspClient) -> None:
+        path = self.targets["edit"]
+        self.text = (self.workspace / path).read_text()
+        self.version = 1
+        start = client.notification_count()
+        started = time.perf_counter()
+        client.notify(
+            "textDocument/didOpen",
+            {"textDocument": {"uri": self._uri(path), "languageId": "go", "version": 1, "text": self.text}},
+        )
+        self._wait_for_diagnostics(client, start, lambda diagnostics: True)
+        self._record("diagnostics_on_open", time.perf_counter() - started)
+
+    def _wait_for_diagnostics(self, client: LspClient, start: int, accept) -> None:
+        uri = self._uri(self.targets["edit"])
+
+        def matches(message: dict) -> bool:
+            if message["method"] != "textDocument/publishDiagnostics" or message["params"]["uri"] != uri:
+                return False
+            version = message["params"].get("version")
+            return (version is None or version == self.version) and accept(message["params"]["diagnostics"])
+
+        client.wait_for_notification(matches, self.timeout, start)
+
+    def _position_requests(self, client: LspClient) -> None:
+        for name, method, extra in (
+            ("completion", "textDocument/completion", {}),
+            ("hover", "textDocument/hover", {}),
+            ("references", "textDocument/references", {"context": {"includeDeclaration": True}}),
+        ):
+            target = self.targets[name]
+            line, character = target["position"]
+            params = {
+                "textDocument": {"uri": self._uri(target["file"])},
+                "position": {"line": line, "character": character},
+                **extra,
+            }
+            result, elapsed = client.request(method, params, self.timeout)
+            self._record(name, elapsed)
+            if isinstance(result, dict):
+                result = result.get("items", [result])
+            self.counts[name] = len(result or [])
+
+    def _change(self, client: LspClient, text: str) -> int:
+        self.version += 1
+        start = client.notification_count()
+        client.notify(
+            "textDocument/didChange",
+            {
+                "textDocument": {"uri": self._uri(self.targets["edit"]), "version": self.version},
+                "contentChanges": [{"text": text}],
+            },
+        )
+        return start
+
+    def _diagnostics_after_edit(self, client: LspClient) -> None:
+        started = time.perf_counter()
+        start = self._change(client, self.text + BROKEN_LINE)
+        self._wait_for_diagnostics(client, start, lambda diagnostics: bool(diagnostics))
+        self._record("diagnostics_after_edit", time.perf_counter() - started)
+        # Wait for the fix to be checked as well, so the next round starts from a clean state.
+        start = self._change(client, self.text)
+        self._wait_for_diagnostics(client, start, operator.not_)
+
+
+def run(args: argparse.Namespace) -> dict:
+    user_directory, storage = sublime_directories()
+    user_settings = args.user_settings or user_directory / "LSP-gopls.sublime-settings"
+    if args.no_user_settings:
+        user_settings = None
+    settings = plugin_settings(user_settings)
+    binary, source = resolve_gopls(args.gopls, args.storage or storage)
+
+    with tempfile.TemporaryDirectory(prefix="gopls-benchmark-") as tmp:
+        workspace = args.workspace or Path(tmp)
+        if not (workspace / TARGETS_FILE).is_file():
+            if workspace.is_dir() and any(workspace.iterdir()):
+                raise SystemExit(f"{workspace} is not a generated workspace and not empty")
+            generator = WorkspaceGenerator(workspace, args.packages, args.files, args.functions, args.deps)
+            print(f"Generating a workspace with {args.packages} packages in {workspace}")
+            generator.generate()
+        targets = json.loads((workspace / TARGETS_FILE).read_text())
+
+        timings: dict[str, list[float]] = {}
+        peaks = []
+        counts: dict[str, int] = {}
+        for start in range(args.starts):
+            print(f"Start {start + 1} of {args.starts}: {binary}")
+            session = BenchmarkSession(binary, workspace.resolve(), targets, settings, args.runs, args.timeout)
+            try:
+                peaks.append(session.run())
+            except LspError as ex:
+                raise SystemExit(f"Benchmark failed: {ex}") from ex
+            for name, samples in session.timings.items():
+                timings.setdefault(name, []).extend(samples)
+            counts = session.counts
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "gopls": {"binary": binary, "source": source, "version": command_output([binary, "version"])},
+        "go": command_output(["go", "version"]),
+        "platform": platform.platform(),
+        "workspace": targets["parameters"],
+        "settings": {key: value for key, value in settings.items() if key.startswith("gopls.") or key == "memoryLimit"},
+        "starts": args.starts,
+        "runs": args.runs,
+        "timings": {name: summarize(samples) for name, samples in timings.items()},
+        "results": counts,
+        "memory": {"peak_rss_mb": round(max(peaks) / MEGABYTE, 1) if any(peaks) else None},
+    }
+
+
+def compare(base_path: Path, other_path: Path) -> str:
+    base = json.loads(base_path.read_text())
+    other = json.loads(other_path.read_text())
+    lines = [
+        f"base:  {base['gopls']['version'].splitlines()[0]} ({base_path})",
+        f"other: {other['gopls']['version'].splitlines()[0]} ({other_path})",
+        "",
+        f"{'metric':<24}{'base':>12}{'other':>12}{'change':>10}",
+    ]
+    for name in base["timings"]:
+        if name not in other["timings"]:
+            continue
+        old = base["timings"][name]["median"] * 1000
+        new = other["timings"][name]["median"] * 1000
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        lines.append(f"{name:<24}{old:>10.1f}ms{new:>10.1f}ms{change:>10}")
+    old_peak, new_peak = base["memory"]["peak_rss_mb"], other["memory"]["peak_rss_mb"]
+    if old_peak and new_peak:
+        change = f"{(new_peak - old_peak) / old_peak * 100:+.1f}%"
+        lines.append(f"{'peak_rss':<24}{old_peak:>10.1f}MB{new_peak:>10.1f}MB{change:>10}")
+    if base["workspace"] != other["workspace"] or base["settings"] != other["settings"]:
+        lines.extend(("", "note: the runs used different workspaces or settings"))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the latency and memory use of gopls on a synthetic workspace, offline."
+    )
+    parser.add_argument("--gopls", help="gopls binary (default: the one managed by LSP-gopls, then $PATH)")
+    parser.add_argument("--storage", type=Path, help="LSP-gopls package storage to find the managed gopls in")
+    parser.add_argument("--user-settings", type=Path, help="user LSP-gopls.sublime-settings to apply")
+    parser.add_argument("--no-user-settings", action="store_true", help="only use the package's default settings")
+    parser.add_argument("--workspace", type=Path, help="workspace to use, generated there if it has no targets")
+    parser.add_argument("--starts", type=int, default=3, help="times gopls is started (default: 3)")
+    parser.add_argument("--runs", type=int, default=10, help="rounds of requests per start (default: 10)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for any answer (default: 300)")
+    parser.add_argument("--output", type=Path, help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASE", "OTHER"), help="compare two result files")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare))
+        return
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        args.output.write_text(results + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -107,6 +107,289 @@ CUSTOM_PROPERTIES = {
         "markdownDescription": "Controls if the test results output to a panel instead of a tab.",
         "type": "boolean",
     },
+    "installTimeout": {
+        "default": 600,
+        "markdownDescription": (
+            "Maximum number of seconds the managed gopls installation may run before it is\n"
+            "cancelled. Set to `0` to disable the timeout."
+        ),
+        "type": "number",
+    },
+    "installRetention": {
+        "default": 1,
+        "markdownDescription": (
+            "Number of previously installed gopls versions to keep next to the current one\n"
+            "when LSP-gopls manages the gopls binary. Older versions are removed once a\n"
+            "newer version becomes current."
+        ),
+        "type": "number",
+    },
+    "artifactCacheSeeds": {
+        "default": [],
+        "markdownDescription": (
+            "Additional directories to look up prebuilt gopls binaries in before building\n"
+            "gopls from source. They use the same layout as the `artifacts` directory in\n"
+            "the LSP-gopls package storage, so a team can share a pre-populated cache.\n"
+            "Binaries are verified against their recorded checksum before use."
+        ),
+        "type": "array",
+    },
+    "installProxy": {
+        "default": "",
+        "markdownDescription": (
+            "Local module proxy used to install gopls without network access. Either a\n"
+            "directory created with `LSP-gopls: Prepare Offline Install Bundle`, a\n"
+            "directory laid out like a GOPROXY or a `file://` URL to one. Bundles are\n"
+            "verified against their checksum manifest before use. Leave empty to use the\n"
+            "regular module proxy."
+        ),
+        "type": "string",
+    },
+    "cacheSizeLimit": {
+        "default": 4096,
+        "markdownDescription": (
+            "Size budget in megabytes for the Go build and module caches that LSP-gopls\n"
+            "keeps in its package storage. The least recently used entries are evicted when\n"
+            "the budget is exceeded. Set to `0` to let the caches grow without bound."
+        ),
+        "type": "number",
+    },
+    "shareGoCaches": {
+        "default": False,
+        "markdownDescription": (
+            "Controls if installs of gopls use the GOCACHE and GOMODCACHE of your Go\n"
+            "toolchain instead of caches private to LSP-gopls, so already built packages\n"
+            "are reused. Shared caches are never trimmed by LSP-gopls."
+        ),
+        "type": "boolean",
+    },
+    "testPackageParallelism": {
+        "default": 0,
+        "markdownDescription": (
+            "Number of packages `go test` may build and test in parallel when running\n"
+            "tests, passed as `-p`. Set to `0` to use the default of `go test`."
+        ),
+        "type": "number",
+    },
+    "testParallelism": {
+        "default": 0,
+        "markdownDescription": (
+            "Maximum number of tests that call `t.Parallel` to run at once within a test\n"
+            "binary, passed as `-parallel`. Set to `0` to use the default of `go test`."
+        ),
+        "type": "number",
+    },
+    "benchmarkCount": {
+        "default": 6,
+        "markdownDescription": (
+            "Number of times each benchmark is run when running benchmarks, passed as\n"
+            "`-count`. More runs make the comparison with earlier runs more reliable."
+        ),
+        "type": "number",
+    },
+    "benchmarkTime": {
+        "default": "",
+        "markdownDescription": (
+            "Run time or iteration count of each benchmark run, passed as `-benchtime`, for\n"
+            "example `2s` or `1000x`. Leave empty to use the default of `go test`."
+        ),
+        "type": "string",
+    },
+    "benchmarkAlpha": {
+        "default": 0.05,
+        "markdownDescription": (
+            "Significance level at which a difference to the previous run or the pinned\n"
+            "baseline of a benchmark is reported as a change. Differences with a higher\n"
+            "p-value are shown as `~`."
+        ),
+        "type": "number",
+    },
+    "testRunner": {
+        "default": "auto",
+        "markdownDescription": (
+            "Controls how the tests of a `run test` code lens are run. `auto` uses Terminus\n"
+            "if it is installed and the built-in runner otherwise, `terminus` always uses\n"
+            "Terminus and `builtin` always streams the results of `go test -json` into an\n"
+            "output panel."
+        ),
+        "type": "string",
+        "enum": [
+            "auto",
+            "terminus",
+            "builtin"
+        ],
+    },
+    "testOutputLimit": {
+        "default": 5000,
+        "markdownDescription": (
+            "Maximum number of lines of test output the built-in test runner shows. Once\n"
+            "the limit is reached, only results and failures are added to the panel."
+        ),
+        "type": "number",
+    },
+    "watchWorkers": {
+        "default": 0,
+        "markdownDescription": (
+            "Maximum number of packages test watch mode tests at once after a save. Set to\n"
+            "`0` to use half of the available CPU cores."
+        ),
+        "type": "number",
+    },
+    "profileTopCount": {
+        "default": 20,
+        "markdownDescription": (
+            "Number of functions listed in the CPU and memory profile summaries of\n"
+            "`LSP-gopls: Profile Benchmarks of Current Package` and `LSP-gopls: Profile\n"
+            "Tests of Current Package`."
+        ),
+        "type": "integer",
+    },
+    "profileRegressions": {
+        "default": False,
+        "markdownDescription": (
+            "Whether to capture CPU and memory profiles of benchmarks that regressed in a\n"
+            "run started from the `run benchmark` code lens. The hottest lines of the\n"
+            "profiles are annotated in the editor."
+        ),
+        "type": "boolean",
+    },
+    "metricsInterval": {
+        "default": 2,
+        "markdownDescription": (
+            "Seconds between two samples of the metrics dashboard opened with `LSP-gopls:\n"
+            "Show Metrics Dashboard`."
+        ),
+        "type": "number",
+    },
+    "metricsHistory": {
+        "default": 600,
+        "markdownDescription": "Number of samples the metrics dashboard keeps. Older samples are dropped.",
+        "type": "integer",
+    },
+    "memoryLimit": {
+        "default": 0,
+        "markdownDescription": (
+            "Soft memory limit of gopls in MB, passed as `GOMEMLIMIT`. The Go garbage\n"
+            "collector runs more often as gopls gets close to it. Set it somewhat below\n"
+            "`watchdogMemoryBudget`. `0` leaves the limit unset."
+        ),
+        "type": "integer",
+    },
+    "watchdogMemoryBudget": {
+        "default": 0,
+        "markdownDescription": (
+            "Resident memory budget of a gopls process in MB. When a gopls process exceeds\n"
+            "it, a warning is shown. If it is still above the budget after\n"
+            "`watchdogGracePeriod` seconds, its session is restarted. Every intervention is\n"
+            "logged to `watchdog.log` in the plugin storage. `0` disables the watchdog."
+        ),
+        "type": "integer",
+    },
+    "watchdogGracePeriod": {
+        "default": 60,
+        "markdownDescription": (
+            "Seconds a gopls process may stay above `watchdogMemoryBudget` after the\n"
+            "warning before its session is restarted."
+        ),
+        "type": "number",
+    },
+    "sharedDaemon": {
+        "default": False,
+        "markdownDescription": (
+            "Whether all windows share a single gopls daemon, started with\n"
+            "`-remote=auto;lsp-gopls`. Each session then runs a lightweight forwarder, so\n"
+            "the module cache and the standard library are loaded once instead of once per\n"
+            "window. The daemon is health-checked and restarted if it stops answering. The\n"
+            "daemon inherits `memoryLimit` from the first session that starts it, but\n"
+            "`watchdogMemoryBudget` only covers the forwarders. Not supported on Windows,\n"
+            "where sessions are always started without the daemon."
+        ),
+        "type": "boolean",
+    },
+    "sharedDaemonIdleTimeout": {
+        "default": 60,
+        "markdownDescription": (
+            "Seconds the shared gopls daemon keeps running after the last window\n"
+            "disconnected from it."
+        ),
+        "type": "integer",
+    },
+    "hibernateAfter": {
+        "default": 0,
+        "markdownDescription": (
+            "Minutes without activity in the Go views of a window after which its gopls\n"
+            "session is shut down to release memory. The session starts again on the next\n"
+            "activation or edit of a Go view. The released memory and the time gopls takes\n"
+            "to warm up again are logged to `hibernation.log` in the plugin storage. `0`\n"
+            "disables hibernation. Only supported on Linux, as the gopls process of a\n"
+            "window is found through `/proc` by its working directory, which has to be a\n"
+            "folder of the window. Windows without folders are never hibernated."
+        ),
+        "type": "integer",
+    },
+    "workspaceTuning": {
+        "default": "off",
+        "markdownDescription": (
+            "Whether to scan the workspace folders when gopls starts and derive settings\n"
+            "from them. The scan runs in the background and is cached in the plugin\n"
+            "storage, so the settings derived from a new scan apply from the next start.\n"
+            "Directory trees with many files but no Go code get a `gopls.directoryFilters`\n"
+            "entry. A folder inside a much larger module gets\n"
+            "`gopls.expandWorkspaceToModule` turned off. `report` only prints the\n"
+            "suggestions to the console, `apply` also uses them for the session.\n"
+            "`LSP-gopls: Workspace Report` shows them with the expected savings."
+        ),
+        "type": "string",
+        "enum": [
+            "off",
+            "report",
+            "apply"
+        ],
+    },
+    "rpcTrace": {
+        "default": False,
+        "markdownDescription": (
+            "Whether to start gopls with `-rpc.trace`, which logs every LSP message to a\n"
+            "file in the plugin storage. Only the newest traces are kept. `LSP-gopls:\n"
+            "Analyze RPC Trace` reports per-method latencies from them. `LSP-gopls: Toggle\n"
+            "RPC Trace` switches tracing until Sublime Text restarts."
+        ),
+        "type": "boolean",
+    },
+    "prewarmWorkspace": {
+        "default": False,
+        "markdownDescription": (
+            "When a session starts, downloads the modules of every workspace folder and\n"
+            "compiles their dependencies in the background (`go mod download` and `go list\n"
+            "-deps -export ./...`) with the environment and build flags of gopls, so the\n"
+            "first completion or hover does not wait for them. Runs at low priority, one\n"
+            "folder at a time, and can be stopped with `LSP-gopls: Cancel Workspace\n"
+            "Pre-warming`."
+        ),
+        "type": "boolean",
+    },
+    "pgoProfiling": {
+        "default": False,
+        "markdownDescription": (
+            "Whether to record a 30 second CPU profile of gopls through its debug server at\n"
+            "most every 10 minutes while Go files are being edited. The newest 50 profiles\n"
+            "are kept in the plugin storage and merged by `LSP-gopls: Build Profile-Guided\n"
+            "gopls` into a profile-guided (PGO) build of gopls, which needs Go 1.21 or\n"
+            "newer."
+        ),
+        "type": "boolean",
+    },
+    "pgoBinary": {
+        "default": False,
+        "markdownDescription": (
+            "Whether to start the profile-guided build of gopls instead of the plain one\n"
+            "when LSP-gopls manages the gopls binary. The plain build is kept, so\n"
+            "`LSP-gopls: Toggle Profile-Guided gopls` switches between them for comparison\n"
+            "or roll back until Sublime Text restarts. Falls back to the plain build if\n"
+            "there is no profile-guided build of the current version."
+        ),
+        "type": "boolean",
+    },
 }
 
 BEGIN_LSP_GOPLS_SETTINGS = """// Packages/User/LSP-gopls.sublime-settings